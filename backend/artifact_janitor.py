@@ -0,0 +1,189 @@
+import os
+import time
+import shutil
+import logging
+import tempfile
+import threading
+
+# Child of the backend logger, so messages end up in backend.log
+logger = logging.getLogger('backend.artifact_janitor')
+
+# Prefix of the temporary workspaces created by the analysis pipeline, so
+# orphaned ones can be told apart from other programs' temp dirs
+TEMP_PREFIX = "beatjob_"
+
+def make_temp_workspace():
+    """Create a temporary workspace the janitor can recognize and clean up"""
+    return tempfile.mkdtemp(prefix=TEMP_PREFIX)
+
+def directory_size(path):
+    """Total size in bytes of all files below a directory"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+class ArtifactJanitor:
+    """
+    Keeps the per-video artifact directories within a disk budget.
+
+    Every video owns a directory named after its ID in each artifact root
+    (static/ and videos/). Access times are tracked per video, updated by the
+    media endpoints and persisted as the directory mtime so they survive a
+    restart. When the total exceeds the budget, the least recently used
+    videos are evicted as a whole. load() seeds the access times from disk;
+    the janitor ignores videos it does not know until then.
+    """
+
+    def __init__(self, roots, budget_bytes, temp_max_age=6 * 3600, on_evict=None):
+        """
+        Args:
+            roots: Artifact root directories holding one subdirectory per video
+            budget_bytes: Disk budget for all roots together
+            temp_max_age: Seconds after which an unused temp workspace counts as orphaned
+            on_evict: Optional callback called with the video ID of every evicted video
+        """
+        self.roots = list(roots)
+        self.budget_bytes = budget_bytes
+        self.temp_max_age = temp_max_age
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        self._access_times = {}
+
+    def _video_dirs(self, video_id):
+        return [os.path.join(root, video_id) for root in self.roots]
+
+    def load(self):
+        """Seed access times from the directory mtimes left by previous runs"""
+        for root in self.roots:
+            if not os.path.isdir(root):
+                continue
+            for entry in os.scandir(root):
+                if entry.is_dir():
+                    mtime = entry.stat().st_mtime
+                    self._access_times[entry.name] = max(self._access_times.get(entry.name, 0), mtime)
+        logger.info(f"Artifact janitor tracking {len(self._access_times)} videos")
+
+    def track(self, video_id):
+        """Start tracking a new video, as accessed now"""
+        with self._lock:
+            self._access_times[video_id] = time.time()
+
+    def touch(self, video_id):
+        """Record an access to the artifacts of a tracked video; unknown IDs are ignored"""
+        now = time.time()
+        with self._lock:
+            if video_id not in self._access_times:
+                return
+            self._access_times[video_id] = now
+        for path in self._video_dirs(video_id):
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+
+    def usage(self):
+        """Bytes used per video across all roots"""
+        with self._lock:
+            video_ids = set(self._access_times)
+        for root in self.roots:
+            if os.path.isdir(root):
+                video_ids.update(entry.name for entry in os.scandir(root) if entry.is_dir())
+        return {
+            video_id: sum(directory_size(path) for path in self._video_dirs(video_id) if os.path.isdir(path))
+            for video_id in video_ids
+        }
+
+    def orphaned_temp_workspaces(self):
+        """Temp workspaces of the pipeline that have not been modified for temp_max_age seconds"""
+        temp_root = tempfile.gettempdir()
+        cutoff = time.time() - self.temp_max_age
+        orphans = []
+        for entry in os.scandir(temp_root):
+            if entry.name.startswith(TEMP_PREFIX) and entry.is_dir():
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        orphans.append(entry.path)
+                except OSError:
+                    pass
+        return orphans
+
+    def _eviction_plan(self, usage, protected):
+        """LRU-ordered videos to evict so usage fits in the budget"""
+        total = sum(usage.values())
+        with self._lock:
+            order = sorted(usage, key=lambda video_id: self._access_times.get(video_id, 0))
+        plan = []
+        for video_id in order:
+            if total <= self.budget_bytes:
+                break
+            if video_id in protected:
+                continue
+            plan.append(video_id)
+            total -= usage[video_id]
+        return plan
+
+    def report(self, protected=()):
+        """
+        Summarize disk usage
+
+        Args:
+            protected: Video IDs that must not be evicted, e.g. running jobs
+
+        Returns:
+            Dictionary with total, budget and reclaimable bytes
+        """
+        usage = self.usage()
+        plan = self._eviction_plan(usage, set(protected))
+        orphans = self.orphaned_temp_workspaces()
+        orphan_bytes = sum(directory_size(path) for path in orphans)
+        return {
+            "videos": len(usage),
+            "total_bytes": sum(usage.values()),
+            "budget_bytes": self.budget_bytes,
+            "over_budget_bytes": max(sum(usage.values()) - self.budget_bytes, 0),
+            "evictable_videos": plan,
+            "reclaimable_bytes": sum(usage[video_id] for video_id in plan) + orphan_bytes,
+            "orphaned_temp_workspaces": len(orphans),
+            "orphaned_temp_bytes": orphan_bytes,
+        }
+
+    def enforce(self, protected=()):
+        """
+        Remove orphaned temp workspaces and evict LRU videos until the budget is met
+
+        Args:
+            protected: Video IDs that must not be evicted, e.g. running jobs
+
+        Returns:
+            Dictionary with the evicted video IDs and the bytes reclaimed
+        """
+        reclaimed = 0
+        orphans = self.orphaned_temp_workspaces()
+        for path in orphans:
+            size = directory_size(path)
+            shutil.rmtree(path, ignore_errors=True)
+            reclaimed += size
+            logger.info(f"Removed orphaned temp workspace {path} ({size} bytes)")
+
+        usage = self.usage()
+        evicted = self._eviction_plan(usage, set(protected))
+        for video_id in evicted:
+            for path in self._video_dirs(video_id):
+                shutil.rmtree(path, ignore_errors=True)
+            with self._lock:
+                self._access_times.pop(video_id, None)
+            reclaimed += usage[video_id]
+            logger.info(f"Evicted artifacts of video {video_id} ({usage[video_id]} bytes)")
+            if self.on_evict:
+                self.on_evict(video_id)
+
+        return {
+            "evicted_videos": evicted,
+            "removed_temp_workspaces": len(orphans),
+            "reclaimed_bytes": reclaimed,
+        }
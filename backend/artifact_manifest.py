@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+# Child of the backend logger, so messages end up in backend.log
+logger = logging.getLogger('backend.artifact_manifest')
+
+MANIFEST_NAME = "manifest.json"
+
+# Bump when the analysis output changes; manifests of other versions are
+# ignored at startup, so those videos are analyzed again on request
+PIPELINE_VERSION = 1
+
+# Files that are never artifacts: temporary files of atomic writes and
+# uploads, and directories of unfinished encodes
+TEMPORARY_SUFFIXES = (".tmp", ".part", ".partial")
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+def file_sha256(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def list_artifacts(video_dir):
+    """
+    Describe the files below a video directory
+
+    Returns:
+        Dictionary mapping each relative path (with "/" separators) to
+        {"size": bytes, "sha256": hex digest}
+    """
+    artifacts = {}
+    for root, dirs, files in os.walk(video_dir):
+        dirs[:] = sorted(d for d in dirs if not d.endswith(TEMPORARY_SUFFIXES))
+        for name in sorted(files):
+            if name == MANIFEST_NAME or name.endswith(TEMPORARY_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, video_dir).replace(os.sep, "/")
+            artifacts[relative] = {"size": os.path.getsize(path), "sha256": file_sha256(path)}
+    return artifacts
+
+def write_json_atomic(path, content):
+    """Write JSON to a temporary file and rename it over path"""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(content, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+class ArtifactIndex:
+    """
+    In-memory index of the manifests of completed analyses.
+
+    Every fully analyzed video has a manifest.json in its static directory
+    listing its artifacts (size and hash), the pipeline version and the
+    analysis result. The index is rebuilt from these files at startup, so
+    artifact lookups are dictionary hits instead of filesystem probes and
+    completed analyses survive a restart.
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root: Directory holding one subdirectory per video (static/)
+        """
+        self.root = root
+        self._lock = threading.Lock()
+        self._manifests = {}
+        # Per video, artifact path by file stem, e.g. "thumbnail" -> "thumbnail.jpg"
+        self._stems = {}
+
+    def _add(self, video_id, manifest):
+        stems = {}
+        for relative in sorted(manifest["artifacts"]):
+            stems.setdefault(os.path.splitext(relative)[0], relative)
+        with self._lock:
+            self._manifests[video_id] = manifest
+            self._stems[video_id] = stems
+
+    def _read_valid(self, video_id):
+        """Read a video's manifest; None unless it is current and all artifacts are present"""
+        video_dir = os.path.join(self.root, video_id)
+        try:
+            with open(os.path.join(video_dir, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable manifest for {video_id}: {str(e)}")
+            return None
+        if manifest.get("pipeline_version") != PIPELINE_VERSION:
+            logger.info(f"Ignoring manifest of {video_id} from pipeline version {manifest.get('pipeline_version')}")
+            return None
+        # Sizes catch missing and truncated files without rehashing everything
+        for relative, info in manifest.get("artifacts", {}).items():
+            try:
+                if os.path.getsize(os.path.join(video_dir, relative)) != info["size"]:
+                    raise OSError("size mismatch")
+            except OSError:
+                logger.warning(f"Ignoring manifest of {video_id}: artifact {relative} is missing or changed")
+                return None
+        return manifest
+
+    def load(self):
+        """
+        Rebuild the index from the manifests on disk
+
+        Returns:
+            Dictionary of the valid manifests by video ID
+        """
+        start = time.perf_counter()
+        with self._lock:
+            self._manifests = {}
+            self._stems = {}
+        if os.path.isdir(self.root):
+            for entry in os.scandir(self.root):
+                if entry.is_dir():
+                    manifest = self._read_valid(entry.name)
+                    if manifest:
+                        self._add(entry.name, manifest)
+        with self._lock:
+            manifests = dict(self._manifests)
+        logger.info(f"Indexed {len(manifests)} completed analyses in {time.perf_counter() - start:.2f}s")
+        return manifests
+
+    def refresh(self, video_id):
+        """Re-read a video's manifest from disk, e.g. one written by another process"""
+        manifest = self._read_valid(video_id)
+        if manifest:
+            self._add(video_id, manifest)
+        else:
+            self.discard(video_id, remove_file=False)
+        return manifest
+
+    def write(self, video_id, result):
+        """
+        Describe a completed analysis in its manifest and add it to the index
+
+        Args:
+            video_id: The video ID
+            result: The analysis result served to clients
+
+        Returns:
+            The manifest
+        """
+        video_dir = os.path.join(self.root, video_id)
+        manifest = {
+            "video_id": video_id,
+            "pipeline_version": PIPELINE_VERSION,
+            "created_at": time.time(),
+            "artifacts": list_artifacts(video_dir),
+            "result": result,
+        }
+        write_json_atomic(os.path.join(video_dir, MANIFEST_NAME), manifest)
+        self._add(video_id, manifest)
+        logger.info(f"Wrote manifest for {video_id} with {len(manifest['artifacts'])} artifacts")
+        return manifest
+
+    def discard(self, video_id, remove_file=True):
+        """Drop a video from the index, and its manifest from disk unless remove_file is False"""
+        with self._lock:
+            self._manifests.pop(video_id, None)
+            self._stems.pop(video_id, None)
+        if remove_file:
+            try:
+                os.remove(os.path.join(self.root, video_id, MANIFEST_NAME))
+            except FileNotFoundError:
+                pass
+
+    def get(self, video_id):
+        """The manifest of a completed analysis, or None"""
+        with self._lock:
+            return self._manifests.get(video_id)
+
+    def has(self, video_id, relative):
+        """Whether a completed analysis has the artifact at a relative path"""
+        with self._lock:
+            manifest = self._manifests.get(video_id)
+            return manifest is not None and relative in manifest["artifacts"]
+
+    def find(self, video_id, stem):
+        """Relative path of a completed analysis' artifact with the given stem, e.g. "thumbnail", or None"""
+        with self._lock:
+            return self._stems.get(video_id, {}).get(stem)
@@ -0,0 +1,177 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from job_control import run_killable
+
+# Child of the backend logger, so messages end up in backend.log
+logger = logging.getLogger('backend.audio_renditions')
+
+# Compressed renditions produced for every served WAV, in order of preference.
+# Opus covers Chrome/Firefox/Edge, AAC in MP4 covers Safari.
+RENDITION_FORMATS = {
+    "opus": {
+        "extension": ".opus",
+        "media_type": "audio/ogg",
+        "ffmpeg_args": ["-c:a", "libopus", "-b:a", "96k", "-vbr", "on"],
+    },
+    "aac": {
+        "extension": ".m4a",
+        "media_type": "audio/mp4",
+        "ffmpeg_args": ["-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart"],
+    },
+}
+
+# Media types a client may list in Accept for each format
+FORMAT_MEDIA_TYPES = {
+    "opus": ("audio/ogg", "audio/opus", "audio/webm"),
+    "aac": ("audio/mp4", "audio/aac", "audio/m4a", "audio/x-m4a"),
+    "wav": ("audio/wav", "audio/wave", "audio/x-wav"),
+}
+
+# Formats for clients that only accept audio through a wildcard (audio/* or
+# */*), most widely playable first: Safari sends Accept: */* for media but
+# may not play Ogg/Opus
+WILDCARD_PREFERENCE = ("aac", "wav", "opus")
+
+# Seconds before a single encode is abandoned
+ENCODE_TIMEOUT = 600
+
+def rendition_path(wav_path, fmt):
+    """Path of the compressed rendition of a WAV file"""
+    return os.path.splitext(wav_path)[0] + RENDITION_FORMATS[fmt]["extension"]
+
+def encode_rendition(wav_path, fmt, threads=None, timeout=ENCODE_TIMEOUT, cancel_token=None):
+    """
+    Encode a WAV file to a compressed rendition with ffmpeg
+
+    Args:
+        wav_path: Path to the source WAV file
+        fmt: Rendition format, a key of RENDITION_FORMATS
+        threads: Thread limit passed to ffmpeg (None lets ffmpeg decide)
+        timeout: Seconds before ffmpeg is killed
+        cancel_token: Optional CancellationToken that kills ffmpeg when cancelled
+
+    Returns:
+        Path to the encoded file, or None if encoding failed
+
+    Raises:
+        JobCancelled: If the token was cancelled during the encode
+    """
+    output_path = rendition_path(wav_path, fmt)
+    command = ["ffmpeg", "-y", "-v", "error"]
+    if threads:
+        command += ["-threads", str(threads)]
+    command += ["-i", wav_path, "-vn"]
+    command += RENDITION_FORMATS[fmt]["ffmpeg_args"]
+    command.append(output_path)
+
+    try:
+        result = run_killable(command, timeout=timeout, cancel_token=cancel_token)
+    except (TimeoutError, OSError) as e:
+        logger.error(f"Error encoding {wav_path} to {fmt}: {str(e)}")
+        return None
+    if result.returncode != 0:
+        logger.error(f"ffmpeg failed to encode {wav_path} to {fmt}: {result.stderr.decode(errors='replace').strip()}")
+        return None
+
+    logger.info(f"Encoded {fmt} rendition: {output_path} ({os.path.getsize(output_path)} bytes)")
+    return output_path
+
+def encode_renditions(wav_paths, formats=tuple(RENDITION_FORMATS), max_workers=None, threads_per_encode=None,
+                      cancel_token=None):
+    """
+    Encode compressed renditions of several WAV files in a worker pool
+
+    Args:
+        wav_paths: List of WAV file paths
+        formats: Rendition formats to produce for each file
+        max_workers: Number of concurrent ffmpeg processes (defaults to CPU count)
+        threads_per_encode: Thread limit for each ffmpeg process
+        cancel_token: Optional CancellationToken that kills the running encodes when cancelled
+
+    Returns:
+        Dictionary mapping each WAV path to a {format: encoded path} dictionary
+        containing only the renditions that were produced
+
+    Raises:
+        JobCancelled: If the token was cancelled during the encodes
+    """
+    jobs = [(wav_path, fmt) for wav_path in wav_paths for fmt in formats]
+    max_workers = max_workers or os.cpu_count() or 1
+    logger.info(f"Encoding {len(jobs)} renditions with {max_workers} workers")
+
+    renditions = {wav_path: {} for wav_path in wav_paths}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(lambda job: encode_rendition(*job, threads=threads_per_encode, cancel_token=cancel_token),
+                                jobs)
+        for (wav_path, fmt), output_path in zip(jobs, results):
+            if output_path:
+                renditions[wav_path][fmt] = output_path
+    return renditions
+
+def parse_accept(accept_header):
+    """Parse "type/subtype;q=0.8, ..." into {media_type: q}; a missing header accepts anything"""
+    weights = {}
+    for entry in (accept_header or "*/*").split(","):
+        parts = [part.strip() for part in entry.split(";")]
+        if not parts[0]:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        weights[parts[0].lower()] = q
+    return weights
+
+def format_quality(fmt, weights):
+    """
+    Quality the client gives a format: the q of the most specific range that
+    matches it (RFC 9110, section 12.5.1)
+
+    Returns:
+        Tuple of (q, whether the format's own media type was listed); q is 0
+        if no range matches
+    """
+    listed = [weights[media_type] for media_type in FORMAT_MEDIA_TYPES[fmt] if media_type in weights]
+    if listed:
+        return max(listed), True
+    for wildcard in ("audio/*", "*/*"):
+        if wildcard in weights:
+            return weights[wildcard], False
+    return 0.0, False
+
+def negotiate_format(accept_header, available, requested=None):
+    """
+    Pick the audio format to serve
+
+    Formats with q=0 are not acceptable. Among the highest q, a format the
+    client listed by name wins over one matched by a wildcard; ties between
+    listed formats go by RENDITION_FORMATS order, wildcard-only ones by
+    WILDCARD_PREFERENCE.
+
+    Args:
+        accept_header: Value of the request's Accept header
+        available: Formats available for the track, including "wav"
+        requested: Explicit format from the query string, which wins if available
+
+    Returns:
+        The chosen format name; "wav" if nothing else is acceptable
+    """
+    if requested:
+        return requested if requested in available else None
+
+    weights = parse_accept(accept_header)
+    listed_order = list(RENDITION_FORMATS) + ["wav"]
+    candidates = []
+    for fmt in listed_order:
+        if fmt not in available:
+            continue
+        q, listed = format_quality(fmt, weights)
+        if q <= 0:
+            continue
+        preference = listed_order.index(fmt) if listed else WILDCARD_PREFERENCE.index(fmt)
+        candidates.append(((-q, not listed, preference), fmt))
+    return min(candidates)[1] if candidates else "wav"
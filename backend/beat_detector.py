@@ -3,18 +3,20 @@ import numpy as np
 import librosa
 import logging
 import soundfile as sf
-import tempfile
 import time
+import queue
+import threading
 import traceback
 from io import BytesIO
 import matplotlib.pyplot as plt
 import base64
 from scipy.ndimage import gaussian_filter1d
-import logging.handlers
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 # Import beat_this library for ML-based beat detection
 try:
-    from beat_this.inference import File2Beats
+    from beat_this.inference import File2Beats, Audio2Beats
     BEAT_THIS_AVAILABLE = True
 except ImportError:
     BEAT_THIS_AVAILABLE = False
@@ -28,29 +30,19 @@ except ImportError:
 
 # Import simple YouTube downloader
 from simple_youtube import SimpleYouTubeDownloader
+from feature_store import FeatureStore, HPSS_MARGIN
+from waveform_peaks import write_peak_file
+from click_mixer import (make_click, add_clicks, click_track_peak, peak_amplitude, BEAT_CLICK_FREQ,
+                         DOWNBEAT_CLICK_FREQ, BLOCK_FRAMES)
+from job_control import JobCancelled
+from metrics import STAGE_SECONDS
+from artifact_janitor import make_temp_workspace
+from log_setup import configure_logging
 
-# Configure logging - Simplified approach
-LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
-os.makedirs(LOG_DIR, exist_ok=True)
-LOG_FILE = os.path.join(LOG_DIR, "beat_detector.log")
-
-# Create a logger for this module
+# Messages go through the queue-based setup shared by all backend modules
+configure_logging()
 logger = logging.getLogger('beat_detector')
 
-# Check if the logger already has handlers to avoid duplicates
-if not logger.handlers:
-    # Add a file handler
-    file_handler = logging.handlers.RotatingFileHandler(
-        LOG_FILE,
-        maxBytes=10*1024*1024,  # 10MB
-        backupCount=5
-    )
-    file_handler.setLevel(logging.INFO)
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    logger.setLevel(logging.INFO)
-
 # Log availability of key components
 if BEAT_THIS_AVAILABLE:
     logger.info("beat_this library available for improved beat detection.")
@@ -62,22 +54,283 @@ if AUDIO_SEPARATOR_AVAILABLE:
 else:
     logger.warning("Audio Separator not available. Will use HPSS instead.")
 
-# Test write to log file
-try:
-    with open(LOG_FILE, 'a') as f:
-        f.write("Beat detector initialized\n")
-    logger.info("Successfully wrote to beat detector log file")
-except Exception as e:
-    logger.error(f"Error writing to beat detector log file: {str(e)}")
+# Windows of a segmented analysis inferred concurrently by default. Each one
+# holds its own copy of the beat_this model, so this also bounds the copies
+# a process keeps loaded
+DEFAULT_SEGMENT_WORKERS = 2
+
+class ModelPool:
+    """
+    Process-wide pool of loaded models, shared by every BeatDetector.
+    
+    Torch modules are not safe to run from several threads at once, so each
+    model is handed to one caller at a time. Copies are loaded on demand, up
+    to the limit the caller asks for, and stay loaded for later jobs.
+    """
+    
+    def __init__(self, load, name):
+        """
+        Args:
+            load: Callable returning a freshly loaded model
+            name: Model name used in log messages
+        """
+        self._load = load
+        self.name = name
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self.loaded = 0
+    
+    def acquire(self, limit=1):
+        """
+        Take an idle model, loading another copy while fewer than limit exist;
+        blocks until one is released otherwise
+        """
+        with self._lock:
+            load = self._idle.empty() and self.loaded < limit
+            if load:
+                self.loaded += 1
+        if not load:
+            return self._idle.get()
+        try:
+            logger.info(f"Loading {self.name} model copy {self.loaded}")
+            return self._load()
+        except Exception:
+            with self._lock:
+                self.loaded -= 1
+            raise
+    
+    def release(self, model):
+        """Return a model taken with acquire"""
+        self._idle.put(model)
+    
+    @contextmanager
+    def model(self, limit=1):
+        """Hold a model for the duration of a with block"""
+        model = self.acquire(limit)
+        try:
+            yield model
+        finally:
+            self.release(model)
+    
+    def preload(self):
+        """Make sure at least one copy is loaded"""
+        with self.model():
+            pass
+
+# beat_this models of this process
+beat_this_models = ModelPool(lambda: File2Beats(dbn=False), "beat_this")
+
+# Audio Separator of this process, loaded once and shared by every BeatDetector;
+# separations run one at a time under the lock
+_audio_separator = None
+audio_separator_lock = threading.Lock()
+
+def get_audio_separator():
+    """The process' Audio Separator with its model loaded, created on first use"""
+    global _audio_separator
+    with audio_separator_lock:
+        if _audio_separator is None:
+            logger.info("Loading Audio Separator model...")
+            separator = AudioSeparator()
+            separator.load_model()
+            _audio_separator = separator
+            logger.info("Audio Separator model loaded successfully")
+        return _audio_separator
 
-logger.info("Beat detector logging initialized")
+
+def split_into_segments(num_samples, sr, segment_seconds, overlap_seconds):
+    """
+    Split a signal into overlapping analysis windows
+    
+    Args:
+        num_samples: Length of the signal in samples
+        sr: Sample rate of the signal
+        segment_seconds: Length of each window in seconds
+        overlap_seconds: Overlap between consecutive windows in seconds
+        
+    Returns:
+        List of (start, end) sample indices
+    """
+    segment_len = int(segment_seconds * sr)
+    hop = segment_len - int(overlap_seconds * sr)
+    if hop <= 0:
+        raise ValueError("Segment overlap must be shorter than the segment itself")
+    
+    segments = []
+    start = 0
+    while True:
+        end = min(start + segment_len, num_samples)
+        segments.append((start, end))
+        if end >= num_samples:
+            break
+        start += hop
+    return segments
+
+def stitch_segment_beats(segment_times, segment_bounds, tolerance):
+    """
+    Merge beat times detected on overlapping windows into a single sequence
+    
+    Inside each overlap zone, beats from both windows that are mutual nearest
+    neighbours within the tolerance are averaged. Beats without a partner are
+    kept from whichever window is further from its own edge, i.e. the left
+    window before the middle of the overlap and the right window after it.
+    
+    Args:
+        segment_times: List of beat time arrays (absolute seconds), one per window
+        segment_bounds: List of (start, end) window bounds in seconds
+        tolerance: Maximum distance in seconds for two beats to be merged
+        
+    Returns:
+        Sorted array of stitched beat times
+    """
+    if not segment_times:
+        return np.array([])
+    
+    merged = np.asarray(segment_times[0], dtype=float)
+    for i in range(1, len(segment_times)):
+        times = np.asarray(segment_times[i], dtype=float)
+        zone_start = segment_bounds[i][0]
+        zone_end = segment_bounds[i - 1][1]
+        midpoint = (zone_start + zone_end) / 2
+        
+        kept = merged[merged < zone_start]
+        left = merged[merged >= zone_start]
+        right = times[times <= zone_end]
+        rest = times[times > zone_end]
+        
+        zone = []
+        matched_right = np.zeros(len(right), dtype=bool)
+        for beat in left:
+            if len(right) > 0:
+                j = int(np.argmin(np.abs(right - beat)))
+                nearest_left = left[np.argmin(np.abs(left - right[j]))]
+                if abs(right[j] - beat) <= tolerance and nearest_left == beat:
+                    zone.append((beat + right[j]) / 2)
+                    matched_right[j] = True
+                    continue
+            if beat < midpoint:
+                zone.append(beat)
+        zone.extend(beat for beat in right[~matched_right] if beat >= midpoint)
+        
+        merged = np.concatenate([kept, np.sort(np.asarray(zone, dtype=float)), rest])
+    
+    return merged
+
+def estimate_tempo(beat_times):
+    """Estimate tempo in BPM from the median inter-beat interval"""
+    if len(beat_times) >= 2:
+        intervals = np.diff(beat_times)
+        median_interval = np.median(intervals)
+        tempo = 60.0 / median_interval
+        logger.info(f"Estimated tempo: {tempo:.1f} BPM")
+    else:
+        tempo = 120.0  # Default fallback
+        logger.warning("Not enough beats detected to calculate tempo, using default 120 BPM")
+    return tempo
+
+def render_waveform_image(features, beats, downbeats, output_path=None):
+    """
+    Plot the waveform of the audio and its HPSS components with beat markers
+    
+    Args:
+        features: FeatureStore of the audio; HPSS masks it already holds, e.g.
+            loaded from a persisted features.npz, are not recomputed
+        beats: List of regular beat timestamps in seconds
+        downbeats: List of downbeat timestamps in seconds
+        output_path: Optional path to save the PNG to
+        
+    Returns:
+        output_path once the PNG is saved there, or the base64-encoded PNG if
+        no output_path is given
+    """
+    y, sr = features.y, features.sr
+    
+    # Get harmonic and percussive components
+    y_harmonic, y_percussive = features.hpss(HPSS_MARGIN)
+    
+    # Duration
+    audio_duration = librosa.get_duration(y=y, sr=sr)
+    
+    # Create figure
+    plt.figure(figsize=(20, 12), dpi=150)
+    plt.style.use('dark_background')
+    
+    # Plot original audio
+    plt.subplot(3, 1, 1)
+    plt.title("Original Audio with Beats", fontsize=16, fontweight='bold')
+    librosa.display.waveshow(y, sr=sr, alpha=0.8, color='#1DB954')
+    
+    # Add beat markers
+    for time in beats:
+        plt.axvline(x=time, color='red', alpha=0.5, linewidth=1.0)
+        plt.plot(time, 0, 'ro', markersize=3, alpha=0.5)
+    
+    # Add downbeat markers with different color
+    for time in downbeats:
+        plt.axvline(x=time, color='yellow', alpha=0.7, linewidth=1.5)
+        plt.plot(time, 0, 'yo', markersize=5)
+    
+    # Plot harmonic component
+    plt.subplot(3, 1, 2)
+    plt.title("Harmonic Component", fontsize=16, fontweight='bold')
+    librosa.display.waveshow(y_harmonic, sr=sr, alpha=0.8, color='#2E77D0')
+    
+    # Plot percussive component
+    plt.subplot(3, 1, 3)
+    plt.title("Percussive Component", fontsize=16, fontweight='bold')
+    librosa.display.waveshow(y_percussive, sr=sr, alpha=0.8, color='#E65C00')
+    
+    # Add beat markers to percussive component
+    for time in beats:
+        plt.axvline(x=time, color='red', alpha=0.5, linewidth=1.0)
+        plt.plot(time, 0, 'ro', markersize=3, alpha=0.5)
+    
+    # Add downbeat markers with different color
+    for time in downbeats:
+        plt.axvline(x=time, color='yellow', alpha=0.7, linewidth=1.5)
+        plt.plot(time, 0, 'yo', markersize=5)
+    
+    plt.xlabel("Time (seconds)", fontsize=14)
+    plt.tight_layout()
+    
+    # Save or return the figure
+    if output_path:
+        plt.savefig(output_path, dpi=150, bbox_inches='tight')
+        plt.close()
+        return output_path
+    else:
+        img_data = BytesIO()
+        plt.savefig(img_data, format='png', dpi=150, bbox_inches='tight')
+        img_data.seek(0)
+        plt.close()
+        # Convert to base64
+        img_base64 = base64.b64encode(img_data.getvalue()).decode('utf-8')
+        return img_base64
 
 class BeatDetector:
-    def __init__(self, tolerance=0.1):
+    def __init__(self, tolerance=0.1, segment_seconds=None, segment_overlap=10.0, segment_workers=None,
+                 render_waveform_image=False, analysis_sr=None, persist_features=False,
+                 render_click_tracks=True):
         """Initialize the beat detector with audio separation model
         
         Args:
             tolerance: Global tolerance value for beat detection (in seconds)
+            segment_seconds: Window length for segment-parallel beat_this inference
+                (None runs the model over the whole file at once)
+            segment_overlap: Overlap between consecutive windows (in seconds)
+            segment_workers: Number of windows processed concurrently (defaults to
+                DEFAULT_SEGMENT_WORKERS); every concurrent window holds its own copy of
+                the beat_this model, taken from the process-wide beat_this_models pool
+            render_waveform_image: Whether to render the matplotlib waveform PNG in addition
+                to the peak pyramids served by the waveform API; players draw the peaks,
+                and /api/waveform-image renders the PNG on request
+            analysis_sr: Sample rate of beat detection and all spectral features
+                (None analyzes at the native rate). Separated stems, peaks and
+                click tracks stay at the native rate.
+            persist_features: Whether to save the compact spectral features
+                (see FeatureStore.save) as features.npz with the results
+            render_click_tracks: Whether to write the pre-mixed click tracks; without them
+                the stems are mixed with the clicks on request (see ClickMixer)
         """
         logger.info("Initializing BeatDetector")
         
@@ -85,13 +338,26 @@ class BeatDetector:
         self.tolerance = tolerance
         logger.info(f"Using beat detection tolerance of {self.tolerance}s")
         
-        # Initialize audio separator
+        # Segment-parallel inference settings
+        self.segment_seconds = segment_seconds
+        self.segment_overlap = segment_overlap
+        self.segment_workers = segment_workers or DEFAULT_SEGMENT_WORKERS
+        if self.segment_seconds:
+            logger.info(f"Using segment-parallel beat detection: {self.segment_seconds}s windows, "
+                        f"{self.segment_overlap}s overlap, {self.segment_workers} workers")
+        
+        self.render_waveform_image = render_waveform_image
+        self.render_click_tracks = render_click_tracks
+        
+        self.analysis_sr = analysis_sr
+        self.persist_features = persist_features
+        if self.analysis_sr:
+            logger.info(f"Analyzing audio at {self.analysis_sr}Hz")
+        
+        # Initialize audio separator, shared with the other detectors of this process
         try:
             if AUDIO_SEPARATOR_AVAILABLE:
-                logger.info("Loading Audio Separator model...")
-                self.audio_separator = AudioSeparator()
-                self.audio_separator.load_model()
-                logger.info("Audio Separator model loaded successfully")
+                self.audio_separator = get_audio_separator()
                 self.separator_type = "audio_separator"
             else:
                 logger.info("No audio separator available. Using HPSS for separation.")
@@ -100,13 +366,14 @@ class BeatDetector:
             logger.error(f"Error loading audio separation model: {e}")
             self.separator_type = "hpss"
         
-        # Initialize the beat detection model if available
+        # Initialize the beat detection model if available; loaded models are
+        # shared with the other detectors of this process
         self.beat_this_available = BEAT_THIS_AVAILABLE
         
         if self.beat_this_available:
             try:
                 logger.info("Loading beat_this model")
-                self.beat_detector = File2Beats(dbn=False)
+                beat_this_models.preload()
                 logger.info("beat_this model loaded successfully")
             except Exception as e:
                 logger.error(f"Error loading beat_this model: {e}")
@@ -114,14 +381,50 @@ class BeatDetector:
         
         # Initialize the YouTube downloader
         self.downloader = SimpleYouTubeDownloader()
+    
+    @property
+    def engine(self):
+        """Name of the beat detection engine, used as a metrics label"""
+        if not self.beat_this_available:
+            return "none"
+        return "beat_this_segmented" if self.segment_seconds else "beat_this"
+    
+    def stage_timer(self, stage):
+        """Context manager recording the duration of a pipeline stage in the stage histogram"""
+        return STAGE_SECONDS.time(stage=stage, separator=self.separator_type, engine=self.engine)
+        
+    def load_audio(self, audio_file):
+        """
+        Decode audio once at its native rate and resample it once to the analysis rate
+        
+        Args:
+            audio_file: Path to the audio file
+            
+        Returns:
+            Tuple of ((y, sr) at the native rate, FeatureStore at the analysis rate)
+        """
+        y, sr = librosa.load(audio_file, sr=None)
+        if self.analysis_sr and self.analysis_sr != sr:
+            y_analysis = librosa.resample(y, orig_sr=sr, target_sr=self.analysis_sr, res_type="soxr_hq")
+            return (y, sr), FeatureStore(audio_file, y=y_analysis, sr=self.analysis_sr)
+        return (y, sr), FeatureStore(audio_file, y=y, sr=sr)
+    
+    def download_audio(self, youtube_url, output_dir=None, timeout=None, cancel_token=None):
+        """Download audio from a YouTube video
         
-    def download_audio(self, youtube_url, output_dir=None):
-        """Download audio from a YouTube video"""
+        Args:
+            youtube_url: URL of the YouTube video
+            output_dir: Directory to save the audio file (defaults to a new temporary directory)
+            timeout: Seconds after which the download process is killed
+            cancel_token: Optional CancellationToken that kills the download when cancelled
+        """
         if output_dir is None:
-            output_dir = tempfile.mkdtemp()
+            output_dir = make_temp_workspace()
         
         logger.info(f"Downloading audio from {youtube_url}")
-        output_file, duration, title = self.downloader.download_audio(youtube_url, output_dir)
+        output_file, duration, title = self.downloader.download_audio_process(
+            youtube_url, output_dir, timeout=timeout, cancel_token=cancel_token
+        )
         
         if output_file and os.path.exists(output_file):
             logger.info(f"Successfully downloaded audio: {title}, Duration: {duration}s")
@@ -129,8 +432,15 @@ class BeatDetector:
         else:
             raise ValueError(f"Failed to download audio from {youtube_url}")
     
-    def separate_audio(self, audio_file, progress_callback=None):
-        """Separate audio into vocals/harmonic and instrumental/percussive components"""
+    def separate_audio(self, audio_file, progress_callback=None, features=None, native=None):
+        """Separate audio into vocals/harmonic and instrumental/percussive components
+        
+        Args:
+            audio_file: Path to the audio file to separate
+            progress_callback: Optional callback for progress updates
+            features: Optional FeatureStore for audio_file, shared with later stages
+            native: Optional (y, sr) of audio_file at its native rate, the rate the stems are written at
+        """
         logger.info(f"Separating audio: {audio_file}")
         if progress_callback:
             progress_callback(0.4, "Starting audio separation process...")
@@ -150,7 +460,8 @@ class BeatDetector:
                     progress_callback(0.42, "Using advanced audio separator...")
                 
                 # Use Audio Separator for better separation
-                output_files = self.audio_separator.separate(audio_file)
+                with audio_separator_lock:
+                    output_files = self.audio_separator.separate(audio_file)
                 
                 if progress_callback:
                     progress_callback(0.45, "Audio components separated, processing outputs...")
@@ -187,14 +498,19 @@ class BeatDetector:
                 if progress_callback:
                     progress_callback(0.42, "Loading audio for separation...")
                 
-                y, sr = librosa.load(audio_file, sr=None)
+                if features is None:
+                    native, features = self.load_audio(audio_file)
+                elif native is None:
+                    native = librosa.load(audio_file, sr=None) if self.analysis_sr else (features.y, features.sr)
+                y, sr = native
                 logger.info(f"Audio loaded with sample rate {sr}Hz, duration: {len(y)/sr:.2f}s")
                 
                 if progress_callback:
                     progress_callback(0.45, "Performing harmonic-percussive separation...")
                 
-                # Improved HPSS with custom margins
-                y_harmonic, y_percussive = librosa.effects.hpss(y, margin=(3.0, 2.0))
+                # Improved HPSS with custom margins, with the masks computed at the
+                # analysis rate and memoized in the feature store
+                y_harmonic, y_percussive = features.hpss_at(y, sr, HPSS_MARGIN)
                 logger.info("HPSS separation completed")
                 
                 if progress_callback:
@@ -220,12 +536,13 @@ class BeatDetector:
                 progress_callback(0.4, f"Error in audio separation: {str(e)}")
             raise
     
-    def detect_beats_with_beat_this(self, percussive_path):
+    def detect_beats_with_beat_this(self, percussive_path, percussive_signal=None):
         """
         Detect beats using the beat_this ML-based model
         
         Args:
             percussive_path: Path to percussive component audio
+            percussive_signal: Optional (y, sr) of the percussive component, used instead of the file
             
         Returns:
             Arrays of beat times, downbeat times, and estimated tempo
@@ -234,19 +551,16 @@ class BeatDetector:
         
         try:
             # Use beat_this model to detect beats and downbeats
-            beat_times, downbeat_times = self.beat_detector(percussive_path)
+            with beat_this_models.model(self.segment_workers) as model:
+                if percussive_signal is not None:
+                    beat_times, downbeat_times = Audio2Beats.__call__(model, *percussive_signal)
+                else:
+                    beat_times, downbeat_times = model(percussive_path)
             
             logger.info(f"Detected {len(beat_times)} beats and {len(downbeat_times)} downbeats with beat_this")
             
-            # Calculate tempo from beats (average of all consecutive beat intervals)
-            if len(beat_times) >= 2:
-                intervals = np.diff(beat_times)
-                median_interval = np.median(intervals)
-                tempo = 60.0 / median_interval
-                logger.info(f"Estimated tempo: {tempo:.1f} BPM")
-            else:
-                tempo = 120.0  # Default fallback
-                logger.warning("Not enough beats detected to calculate tempo, using default 120 BPM")
+            # Calculate tempo from beats (median of all consecutive beat intervals)
+            tempo = estimate_tempo(beat_times)
             
             return beat_times, downbeat_times, tempo
             
@@ -256,7 +570,67 @@ class BeatDetector:
             # Return empty arrays and default tempo
             return np.array([]), np.array([]), 120.0
     
-    def detect_beats(self, harmonic_path, percussive_path, audio_path=None):
+    def detect_beats_with_beat_this_segmented(self, percussive_path, percussive_signal=None):
+        """
+        Detect beats using beat_this on overlapping windows processed in parallel
+        
+        Each window is run through the model independently and the resulting
+        beat and downbeat times are stitched back together in the overlap zones
+        (see stitch_segment_beats). Each window holds a model of its own from
+        beat_this_models while it runs. Inputs shorter than one window fall back to
+        whole-file inference.
+        
+        Args:
+            percussive_path: Path to percussive component audio
+            percussive_signal: Optional (y, sr) of the percussive component, used instead of the file
+            
+        Returns:
+            Arrays of beat times, downbeat times, and estimated tempo
+        """
+        logger.info(f"Detecting beats with segmented beat_this model from {percussive_path}")
+        
+        try:
+            if percussive_signal is not None:
+                signal, sr = percussive_signal
+            else:
+                signal, sr = sf.read(percussive_path, dtype='float32')
+                if signal.ndim == 2:
+                    signal = signal.mean(axis=1)
+            
+            segments = split_into_segments(len(signal), sr, self.segment_seconds, self.segment_overlap)
+            if len(segments) == 1:
+                logger.info("Audio fits in a single window, using whole-file inference")
+                return self.detect_beats_with_beat_this(percussive_path, (signal, sr))
+            
+            logger.info(f"Running beat_this on {len(segments)} windows with {self.segment_workers} workers")
+            
+            def infer_segment(bounds):
+                start, end = bounds
+                with beat_this_models.model(self.segment_workers) as model:
+                    beats, downbeats = Audio2Beats.__call__(model, signal[start:end], sr)
+                offset = start / sr
+                return np.asarray(beats) + offset, np.asarray(downbeats) + offset
+            
+            with ThreadPoolExecutor(max_workers=self.segment_workers) as executor:
+                segment_results = list(executor.map(infer_segment, segments))
+            
+            bounds = [(start / sr, end / sr) for start, end in segments]
+            beat_times = stitch_segment_beats([r[0] for r in segment_results], bounds, self.tolerance)
+            downbeat_times = stitch_segment_beats([r[1] for r in segment_results], bounds, self.tolerance)
+            
+            logger.info(f"Detected {len(beat_times)} beats and {len(downbeat_times)} downbeats with segmented beat_this")
+            
+            tempo = estimate_tempo(beat_times)
+            
+            return beat_times, downbeat_times, tempo
+            
+        except Exception as e:
+            logger.error(f"Error using segmented beat_this for beat detection: {str(e)}")
+            logger.error(traceback.format_exc())
+            # Return empty arrays and default tempo
+            return np.array([]), np.array([]), 120.0
+    
+    def detect_beats(self, harmonic_path, percussive_path, audio_path=None, percussive_signal=None):
         """
         Detect beats using ML-based approach
         
@@ -264,6 +638,8 @@ class BeatDetector:
             harmonic_path: Path to harmonic component audio
             percussive_path: Path to percussive component audio
             audio_path: Path to original audio (optional)
+            percussive_signal: Optional (y, sr) of the percussive component at the analysis
+                rate, which spares the model decoding and resampling the file
             
         Returns:
             Array of beat times, downbeat times, and estimated tempo
@@ -275,95 +651,75 @@ class BeatDetector:
             return np.array([]), np.array([])
             
         # Use beat_this for detection
-        logger.info("Using beat_this model for beat detection")
-        beat_times, downbeat_times, tempo = self.detect_beats_with_beat_this(percussive_path)
+        if self.segment_seconds:
+            logger.info("Using segment-parallel beat_this model for beat detection")
+            beat_times, downbeat_times, tempo = self.detect_beats_with_beat_this_segmented(percussive_path, percussive_signal)
+        else:
+            logger.info("Using beat_this model for beat detection")
+            beat_times, downbeat_times, tempo = self.detect_beats_with_beat_this(percussive_path, percussive_signal)
         
         logger.info(f"Detected {len(beat_times)} regular beats and {len(downbeat_times)} downbeats")
         logger.info(f"Tempo: {tempo:.1f} BPM")
         
         return beat_times, downbeat_times, tempo
     
-    def create_waveform_visualization(self, audio_path, beats, downbeats, output_path=None):
-        """Create a basic visualization of waveform with beat markers"""
+    def create_waveform_visualization(self, audio_path, beats, downbeats, output_path=None, features=None):
+        """Create a basic visualization of waveform with beat markers
+        
+        Args:
+            audio_path: Path to the original audio file
+            beats: List of regular beat timestamps in seconds
+            downbeats: List of downbeat timestamps in seconds
+            output_path: Optional path to save the PNG to
+            features: Optional FeatureStore for audio_path, reused instead of recomputing HPSS
+            
+        Returns:
+            output_path once the PNG is saved there, or the base64-encoded PNG if
+            no output_path is given; None on failure
+        """
         try:
-            # Load the audio file
-            y, sr = librosa.load(audio_path, sr=None)
-            
-            # Get harmonic and percussive components
-            y_harmonic, y_percussive = librosa.effects.hpss(y)
-            
-            # Duration
-            audio_duration = librosa.get_duration(y=y, sr=sr)
-            
-            # Create figure
-            plt.figure(figsize=(20, 12), dpi=150)
-            plt.style.use('dark_background')
-            
-            # Plot original audio
-            plt.subplot(3, 1, 1)
-            plt.title("Original Audio with Beats", fontsize=16, fontweight='bold')
-            librosa.display.waveshow(y, sr=sr, alpha=0.8, color='#1DB954')
-            
-            # Add beat markers
-            for time in beats:
-                plt.axvline(x=time, color='red', alpha=0.5, linewidth=1.0)
-                plt.plot(time, 0, 'ro', markersize=3, alpha=0.5)
-            
-            # Add downbeat markers with different color
-            for time in downbeats:
-                plt.axvline(x=time, color='yellow', alpha=0.7, linewidth=1.5)
-                plt.plot(time, 0, 'yo', markersize=5)
-            
-            # Plot harmonic component
-            plt.subplot(3, 1, 2)
-            plt.title("Harmonic Component", fontsize=16, fontweight='bold')
-            librosa.display.waveshow(y_harmonic, sr=sr, alpha=0.8, color='#2E77D0')
-            
-            # Plot percussive component
-            plt.subplot(3, 1, 3)
-            plt.title("Percussive Component", fontsize=16, fontweight='bold')
-            librosa.display.waveshow(y_percussive, sr=sr, alpha=0.8, color='#E65C00')
-            
-            # Add beat markers to percussive component
-            for time in beats:
-                plt.axvline(x=time, color='red', alpha=0.5, linewidth=1.0)
-                plt.plot(time, 0, 'ro', markersize=3, alpha=0.5)
-            
-            # Add downbeat markers with different color
-            for time in downbeats:
-                plt.axvline(x=time, color='yellow', alpha=0.7, linewidth=1.5)
-                plt.plot(time, 0, 'yo', markersize=5)
-            
-            plt.xlabel("Time (seconds)", fontsize=14)
-            plt.tight_layout()
-            
-            # Save or return the figure
-            if output_path:
-                plt.savefig(output_path, dpi=150, bbox_inches='tight')
-                plt.close()
-                
-                # Convert to base64 for the frontend
-                with open(output_path, 'rb') as img_file:
-                    img_data = img_file.read()
-                    img_base64 = base64.b64encode(img_data).decode('utf-8')
-                return img_base64
-            else:
-                img_data = BytesIO()
-                plt.savefig(img_data, format='png', dpi=150, bbox_inches='tight')
-                img_data.seek(0)
-                plt.close()
-                # Convert to base64
-                img_base64 = base64.b64encode(img_data.getvalue()).decode('utf-8')
-                return img_base64
+            if features is None:
+                _, features = self.load_audio(audio_path)
+            return render_waveform_image(features, beats, downbeats, output_path)
         except Exception as e:
             logger.error(f"Error creating waveform visualization: {e}")
             traceback.print_exc()
             return None
     
+    def create_waveform_peaks(self, harmonic_path, percussive_path, output_dir, features, native=None):
+        """
+        Write min/max peak pyramids for the mix and both stems
+        
+        Args:
+            harmonic_path: Path to the harmonic component audio
+            percussive_path: Path to the percussive component audio
+            output_dir: Directory to save the peak files to
+            features: FeatureStore of the original audio
+            native: Optional (y, sr) of the original audio at its native rate, the rate
+                of the published audio the peaks describe
+            
+        Returns:
+            Dictionary mapping stem name (mix, harmonic, percussive) to peak file path
+        """
+        y, sr = native if native is not None else (features.y, features.sr)
+        peaks_paths = {}
+        peaks_paths["mix"] = write_peak_file(os.path.join(output_dir, "peaks_mix.bin"), y, sr)
+        
+        for stem, stem_path in (("harmonic", harmonic_path), ("percussive", percussive_path)):
+            y_stem, sr_stem = sf.read(stem_path, dtype='float32')
+            if y_stem.ndim == 2:
+                y_stem = y_stem.mean(axis=1)
+            peaks_paths[stem] = write_peak_file(os.path.join(output_dir, f"peaks_{stem}.bin"), y_stem, sr_stem)
+        
+        return peaks_paths
+    
     def create_audio_with_clicks(self, audio_path, harmonic_path, percussive_path, beats, downbeats, output_dir=None):
         """
         Generate audio files with audible clicks at the detected beat positions
         
+        The tracks are read, mixed with the clicks and written block by block,
+        so memory use does not grow with the duration of the audio.
+        
         Args:
             audio_path: Path to the original audio file
             harmonic_path: Path to the harmonic component audio
@@ -387,55 +743,64 @@ class BeatDetector:
         percussive_with_clicks_path = os.path.join(output_dir, f"{base_name}_percussive_with_clicks.wav")
         clicks_only_path = os.path.join(output_dir, f"{base_name}_clicks_only.wav")
         
+        decoded_path = None
         try:
-            # Load all audio files
-            y_full, sr = librosa.load(audio_path, sr=None)
-            y_harmonic, _ = librosa.load(harmonic_path, sr=None)
-            y_percussive, _ = librosa.load(percussive_path, sr=None)
-            
-            # Create a clicks-only track using librosa.clicks
-            # For regular beats (frequency 1000 Hz)
-            regular_beats_clicks = librosa.clicks(
-                times=beats, 
-                sr=sr, 
-                click_freq=1000, 
-                length=len(y_full)
-            )
-            
-            # For downbeats (frequency 1500 Hz)
-            downbeats_clicks = librosa.clicks(
-                times=downbeats, 
-                sr=sr, 
-                click_freq=1500, 
-                length=len(y_full)
-            )
-            
-            # Combine all clicks
-            y_clicks_only = regular_beats_clicks + downbeats_clicks
-            
-            # Normalize clicks-only audio
-            y_clicks_only = librosa.util.normalize(y_clicks_only) * 0.8
-            
-            # Normalize audio files to avoid excessive clipping when adding clicks
-            y_full = librosa.util.normalize(y_full) * 0.7  
-            y_harmonic = librosa.util.normalize(y_harmonic) * 0.7
-            y_percussive = librosa.util.normalize(y_percussive) * 0.7
-            
-            # Add clicks to each audio track
-            y_full_clicks = y_full + y_clicks_only
-            y_harmonic_clicks = y_harmonic + y_clicks_only
-            y_percussive_clicks = y_percussive + y_clicks_only
-            
-            # Normalize output to avoid clipping
-            y_full_clicks = np.clip(y_full_clicks, -1.0, 1.0)
-            y_harmonic_clicks = np.clip(y_harmonic_clicks, -1.0, 1.0)
-            y_percussive_clicks = np.clip(y_percussive_clicks, -1.0, 1.0)
-            
-            # Write output files
-            sf.write(audio_with_clicks_path, y_full_clicks, sr)
-            sf.write(harmonic_with_clicks_path, y_harmonic_clicks, sr)
-            sf.write(percussive_with_clicks_path, y_percussive_clicks, sr)
-            sf.write(clicks_only_path, y_clicks_only, sr)
+            # Tracks are streamed block by block; formats libsndfile cannot read are decoded once
+            try:
+                info = sf.info(audio_path)
+            except RuntimeError:
+                y_full, sr = librosa.load(audio_path, sr=None)
+                decoded_path = os.path.join(output_dir, f"{base_name}_decoded.wav")
+                sf.write(decoded_path, y_full, sr)
+                del y_full
+                info = sf.info(decoded_path)
+            sr, num_frames = info.samplerate, info.frames
+            
+            sources = {
+                audio_with_clicks_path: decoded_path or audio_path,
+                harmonic_with_clicks_path: harmonic_path,
+                percussive_with_clicks_path: percussive_path
+            }
+            for source in (harmonic_path, percussive_path):
+                stem_sr = sf.info(source).samplerate
+                if stem_sr != sr:
+                    raise ValueError(f"{source} has sample rate {stem_sr}Hz, expected {sr}Hz")
+            
+            # Clicks for regular beats at 1000 Hz and for downbeats at 1500 Hz
+            beat_click = make_click(sr, BEAT_CLICK_FREQ)
+            downbeat_click = make_click(sr, DOWNBEAT_CLICK_FREQ)
+            beat_frames = np.sort(librosa.time_to_samples(np.asarray(beats, dtype=float), sr=sr))
+            downbeat_frames = np.sort(librosa.time_to_samples(np.asarray(downbeats, dtype=float), sr=sr))
+            
+            def render_clicks(start, length):
+                block = np.zeros(length, dtype=np.float32)
+                add_clicks(block, start, beat_frames, beat_click)
+                add_clicks(block, start, downbeat_frames, downbeat_click)
+                return block
+            
+            # First pass: peaks of every track, so the clicks are normalized to 0.8 and
+            # the audio tracks to 0.7 to avoid excessive clipping when adding clicks
+            click_peak = click_track_peak(num_frames, beat_frames, downbeat_frames, beat_click, downbeat_click)
+            click_gain = 0.8 / click_peak if click_peak > 0 else 0.8
+            gains = {}
+            for output_path, source in sources.items():
+                peak = peak_amplitude(source)
+                gains[output_path] = 0.7 / peak if peak > 0 else 0.7
+            
+            # Second pass: add the clicks to each block of each track and append it to the outputs
+            with ExitStack() as stack:
+                readers = {output_path: stack.enter_context(sf.SoundFile(source))
+                           for output_path, source in sources.items()}
+                writers = {output_path: stack.enter_context(sf.SoundFile(output_path, "w", sr, 1))
+                           for output_path in (*sources, clicks_only_path)}
+                for start in range(0, num_frames, BLOCK_FRAMES):
+                    y_clicks_only = click_gain * render_clicks(start, min(BLOCK_FRAMES, num_frames - start))
+                    writers[clicks_only_path].write(y_clicks_only)
+                    for output_path, reader in readers.items():
+                        block = reader.read(len(y_clicks_only), dtype="float32", always_2d=True).mean(axis=1)
+                        block = gains[output_path] * block + y_clicks_only[:len(block)]
+                        # Clip the output to avoid wrapping around
+                        writers[output_path].write(np.clip(block, -1.0, 1.0))
             
             logger.info(f"Successfully generated audio files with clicks")
             
@@ -455,8 +820,11 @@ class BeatDetector:
                 "percussive_with_clicks": None,
                 "clicks_only": None
             }
+        finally:
+            if decoded_path and os.path.exists(decoded_path):
+                os.remove(decoded_path)
             
-    def analyze_video(self, youtube_url_or_audio_path, progress_callback=None, use_audio_path=False):
+    def analyze_video(self, youtube_url_or_audio_path, progress_callback=None, use_audio_path=False, cancel_token=None):
         """
         Analyze a YouTube video or local audio file to detect beats
         
@@ -464,16 +832,24 @@ class BeatDetector:
             youtube_url_or_audio_path: Either a YouTube URL or local audio file path
             progress_callback: Optional callback for progress updates
             use_audio_path: If True, treat the input as a local audio file path
+            cancel_token: Optional CancellationToken, checked between stages
             
         Returns:
             Dictionary with analysis results
+            
+        Raises:
+            JobCancelled: If the token was cancelled during the analysis
         """
+        def check_cancelled():
+            if cancel_token:
+                cancel_token.check()
+        
         logger.info(f"Starting analysis for {'local audio file' if use_audio_path else 'YouTube URL'}")
         start_time = time.time()
         
         try:
             # Create temporary directory for processing
-            temp_dir = tempfile.mkdtemp()
+            temp_dir = make_temp_workspace()
             logger.info(f"Created temporary directory: {temp_dir}")
             
             if progress_callback:
@@ -493,53 +869,19 @@ class BeatDetector:
                     progress_callback(15, "Downloading audio from YouTube...")
                 
                 try:
-                    # Use a timeout for audio download
-                    # This approach works across platforms
+                    # The download runs in a separate process that is killed
+                    # on timeout or cancellation
                     timeout_seconds = 180  # 3 minutes timeout
-                    
-                    import threading
-                    download_completed = False
-                    download_exception = None
-                    audio_file_result = [None]  # Use a list to store the result from the thread
-                    
-                    def download_thread():
-                        nonlocal download_completed
-                        try:
-                            audio_file_result[0] = self.download_audio(youtube_url_or_audio_path, temp_dir)
-                            download_completed = True
-                        except Exception as e:
-                            nonlocal download_exception
-                            download_exception = e
-                    
-                    # Start download in a separate thread
-                    thread = threading.Thread(target=download_thread)
-                    thread.daemon = True  # Make sure thread doesn't block program exit
-                    thread.start()
-                    
-                    # Wait for the download to complete or timeout
-                    start_wait = time.time()
-                    while not download_completed and time.time() - start_wait < timeout_seconds:
-                        # Check if there was an exception
-                        if download_exception:
-                            raise download_exception
-                        # Sleep a bit to avoid busy waiting
-                        time.sleep(0.5)
-                        # Update progress occasionally
-                        if progress_callback and int(time.time()) % 5 == 0:
-                            elapsed = time.time() - start_wait
-                            progress_callback(15, f"Downloading audio... ({int(elapsed)}s elapsed)")
-                    
-                    # If download didn't complete in time
-                    if not download_completed:
-                        logger.error(f"Download timed out after {timeout_seconds} seconds")
-                        if progress_callback:
-                            progress_callback(15, f"Download timed out after {timeout_seconds} seconds")
-                        raise TimeoutError(f"Audio download timed out after {timeout_seconds} seconds")
-                    
-                    # Get the result from the thread
-                    audio_file = audio_file_result[0]
+                    with self.stage_timer("download"):
+                        audio_file = self.download_audio(
+                            youtube_url_or_audio_path, temp_dir,
+                            timeout=timeout_seconds, cancel_token=cancel_token
+                        )
                     logger.info(f"Audio successfully downloaded to: {audio_file}")
                     
+                except JobCancelled:
+                    logger.info("Audio download cancelled")
+                    raise
                 except TimeoutError as te:
                     logger.error(f"Timeout while downloading audio: {str(te)}")
                     if progress_callback:
@@ -555,15 +897,20 @@ class BeatDetector:
                 if progress_callback:
                     progress_callback(25, "Audio downloaded, preparing for processing...")
             
+            check_cancelled()
+            
             # Get audio duration
             logger.info("Loading audio file to get duration...")
             if progress_callback:
                 progress_callback(30, "Analyzing audio characteristics...")
             
             try:
-                y, sr = librosa.load(audio_file, sr=None)
-                duration = librosa.get_duration(y=y, sr=sr)
-                logger.info(f"Audio duration: {duration:.2f} seconds, Sample rate: {sr}Hz")
+                # Spectral features are computed once at the analysis rate and shared by all later stages
+                with self.stage_timer("decode"):
+                    native, features = self.load_audio(audio_file)
+                    duration = librosa.get_duration(y=native[0], sr=native[1])
+                logger.info(f"Audio duration: {duration:.2f} seconds, Sample rate: {native[1]}Hz, "
+                            f"analysis rate: {features.sr}Hz")
             except Exception as e:
                 logger.error(f"Error analyzing audio file: {str(e)}")
                 logger.error(traceback.format_exc())
@@ -571,13 +918,16 @@ class BeatDetector:
                     progress_callback(30, f"Error analyzing audio: {str(e)}")
                 raise
             
+            check_cancelled()
+            
             # Separate audio
             logger.info("Starting audio component separation...")
             if progress_callback:
                 progress_callback(40, "Separating audio components...")
             
             try:
-                harmonic_file, percussive_file = self.separate_audio(audio_file, progress_callback)
+                with self.stage_timer("separation"):
+                    harmonic_file, percussive_file = self.separate_audio(audio_file, progress_callback, features, native)
                 logger.info(f"Audio separated successfully into: \n- Harmonic: {harmonic_file} \n- Percussive: {percussive_file}")
             except Exception as e:
                 logger.error(f"Error separating audio: {str(e)}")
@@ -586,13 +936,21 @@ class BeatDetector:
                     progress_callback(45, f"Error separating audio: {str(e)}")
                 raise
             
+            check_cancelled()
+            
             # Detect beats - using the ML-based method
             logger.info("Starting beat detection with ML model...")
             if progress_callback:
                 progress_callback(55, "Detecting beats using ML model...")
             
             try:
-                beats, downbeats, tempo = self.detect_beats(harmonic_file, percussive_file, audio_file)
+                # HPSS stems exist at the analysis rate in the feature store already
+                percussive_signal = None
+                if self.separator_type == "hpss" and self.analysis_sr:
+                    percussive_signal = (features.hpss(HPSS_MARGIN)[1], features.sr)
+                with self.stage_timer("beat_inference"):
+                    beats, downbeats, tempo = self.detect_beats(harmonic_file, percussive_file, audio_file,
+                                                                percussive_signal)
                 logger.info(f"Beat detection completed. Found {len(beats)} regular beats and {len(downbeats)} downbeats")
                 if progress_callback:
                     progress_callback(70, f"Found {len(beats)} beats, tempo: {tempo:.1f} BPM")
@@ -603,47 +961,87 @@ class BeatDetector:
                     progress_callback(60, f"Error detecting beats: {str(e)}")
                 raise
             
-            # Create visualization
-            logger.info("Creating waveform visualization...")
+            check_cancelled()
+            
+            # Create peak pyramids for the waveform API
+            logger.info("Creating waveform peak pyramids...")
             if progress_callback:
-                progress_callback(75, "Generating waveform visualization...")
+                progress_callback(72, "Generating waveform peaks...")
             
             try:
-                waveform_path = os.path.join(temp_dir, "waveform.png")
-                waveform_base64 = self.create_waveform_visualization(audio_file, beats, downbeats, waveform_path)
-                logger.info("Waveform visualization created successfully")
-                if progress_callback:
-                    progress_callback(80, "Waveform visualization complete")
+                with self.stage_timer("waveform_peaks"):
+                    peaks_paths = self.create_waveform_peaks(harmonic_file, percussive_file, temp_dir, features, native)
+                logger.info("Waveform peak pyramids created successfully")
             except Exception as e:
-                logger.error(f"Error creating waveform visualization: {str(e)}")
+                logger.error(f"Error creating waveform peaks: {str(e)}")
                 logger.error(traceback.format_exc())
-                # Continue with processing even if visualization fails
-                waveform_base64 = ""
+                # Continue with processing even if the peaks fail
+                peaks_paths = {}
+            
+            check_cancelled()
+            
+            # Create visualization
+            waveform_image_path = None
+            if self.render_waveform_image:
+                logger.info("Creating waveform visualization...")
                 if progress_callback:
-                    progress_callback(80, "Waveform visualization failed, continuing with processing")
+                    progress_callback(75, "Generating waveform visualization...")
+                
+                try:
+                    waveform_path = os.path.join(temp_dir, "waveform.png")
+                    with self.stage_timer("visualization"):
+                        waveform_image_path = self.create_waveform_visualization(audio_file, beats, downbeats, waveform_path, features)
+                    logger.info("Waveform visualization created successfully")
+                    if progress_callback:
+                        progress_callback(80, "Waveform visualization complete")
+                except Exception as e:
+                    logger.error(f"Error creating waveform visualization: {str(e)}")
+                    logger.error(traceback.format_exc())
+                    # Continue with processing even if visualization fails
+                    waveform_image_path = None
+                    if progress_callback:
+                        progress_callback(80, "Waveform visualization failed, continuing with processing")
             
-            # Create audio with clicks
-            logger.info("Generating audio tracks with beats marked by clicks...")
-            if progress_callback:
-                progress_callback(85, "Adding click track to audio...")
+            # Persist the spectral features next to the other artifacts for later re-renders
+            features_path = None
+            if self.persist_features:
+                try:
+                    features_path = features.save(os.path.join(temp_dir, "features.npz"))
+                except Exception as e:
+                    logger.error(f"Error saving spectral features: {str(e)}")
+                    logger.error(traceback.format_exc())
             
-            try:
-                audio_files = self.create_audio_with_clicks(audio_file, harmonic_file, percussive_file, beats, downbeats, temp_dir)
-                logger.info("Audio with clicks generated successfully")
-            except Exception as e:
-                logger.error(f"Error generating audio with clicks: {str(e)}")
-                logger.error(traceback.format_exc())
-                # Create a default audio_files dict with None values
-                audio_files = {
-                    "audio_with_clicks": None,
-                    "harmonic_with_clicks": None,
-                    "percussive_with_clicks": None,
-                    "clicks_only": None
-                }
+            check_cancelled()
+            
+            # Create audio with clicks, unless the players stream them from the mixer
+            if not self.render_click_tracks:
+                logger.info("Skipping pre-mixed click tracks, they are mixed on request")
+                audio_files = dict.fromkeys(("audio_with_clicks", "harmonic_with_clicks",
+                                             "percussive_with_clicks", "clicks_only"))
+            else:
+                logger.info("Generating audio tracks with beats marked by clicks...")
                 if progress_callback:
-                    progress_callback(85, "Error generating audio with clicks, continuing with partial results")
+                    progress_callback(85, "Adding click track to audio...")
+                
+                try:
+                    with self.stage_timer("click_rendering"):
+                        audio_files = self.create_audio_with_clicks(audio_file, harmonic_file, percussive_file, beats, downbeats, temp_dir)
+                    logger.info("Audio with clicks generated successfully")
+                except Exception as e:
+                    logger.error(f"Error generating audio with clicks: {str(e)}")
+                    logger.error(traceback.format_exc())
+                    # Create a default audio_files dict with None values
+                    audio_files = {
+                        "audio_with_clicks": None,
+                        "harmonic_with_clicks": None,
+                        "percussive_with_clicks": None,
+                        "clicks_only": None
+                    }
+                    if progress_callback:
+                        progress_callback(85, "Error generating audio with clicks, continuing with partial results")
             
             # Final completion
+            check_cancelled()
             if progress_callback:
                 progress_callback(95, "Finalizing results...")
             
@@ -663,18 +1061,24 @@ class BeatDetector:
             
             return {
                 "duration": duration,
+                "temp_dir": temp_dir,
                 "tempo": float(tempo),
                 "beats": beats.tolist(),
                 "downbeats": downbeats.tolist() if len(downbeats) > 0 else [],
-                "waveform_image": waveform_base64,
+                "waveform_image_path": waveform_image_path,
                 "harmonic_path": harmonic_file,
                 "percussive_path": percussive_file,
+                "features_path": features_path,
+                "peaks_paths": peaks_paths,
                 "audio_with_clicks": audio_files["audio_with_clicks"],
                 "harmonic_with_clicks": audio_files["harmonic_with_clicks"],
                 "percussive_with_clicks": audio_files["percussive_with_clicks"],
                 "clicks_only": audio_files["clicks_only"]
             }
             
+        except JobCancelled:
+            logger.info("Analysis cancelled")
+            raise
         except Exception as e:
             logger.error(f"Error analyzing video: {str(e)}")
             logger.error(traceback.format_exc())
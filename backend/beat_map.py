@@ -0,0 +1,121 @@
+import struct
+import numpy as np
+
+# Binary beat map served by /api/beats/{video_id}
+#
+# Header (16 bytes, little endian):
+#   magic       4s   b"BMAP"
+#   version     u8   1
+#   codec       u8   CODEC_FLOAT32 or CODEC_VARINT
+#   unit_us     u16  time unit of the varint codec in microseconds (0 for float32)
+#   beats       u32  number of beats
+#   downbeats   u32  number of downbeats
+#
+# Body: the beats followed by the downbeats, ascending, in seconds.
+#   float32: one little-endian float32 per time
+#   varint:  times quantized to unit_us, stored as unsigned LEB128 deltas from
+#            the previous time of the same list (the first from 0)
+MAGIC = b"BMAP"
+VERSION = 1
+CODEC_FLOAT32 = 0
+CODEC_VARINT = 1
+CODECS = {"f32": CODEC_FLOAT32, "varint": CODEC_VARINT}
+HEADER = struct.Struct("<4sBBHII")
+
+# 1 ms is well below the 20 ms frame resolution of beat_this
+DEFAULT_UNIT_US = 1000
+
+def encode_varints(values):
+    """Encode non-negative integers as concatenated unsigned LEB128 varints"""
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return b""
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+
+    out = np.empty(int(lengths.sum()), dtype=np.uint8)
+    starts = np.cumsum(lengths) - lengths
+    for k in range(int(lengths.max())):
+        selected = lengths > k
+        group = (values[selected] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        continuation = (lengths[selected] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[selected] + k] = (group | continuation).astype(np.uint8)
+    return out.tobytes()
+
+def decode_varints(data, count):
+    """
+    Decode the first count LEB128 varints of a buffer
+
+    Returns:
+        Tuple of (uint64 array of values, number of bytes consumed)
+    """
+    if count == 0:
+        return np.zeros(0, dtype=np.uint64), 0
+    raw = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero((raw & 0x80) == 0)
+    if len(ends) < count:
+        raise ValueError("Truncated varint data")
+    ends = ends[:count]
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts + 1
+
+    values = np.zeros(count, dtype=np.uint64)
+    for k in range(int(lengths.max())):
+        selected = lengths > k
+        group = raw[starts[selected] + k].astype(np.uint64) & np.uint64(0x7F)
+        values[selected] |= group << np.uint64(7 * k)
+    return values, int(ends[-1]) + 1
+
+def encode_beat_map(beats, downbeats, codec="varint", unit_us=DEFAULT_UNIT_US):
+    """
+    Encode beat and downbeat times as a binary beat map
+
+    Args:
+        beats: Beat times in seconds
+        downbeats: Downbeat times in seconds
+        codec: "varint" (smallest) or "f32"
+        unit_us: Time resolution of the varint codec in microseconds
+
+    Returns:
+        The beat map as bytes
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown beat map codec: {codec}")
+    lists = [np.sort(np.asarray(times, dtype=np.float64)) for times in (beats, downbeats)]
+
+    if codec == "f32":
+        header = HEADER.pack(MAGIC, VERSION, CODEC_FLOAT32, 0, len(lists[0]), len(lists[1]))
+        return header + b"".join(times.astype("<f4").tobytes() for times in lists)
+
+    header = HEADER.pack(MAGIC, VERSION, CODEC_VARINT, unit_us, len(lists[0]), len(lists[1]))
+    body = []
+    for times in lists:
+        ticks = np.round(np.maximum(times, 0) * (1e6 / unit_us)).astype(np.int64)
+        body.append(encode_varints(np.diff(ticks, prepend=0)))
+    return header + b"".join(body)
+
+def decode_beat_map(data):
+    """
+    Decode a binary beat map
+
+    Returns:
+        Tuple of (beats, downbeats) as float64 arrays of seconds
+    """
+    magic, version, codec, unit_us, num_beats, num_downbeats = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a beat map")
+    body = memoryview(data)[HEADER.size:]
+
+    if codec == CODEC_FLOAT32:
+        times = np.frombuffer(body, dtype="<f4", count=num_beats + num_downbeats).astype(np.float64)
+        return times[:num_beats], times[num_beats:]
+
+    lists = []
+    for count in (num_beats, num_downbeats):
+        deltas, consumed = decode_varints(body, count)
+        lists.append(np.cumsum(deltas).astype(np.float64) * (unit_us / 1e6))
+        body = body[consumed:]
+    return lists[0], lists[1]
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark analysis throughput at 1-8 concurrent jobs, with and without the
+thread budget.
+
+Usage: python bench_concurrency.py path/to/audio.wav [--max-jobs 8]
+
+Each round runs N copies of the same analysis concurrently and reports the
+wall-clock time and the throughput in jobs per minute.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from beat_detector import BeatDetector
+from thread_budget import ThreadBudget, optional_module
+
+def run_job(audio_path, budget):
+    # Every job gets its own copy so separation outputs do not collide
+    work_dir = tempfile.mkdtemp()
+    try:
+        job_audio = os.path.join(work_dir, os.path.basename(audio_path))
+        shutil.copy2(audio_path, job_audio)
+        if budget is None:
+            BeatDetector().analyze_video(job_audio, use_audio_path=True)
+        else:
+            with budget.job_slice():
+                BeatDetector(segment_workers=1).analyze_video(job_audio, use_audio_path=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def run_round(audio_path, concurrency, budgeted):
+    budget = ThreadBudget(concurrency) if budgeted else None
+    torch = optional_module("torch")
+    if not budgeted and torch is not None:
+        # Undo the intra-op limit a previous budgeted round set process-wide
+        torch.set_num_threads(os.cpu_count() or 1)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda _: run_job(audio_path, budget), range(concurrency)))
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("audio", help="Audio file to analyze")
+    parser.add_argument("--max-jobs", type=int, default=8, help="Highest concurrency to test (default: 8)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.audio):
+        sys.exit(f"Audio file not found: {args.audio}")
+
+    print(f"{'jobs':>4} {'mode':>10} {'wall (s)':>10} {'jobs/min':>10}")
+    for concurrency in range(1, args.max_jobs + 1):
+        for budgeted in (False, True):
+            elapsed = run_round(args.audio, concurrency, budgeted)
+            mode = "budgeted" if budgeted else "default"
+            print(f"{concurrency:>4} {mode:>10} {elapsed:>10.1f} {60 * concurrency / elapsed:>10.2f}")
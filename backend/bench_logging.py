@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cost of logging in the calling thread.
+
+Usage: python bench_logging.py [--messages 20000] [--threads 4]
+
+Compares the old per-module setup (a RotatingFileHandler written
+synchronously, f-string messages) with the queue-based setup from
+log_setup, with and without rate limiting of progress messages. Each mode
+emits the same progress messages from several threads and reports the time
+the callers spent in logging calls, plus the time until the listener has
+written everything out.
+"""
+import os
+import time
+import queue
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import logging.handlers
+
+from log_setup import LOG_FORMAT, LazyQueueHandler, RateLimitFilter
+
+def file_handler(log_dir):
+    handler = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, "bench.log"), maxBytes=10*1024*1024, backupCount=5)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return handler
+
+def emit_sync(logger, video_id, i):
+    logger.info(f"Progress update for {video_id}: {i % 100}% - Separating audio")
+
+def emit_lazy(logger, video_id, i):
+    logger.info("Progress update for %s: %s%% - %s", video_id, i % 100, "Separating audio",
+                extra={"rate_limit": "progress"})
+
+def run_mode(mode, messages, threads, log_dir):
+    logger = logging.getLogger(f"bench.{mode}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    listener = None
+    if mode == "sync":
+        logger.addHandler(file_handler(log_dir))
+        emit = emit_sync
+    else:
+        log_queue = queue.SimpleQueue()
+        handler = LazyQueueHandler(log_queue)
+        # Rate limiting off for the plain queue mode
+        handler.addFilter(RateLimitFilter({"progress": 2.0 if mode == "queue+rate" else 0}))
+        logger.addHandler(handler)
+        listener = logging.handlers.QueueListener(log_queue, file_handler(log_dir))
+        listener.start()
+        emit = emit_lazy
+
+    caller_seconds = [0.0] * threads
+
+    def worker(index):
+        video_id = f"video{index:02d}"
+        start = time.perf_counter()
+        for i in range(messages // threads):
+            emit(logger, video_id, i)
+        caller_seconds[index] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    if listener is not None:
+        listener.stop()
+    total = time.perf_counter() - start
+
+    for handler in logger.handlers[:]:
+        handler.close()
+        logger.removeHandler(handler)
+    return max(caller_seconds), total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000, help="Messages per mode (default: 20000)")
+    parser.add_argument("--threads", type=int, default=4, help="Logging threads (default: 4)")
+    args = parser.parse_args()
+
+    print(f"{'mode':>12} {'caller (s)':>11} {'us/call':>9} {'drained (s)':>12}")
+    for mode in ("sync", "queue", "queue+rate"):
+        log_dir = tempfile.mkdtemp()
+        try:
+            caller, total = run_mode(mode, args.messages, args.threads, log_dir)
+        finally:
+            shutil.rmtree(log_dir, ignore_errors=True)
+        per_call = 1e6 * caller / (args.messages // args.threads)
+        print(f"{mode:>12} {caller:>11.3f} {per_call:>9.1f} {total:>12.3f}")
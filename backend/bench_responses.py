@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark encoding a completed analysis result for a progress poll.
+
+Usage: python bench_responses.py [--minutes 60] [--bpm 128]
+
+Builds a synthetic result for a mix of the given length and compares the
+old response path (jsonable_encoder + json.dumps) with the fast JSON
+serializer, compressed variants, and the binary beat map. It then sends the
+progress, batch progress and storage report bodies through
+CompressionMiddleware, as every JSON endpoint is served. It reports the
+time per encode and the size on the wire.
+"""
+import time
+import asyncio
+import argparse
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from beat_map import encode_beat_map, decode_beat_map
+from response_encoding import (dumps, compress, FastJSONResponse, CompressionMiddleware,
+                               ORJSON_AVAILABLE, BROTLI_AVAILABLE)
+
+def synthetic_result(minutes, bpm):
+    # beat_this reports times on a 50 fps frame grid
+    period = 60.0 / bpm
+    frames = np.round(np.arange(0, minutes * 60, period) * 50 + np.random.randint(-1, 2, int(np.ceil(minutes * 60 / period))))
+    beats = (np.maximum(frames, 0) / 50.0).tolist()
+    downbeats = beats[::4]
+    video_id = "dQw4w9WgXcQ"
+    return {
+        "videoId": video_id,
+        "duration": minutes * 60.0,
+        "beats": beats,
+        "downbeats": downbeats,
+        "steps": [{"start": i * 30.0, "end": (i + 1) * 30.0, "description": f"Step {i + 1}"} for i in range(minutes * 2)],
+        "tempo": float(bpm),
+        "audio_with_clicks_url": f"/static/{video_id}/audio_with_clicks.wav",
+        "waveform_image_url": f"/static/{video_id}/waveform-0123456789abcdef.png",
+        "waveform_peaks_url": f"/api/waveform/{video_id}",
+        "beat_map_url": f"/api/beats/{video_id}",
+        "video_url": f"/static/{video_id}/video.mp4",
+        "completed": True,
+    }
+
+def synthetic_batch(videos):
+    # Shape of GET /api/batch/{batch_id} for a playlist mid-way through
+    return {
+        "batchId": "0123456789abcdef",
+        "total": videos,
+        "counts": {"queued": videos // 2, "running": 2, "completed": videos - videos // 2 - 2, "failed": 0, "cancelled": 0},
+        "progress": 50.0,
+        "done": False,
+        "elapsed_seconds": 120.0,
+        "median_seconds_to_result": 42.0,
+        "videos": [{"videoId": f"video{i:06d}", "state": "queued", "progress": 0,
+                    "status_message": "Waiting in queue"} for i in range(videos)],
+        "rejected": [],
+        "queue": {"queued": videos // 2, "running": 2, "workers": 2},
+    }
+
+def synthetic_storage(videos):
+    # Shape of GET /api/storage with most of the library over budget
+    return {
+        "videos": videos,
+        "total_bytes": videos * 250_000_000,
+        "budget_bytes": 50_000_000_000,
+        "over_budget_bytes": max(videos * 250_000_000 - 50_000_000_000, 0),
+        "evictable_videos": [f"video{i:06d}" for i in range(videos)],
+        "reclaimable_bytes": videos * 250_000_000,
+        "orphaned_temp_workspaces": 0,
+        "orphaned_temp_bytes": 0,
+    }
+
+def serve_json(content, accept_encoding):
+    """Send content through CompressionMiddleware and return the body on the wire"""
+    app = CompressionMiddleware(FastJSONResponse(content))
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    chunks = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    asyncio.run(app(scope, receive, send))
+    return b"".join(chunks)
+
+def measure(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body = func()
+    return (time.perf_counter() - start) / repeat, body
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--minutes", type=int, default=60, help="Length of the synthetic mix (default: 60)")
+    parser.add_argument("--bpm", type=float, default=128, help="Tempo of the synthetic mix (default: 128)")
+    parser.add_argument("--repeat", type=int, default=50, help="Encodes per measurement (default: 50)")
+    args = parser.parse_args()
+
+    result = synthetic_result(args.minutes, args.bpm)
+    print(f"{len(result['beats'])} beats, {len(result['downbeats'])} downbeats; "
+          f"orjson {'on' if ORJSON_AVAILABLE else 'off'}, brotli {'on' if BROTLI_AVAILABLE else 'off'}")
+
+    fast = dumps(result)
+    cases = [
+        ("jsonable_encoder + json (old)", lambda: JSONResponse(content=jsonable_encoder(result)).body),
+        ("json.dumps", lambda: JSONResponse(content=result).body),
+        ("fast dumps", lambda: dumps(result)),
+        ("fast dumps + gzip", lambda: compress(dumps(result), "gzip")[0]),
+    ]
+    if BROTLI_AVAILABLE:
+        cases.append(("fast dumps + br", lambda: compress(dumps(result), "br")[0]))
+    cases += [
+        ("cached body (per version)", lambda: fast),
+        ("beat map f32", lambda: encode_beat_map(result["beats"], result["downbeats"], "f32")),
+        ("beat map varint", lambda: encode_beat_map(result["beats"], result["downbeats"], "varint")),
+    ]
+
+    print(f"{'path':>30} {'ms/encode':>10} {'bytes':>10}")
+    for name, func in cases:
+        seconds, body = measure(func, args.repeat)
+        print(f"{name:>30} {1000 * seconds:>10.3f} {len(body):>10}")
+
+    beats, downbeats = decode_beat_map(encode_beat_map(result["beats"], result["downbeats"], "varint"))
+    error = np.abs(beats - np.array(result["beats"])).max()
+    print(f"varint round-trip max error: {1000 * error:.3f} ms")
+
+    print(f"\n{'endpoint (middleware)':>30} {'ms/response':>11} {'bytes':>10}")
+    endpoints = [
+        ("progress", result),
+        ("batch progress", synthetic_batch(args.minutes * 5)),
+        ("storage report", synthetic_storage(args.minutes * 5)),
+    ]
+    for name, content in endpoints:
+        for accept_encoding in ["identity", "gzip"] + (["br"] if BROTLI_AVAILABLE else []):
+            seconds, body = measure(lambda: serve_json(content, accept_encoding), args.repeat)
+            print(f"{name + ' ' + accept_encoding:>30} {1000 * seconds:>11.3f} {len(body):>10}")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark time-to-result of arrival-order and shortest-job-first scheduling.
+
+Usage: python bench_scheduling.py [--scale 0.002] [--analysis-workers 2] [--aging-rate 1.0]
+
+Runs mixed-length workloads through the real AnalysisQueue with synthetic
+stages that sleep in proportion to the media duration (at the default cost
+rates of job_scheduling, compressed by --scale), once in arrival order and
+once shortest job first with aging. Reports the median, 95th percentile and
+worst time-to-result in video seconds of real time, i.e. unscaled.
+"""
+import time
+import random
+import argparse
+import statistics
+import threading
+
+from job_queue import AnalysisJob, AnalysisQueue
+from job_scheduling import CostModel, DOWNLOAD_STAGES
+
+def livestream_first():
+    """A 45-minute livestream recording submitted just before ten 3-minute songs, behind a backlog"""
+    backlog = [(0.0, 200 + 10 * i) for i in range(6)]
+    return backlog + [(1.0, 45 * 60)] + [(2.0 + i, 180 + 10 * i) for i in range(10)]
+
+def mixed_stream(jobs=60, seed=0):
+    """Songs with a sprinkling of long recordings, arriving every 30 s on average"""
+    rng = random.Random(seed)
+    arrivals, now = [], 0.0
+    for _ in range(jobs):
+        now += rng.expovariate(1 / 30)
+        duration = rng.uniform(20, 60) * 60 if rng.random() < 0.1 else rng.uniform(120, 300)
+        arrivals.append((now, duration))
+    return arrivals
+
+def run_workload(arrivals, aging_rate, scale, analysis_workers):
+    """Seconds to result of each job, in unscaled time"""
+    model = CostModel()
+    finished = {}
+    lock = threading.Lock()
+
+    def prepare(job):
+        time.sleep(job.duration * model.rate("download") * scale)
+
+    def run(job):
+        time.sleep(job.duration * model.rate("analysis") * scale)
+        with lock:
+            finished[job.video_id] = time.time()
+
+    queue = AnalysisQueue(prepare, run, download_workers=3, analysis_workers=analysis_workers,
+                          prefetch=2, aging_rate=aging_rate)
+    start = time.time()
+    submitted = {}
+    for i, (arrival, duration) in enumerate(arrivals):
+        time.sleep(max(0.0, start + arrival * scale - time.time()))
+        video_id = f"video{i:03d}"
+        # Estimates are in scaled seconds, like the submission times they are compared with
+        job = AnalysisJob(video_id, "", estimated_seconds=model.estimate(duration, DOWNLOAD_STAGES) * scale)
+        job.duration = duration
+        submitted[video_id] = job.submitted_at
+        queue.submit(job)
+    while len(finished) < len(arrivals):
+        time.sleep(0.01)
+    return [(finished[video_id] - submitted[video_id]) / scale for video_id in sorted(submitted)]
+
+def summarize(name, seconds):
+    ordered = sorted(seconds)
+    p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+    print(f"{name:>28} {statistics.median(ordered):>10.0f} {p95:>10.0f} {ordered[-1]:>10.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=0.002, help="Real seconds per simulated second (default: 0.002)")
+    parser.add_argument("--analysis-workers", type=int, default=2, help="Concurrent analyses (default: 2)")
+    parser.add_argument("--aging-rate", type=float, default=1.0, help="Aging of the SJF runs (default: 1.0)")
+    args = parser.parse_args()
+
+    workloads = {"livestream + 10 songs": livestream_first(), "mixed stream of 60": mixed_stream()}
+    print(f"{'workload / policy':>28} {'p50 s':>10} {'p95 s':>10} {'max s':>10}")
+    for name, arrivals in workloads.items():
+        for policy, aging_rate in (("fifo", None), ("sjf", args.aging_rate)):
+            summarize(f"{name} {policy}", run_workload(arrivals, aging_rate, args.scale, args.analysis_workers))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark time-to-first-frame and seek latency of the progressive MP4 and
+the HLS renditions of an analyzed video.
+
+Usage: python bench_video.py VIDEO_ID [--base-url http://localhost:7081] [--seeks 20]
+
+ffmpeg stands in for the player: it opens the stream over HTTP like a
+browser would (range requests into the MP4, playlist + init + segment for
+HLS) and decodes one frame. Time-to-first-frame opens at 0; seeks open at
+downbeats from the analysis, where dancers loop steps. Run it through the
+production proxy or a throttled link to see network effects.
+"""
+import json
+import time
+import random
+import argparse
+import statistics
+import subprocess
+import urllib.request
+from urllib.parse import urljoin
+
+def fetch_json(url):
+    with urllib.request.urlopen(url) as response:
+        return json.load(response)
+
+def hls_variants(master_url):
+    """Map rung name to variant playlist URL from an HLS master playlist"""
+    with urllib.request.urlopen(master_url) as response:
+        lines = response.read().decode().splitlines()
+    variants = {}
+    for line in lines:
+        if line and not line.startswith("#"):
+            variants[line.split("/")[0]] = urljoin(master_url, line)
+    return variants
+
+def first_frame_seconds(url, position):
+    """Wall-clock seconds for ffmpeg to open url at position and decode one frame"""
+    command = ["ffmpeg", "-v", "error", "-nostdin", "-ss", f"{position:.3f}", "-i", url,
+               "-map", "0:v:0", "-frames:v", "1", "-f", "null", "-"]
+    start = time.perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("video_id", help="ID of an analyzed video")
+    parser.add_argument("--base-url", default="http://localhost:7081", help="Backend URL (default: http://localhost:7081)")
+    parser.add_argument("--seeks", type=int, default=20, help="Seek positions to measure (default: 20)")
+    parser.add_argument("--repeat", type=int, default=3, help="Openings at 0 for time-to-first-frame (default: 3)")
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip("/")
+    result = fetch_json(f"{base_url}/api/progress/{args.video_id}")
+    if not result.get("video_url"):
+        raise SystemExit(f"No local video for {args.video_id}")
+
+    sources = {"mp4": base_url + result["video_url"]}
+    if result.get("hls_url"):
+        for name, url in hls_variants(base_url + result["hls_url"]).items():
+            sources[f"hls {name}"] = url
+    else:
+        print("No HLS renditions for this video; measuring the MP4 only")
+
+    positions = result.get("downbeats") or result.get("beats") or []
+    duration = result.get("duration") or 0
+    positions = [t for t in positions if t < duration - 5] or [0.0]
+    random.seed(0)
+    seeks = random.sample(positions, min(args.seeks, len(positions)))
+
+    print(f"{'source':>12} {'ttff ms':>10} {'seek p50 ms':>12} {'seek p95 ms':>12}")
+    for name, url in sources.items():
+        ttff = statistics.median(first_frame_seconds(url, 0.0) for _ in range(args.repeat))
+        seek_times = sorted(first_frame_seconds(url, t) for t in seeks)
+        p95 = seek_times[min(len(seek_times) - 1, int(0.95 * len(seek_times)))]
+        print(f"{name:>12} {1000 * ttff:>10.0f} {1000 * statistics.median(seek_times):>12.0f} {1000 * p95:>12.0f}")
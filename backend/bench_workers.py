@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark job throughput of the durable queue with 1-N worker processes.
+
+Usage: python bench_workers.py [--max-workers 4] [--jobs 40] [--job-seconds 0.5] [--kind sleep|cpu]
+
+Every round queues the given number of synthetic jobs in a fresh queue
+file and lets N worker processes drain it. "sleep" jobs isolate the
+queue's own overhead (claims, heartbeats, progress writes); "cpu" jobs
+burn a core each, so they scale only up to the number of cores. Reports
+the jobs per minute and the speedup over one worker.
+"""
+import os
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+from durable_queue import DurableQueue, QueueWorker
+
+# Progress records each synthetic job publishes, like a short analysis
+PROGRESS_UPDATES = 20
+
+def burn(hashes):
+    data = b"x" * 65536
+    for _ in range(hashes):
+        data = hashlib.sha256(data).digest() * 2048
+
+def hashes_per_second():
+    """Calibrate the cpu jobs, so one takes --job-seconds on an idle core"""
+    start = time.perf_counter()
+    burn(200)
+    return 200 / (time.perf_counter() - start)
+
+def synthetic_job(queue, job, kind, seconds, rate):
+    for step in range(PROGRESS_UPDATES):
+        if kind == "cpu":
+            # A fixed amount of work, which takes longer when workers share a core
+            burn(int(rate * seconds / PROGRESS_UPDATES))
+        else:
+            time.sleep(seconds / PROGRESS_UPDATES)
+        queue.publish_progress(job["video_id"], {"progress": step * 100 // PROGRESS_UPDATES, "status_message": "Working"})
+
+def worker_process(queue_path, kind, seconds, rate, ready, stop_when_empty):
+    queue = DurableQueue(queue_path)
+
+    def start_job(job, cancel_token, done):
+        def run():
+            synthetic_job(queue, job, kind, seconds, rate)
+            done("completed")
+        threading.Thread(target=run, daemon=True).start()
+
+    worker = QueueWorker(queue, start_job, capacity=1, poll_seconds=0.05, heartbeat_seconds=1.0)
+    threading.Thread(target=lambda: (stop_when_empty.wait(), worker.stop()), daemon=True).start()
+    ready.release()
+    worker.run()
+
+def run_round(workers, jobs, kind, seconds, rate):
+    work_dir = tempfile.mkdtemp()
+    try:
+        queue_path = os.path.join(work_dir, "jobs.sqlite3")
+        queue = DurableQueue(queue_path)
+
+        # Process startup is not part of the measurement: queue the jobs once every worker polls
+        context = multiprocessing.get_context("spawn")
+        ready = context.Semaphore(0)
+        stop = context.Event()
+        processes = [context.Process(target=worker_process, args=(queue_path, kind, seconds, rate, ready, stop))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.acquire()
+        start = time.perf_counter()
+        for i in range(jobs):
+            queue.enqueue(f"video{i:05d}")
+        while queue.stats()["completed"] < jobs:
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        for process in processes:
+            process.join()
+        return elapsed
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-workers", type=int, default=4, help="Largest number of worker processes (default: 4)")
+    parser.add_argument("--jobs", type=int, default=40, help="Jobs per round (default: 40)")
+    parser.add_argument("--job-seconds", type=float, default=0.5, help="Duration of one job (default: 0.5)")
+    parser.add_argument("--kind", choices=("sleep", "cpu"), default="sleep", help="Synthetic job type (default: sleep)")
+    args = parser.parse_args()
+
+    print(f"{args.jobs} {args.kind} jobs of {args.job_seconds}s, {os.cpu_count()} cores")
+    print(f"{'workers':>8} {'seconds':>8} {'jobs/min':>9} {'speedup':>8}")
+    rate = hashes_per_second() if args.kind == "cpu" else None
+    baseline = None
+    workers = 1
+    while workers <= args.max_workers:
+        elapsed = run_round(workers, args.jobs, args.kind, args.job_seconds, rate)
+        throughput = 60 * args.jobs / elapsed
+        baseline = baseline or throughput
+        print(f"{workers:>8} {elapsed:>8.2f} {throughput:>9.1f} {throughput / baseline:>7.2f}x")
+        workers *= 2
@@ -0,0 +1,249 @@
+import re
+import struct
+import logging
+from contextlib import ExitStack, contextmanager
+import numpy as np
+import soundfile as sf
+
+# Child of the backend logger, so messages end up in backend.log
+logger = logging.getLogger('backend.click_mixer')
+
+# Click sounds match librosa.clicks defaults, also used by BeatDetector.create_audio_with_clicks
+BEAT_CLICK_FREQ = 1000
+DOWNBEAT_CLICK_FREQ = 1500
+CLICK_DURATION = 0.1
+
+# Frames rendered per streamed chunk
+BLOCK_FRAMES = 65536
+
+# 16-bit mono PCM
+SAMPLE_WIDTH = 2
+WAV_HEADER_SIZE = 44
+
+def make_click(sr, freq, duration=CLICK_DURATION):
+    """Exponentially decaying sine click, identical to the one librosa.clicks synthesizes"""
+    angular_freq = 2 * np.pi * freq / float(sr)
+    click = np.logspace(0, -10, num=int(np.round(sr * duration)), base=2.0)
+    click *= np.sin(angular_freq * np.arange(len(click)))
+    return click.astype(np.float32)
+
+def add_clicks(out, start, click_frames, click, gain=1.0):
+    """
+    Add every click overlapping frames [start, start + len(out)) into out
+
+    Args:
+        out: Block to add the clicks to, in place
+        start: First frame of the block
+        click_frames: Sorted click positions in frames
+        click: Click sound, see make_click
+        gain: Linear gain of the clicks
+    """
+    end = start + len(out)
+    lo = np.searchsorted(click_frames, start - len(click), side="right")
+    hi = np.searchsorted(click_frames, end, side="left")
+    for position in click_frames[lo:hi]:
+        src_start = max(start - position, 0)
+        dst_start = max(position - start, 0)
+        n = min(len(click) - src_start, len(out) - dst_start)
+        out[dst_start:dst_start + n] += gain * click[src_start:src_start + n]
+
+def click_track_peak(num_frames, beat_frames, downbeat_frames, beat_click, downbeat_click, block_frames=BLOCK_FRAMES):
+    """Peak absolute amplitude of the click track, where clicks may overlap"""
+    peak = 0.0
+    for start in range(0, num_frames, block_frames):
+        block = np.zeros(min(block_frames, num_frames - start), dtype=np.float32)
+        add_clicks(block, start, beat_frames, beat_click)
+        add_clicks(block, start, downbeat_frames, downbeat_click)
+        peak = max(peak, float(np.abs(block).max(initial=0.0)))
+    return peak
+
+def peak_amplitude(path, block_frames=BLOCK_FRAMES):
+    """Peak absolute amplitude of the mono downmix of an audio file, read block by block"""
+    peak = 0.0
+    with sf.SoundFile(path) as f:
+        for block in f.blocks(block_frames, dtype="float32", always_2d=True):
+            peak = max(peak, float(np.abs(block.mean(axis=1)).max(initial=0.0)))
+    return peak
+
+def wav_header(sr, num_frames):
+    """Canonical 44-byte header of a 16-bit mono PCM WAV file"""
+    data_size = num_frames * SAMPLE_WIDTH
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, 1, sr, sr * SAMPLE_WIDTH, SAMPLE_WIDTH, 8 * SAMPLE_WIDTH,
+        b"data", data_size,
+    )
+
+def parse_range_header(range_header, total_size):
+    """
+    Parse a single-range HTTP Range header
+
+    Args:
+        range_header: Value of the Range header, e.g. "bytes=100-199" or "bytes=-500"
+        total_size: Size of the full response body in bytes
+
+    Returns:
+        Tuple of (first, last) byte positions, inclusive
+
+    Raises:
+        ValueError: If the header is malformed or not satisfiable
+    """
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", range_header or "")
+    if not match or (not match.group(1) and not match.group(2)):
+        raise ValueError(f"Unsupported Range header: {range_header}")
+
+    if not match.group(1):
+        # Suffix range: the last N bytes
+        first = max(total_size - int(match.group(2)), 0)
+        last = total_size - 1
+    else:
+        first = int(match.group(1))
+        last = int(match.group(2)) if match.group(2) else total_size - 1
+        last = min(last, total_size - 1)
+
+    if first > last or first >= total_size:
+        raise ValueError(f"Range not satisfiable: {range_header}")
+    return first, last
+
+class ClickMixer:
+    """
+    Mixes stored stems and a click schedule on the fly.
+
+    Only the frames that are actually requested are read from the stems and
+    rendered, so a client seeking into the middle of a track pays only for
+    what it plays. The streams keep the stems open until the response ends.
+    """
+
+    def __init__(self, stem_paths, gains, beats, downbeats, click_gain=1.0, click_peak=None):
+        """
+        Args:
+            stem_paths: Dictionary of stem name to audio file path
+            gains: Dictionary of stem name to linear gain; stems with zero gain are not read
+            beats: Regular beat times in seconds
+            downbeats: Downbeat times in seconds
+            click_gain: Linear gain of the click track
+            click_peak: Peak the click track is normalized to before click_gain is
+                applied, like the pre-rendered click tracks (None leaves the clicks raw)
+        """
+        self.files = {}
+        self.gains = {}
+        self._readers = None
+        self.sr = None
+        self.num_frames = 0
+
+        for stem, path in stem_paths.items():
+            gain = float(gains.get(stem, 0.0))
+            if gain == 0.0:
+                continue
+            info = sf.info(path)
+            if self.sr is None:
+                self.sr = info.samplerate
+            elif info.samplerate != self.sr:
+                raise ValueError(f"Stem '{stem}' has sample rate {info.samplerate}Hz, expected {self.sr}Hz")
+            self.files[stem] = path
+            self.gains[stem] = gain
+            self.num_frames = max(self.num_frames, info.frames)
+
+        if self.sr is None:
+            # Clicks only: use the first stem for timing
+            path = next(iter(stem_paths.values()))
+            info = sf.info(path)
+            self.sr = info.samplerate
+            self.num_frames = info.frames
+
+        self.click_gain = float(click_gain)
+        self.beat_click = make_click(self.sr, BEAT_CLICK_FREQ)
+        self.downbeat_click = make_click(self.sr, DOWNBEAT_CLICK_FREQ)
+        self.beat_frames = np.round(np.asarray(beats, dtype=float) * self.sr).astype(np.int64)
+        self.downbeat_frames = np.round(np.asarray(downbeats, dtype=float) * self.sr).astype(np.int64)
+        if click_peak and self.click_gain:
+            peak = click_track_peak(self.num_frames, np.sort(self.beat_frames), np.sort(self.downbeat_frames),
+                                    self.beat_click, self.downbeat_click)
+            if peak > 0:
+                self.click_gain *= click_peak / peak
+
+    @contextmanager
+    def open(self):
+        """Keep the mixed stems open, so every block rendered inside reuses the same readers"""
+        if self._readers is not None:
+            yield self
+            return
+        with ExitStack() as stack:
+            self._readers = {stem: stack.enter_context(sf.SoundFile(path)) for stem, path in self.files.items()}
+            try:
+                yield self
+            finally:
+                self._readers = None
+
+    def render(self, start, num_frames):
+        """
+        Render a block of the mix
+
+        Args:
+            start: First frame of the block
+            num_frames: Number of frames to render
+
+        Returns:
+            Mono float32 array, clipped to [-1, 1]
+        """
+        with self.open():
+            out = np.zeros(num_frames, dtype=np.float32)
+            for stem, f in self._readers.items():
+                if start >= f.frames:
+                    continue
+                f.seek(start)
+                block = f.read(num_frames, dtype="float32", always_2d=True).mean(axis=1)
+                out[:len(block)] += self.gains[stem] * block
+
+        if self.click_gain:
+            add_clicks(out, start, self.beat_frames, self.beat_click, self.click_gain)
+            add_clicks(out, start, self.downbeat_frames, self.downbeat_click, self.click_gain)
+
+        return np.clip(out, -1.0, 1.0)
+
+    def stream_pcm(self, start, end, block_frames=BLOCK_FRAMES):
+        """Yield 16-bit little-endian PCM for frames [start, end) in blocks"""
+        with self.open():
+            position = start
+            while position < end:
+                n = min(block_frames, end - position)
+                yield (self.render(position, n) * 32767).astype("<i2").tobytes()
+                position += n
+
+    def write_wav(self, path, start, end, block_frames=BLOCK_FRAMES):
+        """Write frames [start, end) of the mix to a 16-bit WAV file"""
+        with self.open(), sf.SoundFile(path, "w", self.sr, 1, subtype="PCM_16") as f:
+            for position in range(start, end, block_frames):
+                f.write(self.render(position, min(block_frames, end - position)))
+
+    def stream_wav_bytes(self, first_frame, last_frame, byte_start, byte_end):
+        """
+        Yield bytes [byte_start, byte_end] (inclusive) of the WAV file covering
+        frames [first_frame, last_frame), rendering only the frames inside that span
+
+        Args:
+            first_frame: First frame of the full (virtual) WAV file
+            last_frame: End frame (exclusive) of the full WAV file
+            byte_start: First byte to send
+            byte_end: Last byte to send (inclusive)
+        """
+        header = wav_header(self.sr, last_frame - first_frame)
+        if byte_start < WAV_HEADER_SIZE:
+            yield header[byte_start:min(byte_end + 1, WAV_HEADER_SIZE)]
+        if byte_end < WAV_HEADER_SIZE:
+            return
+
+        data_start = max(byte_start - WAV_HEADER_SIZE, 0)
+        data_end = byte_end - WAV_HEADER_SIZE + 1
+        frame_start = first_frame + data_start // SAMPLE_WIDTH
+        frame_end = first_frame + (data_end + SAMPLE_WIDTH - 1) // SAMPLE_WIDTH
+
+        # Trim partial samples at the edges of the requested byte span
+        skip = data_start % SAMPLE_WIDTH
+        remaining = data_end - data_start
+        for chunk in self.stream_pcm(frame_start, frame_end):
+            chunk = chunk[skip:skip + remaining]
+            skip = 0
+            remaining -= len(chunk)
+            yield chunk
@@ -0,0 +1,506 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from job_control import CancellationToken
+from response_encoding import dumps
+from job_scheduling import schedule_key
+from metrics import merge_snapshots
+
+# Child of the backend logger, so messages end up in backend.log
+logger = logging.getLogger('backend.durable_queue')
+
+# Job states; queued and running jobs are active
+ACTIVE_STATES = ("queued", "running")
+FINAL_STATES = ("completed", "failed", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    video_id TEXT NOT NULL,
+    url TEXT NOT NULL DEFAULT '',
+    source_path TEXT,
+    profile INTEGER NOT NULL DEFAULT 0,
+    batch_id TEXT,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    lease_expires REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    estimated_seconds REAL NOT NULL DEFAULT 0,
+    priority REAL NOT NULL DEFAULT 0,
+    window_start REAL,
+    window_end REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, id);
+CREATE INDEX IF NOT EXISTS jobs_by_video ON jobs (video_id, state);
+CREATE INDEX IF NOT EXISTS jobs_by_priority ON jobs (state, priority, id);
+CREATE TABLE IF NOT EXISTS progress (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    video_id TEXT NOT NULL UNIQUE,
+    record BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    warmup_seconds REAL,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS worker_metrics (
+    worker_id TEXT PRIMARY KEY,
+    snapshot BLOB NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Columns added after the first release, with their definitions, for queue files created before
+ADDED_COLUMNS = {
+    "estimated_seconds": "REAL NOT NULL DEFAULT 0",
+    "priority": "REAL NOT NULL DEFAULT 0",
+    "window_start": "REAL",
+    "window_end": "REAL",
+}
+
+# Metrics of workers silent for this many leases are folded into one row under
+# RETIRED_WORKER_ID, so restarts do not grow the table; a worker that went
+# quiet for that long and comes back would be counted twice
+RETIRED_METRICS_LEASES = 10
+RETIRED_WORKER_ID = "retired"
+
+def default_worker_id():
+    """Host name and process ID, unique across the nodes sharing a queue"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class DurableQueue:
+    """
+    Job queue and progress log in an SQLite file.
+
+    Jobs survive restarts of the API and of the workers. A worker claims a
+    job with a lease that it renews with heartbeats while the job runs; a job
+    whose lease expired (its worker died) is handed to the next worker that
+    asks, up to max_attempts times. Queued jobs are claimed in the order of
+    job_scheduling.schedule_key, computed once at enqueue. Workers also publish progress records
+    here, which the API processes read back with progress_since(), their
+    readiness, read back with workers(), and their metrics, read back with
+    worker_metrics().
+
+    Any number of processes may share the file, on one node or, with
+    wal=False, on several nodes using a shared filesystem with working POSIX
+    locks. Leases compare wall-clock times, so the nodes' clocks must be
+    synchronized.
+    """
+
+    def __init__(self, path, lease_seconds=60.0, max_attempts=3, wal=True, aging_rate=None):
+        """
+        Args:
+            path: SQLite database file, created if missing
+            lease_seconds: How long a claim is valid without a heartbeat
+            max_attempts: Claims of a job before it fails for good
+            wal: Use write-ahead logging (not supported on network filesystems)
+            aging_rate: See job_scheduling.schedule_key; None claims jobs in arrival order
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.wal = wal
+        self.aging_rate = aging_rate
+        self._local = threading.local()
+        db = self._connection()
+        with self._transaction():
+            columns = {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}
+            for name, definition in ADDED_COLUMNS.items():
+                if columns and name not in columns:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+        # executescript commits on its own
+        db.executescript(SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections must stay on the thread that created them
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute(f"PRAGMA journal_mode={'WAL' if self.wal else 'DELETE'}")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database lock up front, so claims never race"""
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _publish(self, db, video_id, record):
+        db.execute("INSERT OR REPLACE INTO progress (video_id, record) VALUES (?, ?)", (video_id, dumps(record)))
+
+    def enqueue(self, video_id, url="", source_path=None, profile=False, batch_id=None, estimated_seconds=0.0,
+                window=None):
+        """
+        Queue a job unless the video already has a queued or running one
+        
+        Args:
+            estimated_seconds: Estimated cost of the job, which orders the queue
+            window: (start, end) in seconds to analyze only part of the media
+
+        Returns:
+            The job ID, or None if the video already has an active job
+        """
+        now = time.time()
+        with self._transaction() as db:
+            active = db.execute("SELECT id FROM jobs WHERE video_id = ? AND state IN (?, ?)",
+                                (video_id, *ACTIVE_STATES)).fetchone()
+            if active:
+                return None
+            cursor = db.execute(
+                "INSERT INTO jobs (video_id, url, source_path, profile, batch_id, state, estimated_seconds, "
+                "priority, window_start, window_end, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (video_id, url, source_path, int(profile), batch_id, estimated_seconds,
+                 schedule_key(estimated_seconds, now, self.aging_rate),
+                 window[0] if window else None, window[1] if window else None, now, now))
+            self._publish(db, video_id, {"progress": 0, "status_message": "Queued for analysis"})
+            return cursor.lastrowid
+
+    def claim(self, worker_id):
+        """
+        Lease the first queued job, or a running job whose worker stopped heartbeating
+
+        Returns:
+            The job as a dictionary, or None if there is nothing to do
+        """
+        now = time.time()
+        with self._transaction() as db:
+            while True:
+                row = db.execute(
+                    "SELECT * FROM jobs WHERE state = 'queued' OR (state = 'running' AND lease_expires < ?) "
+                    "ORDER BY priority, id LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    return None
+                if row["state"] == "running":
+                    logger.warning(f"Lease of job {row['id']} ({row['video_id']}) held by {row['worker_id']} expired "
+                                   f"after attempt {row['attempts']}")
+                    if row["cancel_requested"] or row["attempts"] >= self.max_attempts:
+                        self._finish(db, row, "cancelled" if row["cancel_requested"] else "failed",
+                                     f"Worker stopped responding after {row['attempts']} attempts", now)
+                        continue
+                db.execute("UPDATE jobs SET state = 'running', worker_id = ?, lease_expires = ?, "
+                           "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                           (worker_id, now + self.lease_seconds, now, row["id"]))
+                job = dict(row)
+                job["attempts"] += 1
+                return job
+
+    def _finish(self, db, row, state, error, now):
+        db.execute("UPDATE jobs SET state = ?, error = ?, lease_expires = NULL, updated_at = ? WHERE id = ?",
+                   (state, error, now, row["id"]))
+        # Jobs that end without running to completion in a worker still get a final progress record
+        if state == "cancelled":
+            result = {"videoId": row["video_id"], "cancelled": True, "completed": True}
+            self._publish(db, row["video_id"], {"progress": 100, "status_message": "Analysis cancelled",
+                                                "completed": True, "data": result})
+        elif state == "failed":
+            result = {"videoId": row["video_id"], "error": error, "completed": True}
+            self._publish(db, row["video_id"], {"progress": 100, "status_message": f"Error: {error}",
+                                                "completed": True, "data": result})
+
+    def heartbeat(self, job_id, worker_id):
+        """
+        Renew the lease of a running job
+
+        Returns:
+            "ok", "cancel" if cancellation was requested, or "lost" if the
+            lease expired and the job was handed to another worker
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT worker_id, state, cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row["state"] != "running" or row["worker_id"] != worker_id:
+                return "lost"
+            db.execute("UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ?",
+                       (now + self.lease_seconds, now, job_id))
+            return "cancel" if row["cancel_requested"] else "ok"
+
+    def complete(self, job_id, worker_id, state, error=None):
+        """Record the outcome of a job; ignored if the worker no longer holds it"""
+        if state not in FINAL_STATES:
+            raise ValueError(f"Not a final state: {state}")
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("UPDATE jobs SET state = ?, error = ?, lease_expires = NULL, updated_at = ? "
+                       "WHERE id = ? AND worker_id = ? AND state = 'running'",
+                       (state, error, now, job_id, worker_id))
+
+    def cancel(self, video_id):
+        """
+        Cancel the active job of a video: queued jobs end immediately, running
+        ones are told at their worker's next heartbeat
+
+        Returns:
+            True if the video had an active job
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT * FROM jobs WHERE video_id = ? AND state IN (?, ?)",
+                             (video_id, *ACTIVE_STATES)).fetchone()
+            if row is None:
+                return False
+            if row["state"] == "queued":
+                self._finish(db, row, "cancelled", None, now)
+            else:
+                db.execute("UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ?", (now, row["id"]))
+            return True
+
+    def publish_progress(self, video_id, record):
+        """Store the latest progress record of a video for the API processes"""
+        with self._transaction() as db:
+            self._publish(db, video_id, record)
+
+    def progress_since(self, seq):
+        """
+        Progress records published after seq
+
+        Returns:
+            List of (seq, video_id, record) in publication order
+        """
+        rows = self._connection().execute("SELECT seq, video_id, record FROM progress WHERE seq > ? ORDER BY seq",
+                                          (seq,)).fetchall()
+        return [(row["seq"], row["video_id"], json.loads(row["record"])) for row in rows]
+
+    def report_worker(self, worker_id, state, warmup_seconds=None, error=None):
+        """
+        Record the state of a worker; workers repeat it with every heartbeat
+
+        Args:
+            state: "warming_up", "ready" or "failed"
+            warmup_seconds: Time the worker took to load the analysis stack
+            error: Why the warmup failed
+        """
+        now = time.time()
+        with self._transaction() as db:
+            # Workers that stopped reporting (crashed or restarted under a new ID) are dropped
+            db.execute("DELETE FROM workers WHERE updated_at < ?", (now - self.lease_seconds,))
+            db.execute("INSERT OR REPLACE INTO workers (worker_id, state, warmup_seconds, error, updated_at) "
+                       "VALUES (?, ?, ?, ?, ?)", (worker_id, state, warmup_seconds, error, now))
+
+    def remove_worker(self, worker_id):
+        """Drop the state of a worker that stops"""
+        with self._transaction() as db:
+            db.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+    def workers(self):
+        """
+        Workers that reported within the lease period
+
+        Returns:
+            List of dictionaries with worker_id, state, warmup_seconds, error and updated_at
+        """
+        rows = self._connection().execute("SELECT * FROM workers WHERE updated_at >= ? ORDER BY worker_id",
+                                          (time.time() - self.lease_seconds,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def publish_metrics(self, worker_id, snapshot):
+        """Store the latest metrics.snapshot() of a worker and fold those of stopped workers"""
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO worker_metrics (worker_id, snapshot, updated_at) VALUES (?, ?, ?)",
+                       (worker_id, dumps(snapshot), now))
+            stale = db.execute("SELECT worker_id, snapshot FROM worker_metrics WHERE updated_at < ? AND worker_id != ?",
+                               (now - RETIRED_METRICS_LEASES * self.lease_seconds, RETIRED_WORKER_ID)).fetchall()
+            if not stale:
+                return
+            retired = db.execute("SELECT snapshot FROM worker_metrics WHERE worker_id = ?",
+                                 (RETIRED_WORKER_ID,)).fetchone()
+            snapshots = [json.loads(row["snapshot"]) for row in ([retired] if retired else []) + stale]
+            db.execute("INSERT OR REPLACE INTO worker_metrics (worker_id, snapshot, updated_at) VALUES (?, ?, ?)",
+                       (RETIRED_WORKER_ID, dumps(merge_snapshots(snapshots)), now))
+            db.executemany("DELETE FROM worker_metrics WHERE worker_id = ?", [(row["worker_id"],) for row in stale])
+            logger.info(f"Folded the metrics of {len(stale)} stopped workers")
+
+    def worker_metrics(self):
+        """
+        Latest metrics snapshot of every worker that published one
+
+        Snapshots of stopped workers are kept, folded into one row once they
+        are stale, so counters summed over the workers do not go down when a
+        worker restarts under a new ID.
+
+        Returns:
+            List of snapshots
+        """
+        rows = self._connection().execute("SELECT snapshot FROM worker_metrics ORDER BY worker_id").fetchall()
+        return [json.loads(row["snapshot"]) for row in rows]
+
+    def active_video_ids(self):
+        """IDs of the videos with a queued or running job"""
+        rows = self._connection().execute("SELECT DISTINCT video_id FROM jobs WHERE state IN (?, ?)",
+                                          ACTIVE_STATES).fetchall()
+        return {row["video_id"] for row in rows}
+
+    def forget(self, video_id):
+        """Drop the finished jobs and the progress record of a video"""
+        with self._transaction() as db:
+            db.execute("DELETE FROM jobs WHERE video_id = ? AND state NOT IN (?, ?)", (video_id, *ACTIVE_STATES))
+            db.execute("DELETE FROM progress WHERE video_id = ?", (video_id,))
+
+    def stats(self):
+        """Number of jobs per state and the workers holding running jobs"""
+        db = self._connection()
+        counts = {state: 0 for state in ACTIVE_STATES + FINAL_STATES}
+        for row in db.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state"):
+            counts[row["state"]] = row["n"]
+        workers = db.execute("SELECT COUNT(DISTINCT worker_id) AS n FROM jobs WHERE state = 'running'").fetchone()
+        counts["busy_workers"] = workers["n"]
+        return counts
+
+class QueueWorker:
+    """
+    Claims jobs from a DurableQueue and keeps their leases alive.
+
+    start_job is called with each claimed job, a CancellationToken and a
+    done(state, error=None) callback. It must return quickly and run the job
+    elsewhere (a thread or a stage queue), calling done when the job ends.
+    The token is cancelled when the job is cancelled through the queue or
+    when the lease was lost to another worker; the video is then listed in
+    lost_video_ids, so its progress is no longer published from here.
+    The state given to set_status is reported to the queue with every
+    heartbeat, so the API can tell which workers are alive and ready, and so
+    are the worker's metrics when a metrics callable is given.
+    """
+
+    def __init__(self, queue, start_job, capacity=1, worker_id=None, poll_seconds=1.0,
+                 heartbeat_seconds=10.0, parent_pid=None, metrics=None):
+        """
+        Args:
+            queue: The DurableQueue to work on
+            start_job: Called as start_job(job, cancel_token, done)
+            capacity: Jobs this worker holds at once
+            worker_id: Name of the worker in leases (defaults to host:pid)
+            poll_seconds: Wait between claims while the queue is empty
+            heartbeat_seconds: Interval between lease renewals; well below the lease
+            parent_pid: Stop once this process is gone, so workers do not outlive the API
+            metrics: Optional callable returning a metrics snapshot, published with every
+                heartbeat and when a job ends
+        """
+        self.queue = queue
+        self.start_job = start_job
+        self.capacity = capacity
+        self.worker_id = worker_id or default_worker_id()
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.parent_pid = parent_pid
+        self.metrics = metrics
+        self._active = {}
+        self._status = None
+        self.lost_video_ids = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def set_status(self, state, warmup_seconds=None, error=None):
+        """Report this worker's state to the queue now and with every heartbeat; see DurableQueue.report_worker"""
+        self._status = (state, warmup_seconds, error)
+        self._report_status()
+
+    def _report_status(self):
+        if self._status is None:
+            return
+        try:
+            self.queue.report_worker(self.worker_id, *self._status)
+        except sqlite3.Error as e:
+            logger.error(f"Reporting the state of worker {self.worker_id} failed: {str(e)}")
+
+    def _publish_metrics(self):
+        if self.metrics is None:
+            return
+        try:
+            self.queue.publish_metrics(self.worker_id, self.metrics())
+        except sqlite3.Error as e:
+            logger.error(f"Publishing the metrics of worker {self.worker_id} failed: {str(e)}")
+
+    def _done_callback(self, job):
+        def done(state, error=None):
+            with self._lock:
+                self._active.pop(job["id"], None)
+            try:
+                self.queue.complete(job["id"], self.worker_id, state, error)
+            except sqlite3.Error as e:
+                # The lease expires and the job is retried elsewhere
+                logger.error(f"Could not record the outcome of job {job['id']}: {str(e)}")
+            self._publish_metrics()
+            self._wakeup.set()
+        return done
+
+    def _heartbeat(self):
+        with self._lock:
+            active = list(self._active.items())
+        for job_id, (video_id, token) in active:
+            try:
+                status = self.queue.heartbeat(job_id, self.worker_id)
+            except sqlite3.Error as e:
+                logger.error(f"Heartbeat of job {job_id} failed: {str(e)}")
+                continue
+            if status == "lost":
+                self.lost_video_ids.add(video_id)
+            if status != "ok" and not token.cancelled:
+                logger.warning(f"Stopping job {job_id}: {'cancelled' if status == 'cancel' else 'lease lost'}")
+                token.cancel()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            self._report_status()
+            self._publish_metrics()
+            self._heartbeat()
+
+    def _parent_alive(self):
+        return self.parent_pid is None or os.getppid() == self.parent_pid
+
+    def run(self):
+        """Claim and start jobs until stop() is called or the parent process exits"""
+        threading.Thread(target=self._heartbeat_loop, name="heartbeat", daemon=True).start()
+        logger.info(f"Worker {self.worker_id} polling {self.queue.path} for up to {self.capacity} jobs")
+        while not self._stop.is_set() and self._parent_alive():
+            with self._lock:
+                has_room = len(self._active) < self.capacity
+            job = None
+            if has_room:
+                try:
+                    job = self.queue.claim(self.worker_id)
+                except sqlite3.Error as e:
+                    logger.error(f"Claiming a job failed: {str(e)}")
+            if job is None:
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+                continue
+            logger.info(f"Worker {self.worker_id} claimed job {job['id']} for {job['video_id']} "
+                        f"(attempt {job['attempts']})")
+            token = CancellationToken()
+            if job["cancel_requested"]:
+                token.cancel()
+            with self._lock:
+                self._active[job["id"]] = (job["video_id"], token)
+            self.lost_video_ids.discard(job["video_id"])
+            self.start_job(job, token, self._done_callback(job))
+        logger.info(f"Worker {self.worker_id} stopping")
+        try:
+            self.queue.remove_worker(self.worker_id)
+        except sqlite3.Error:
+            pass
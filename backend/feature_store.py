@@ -0,0 +1,244 @@
+import logging
+import numpy as np
+import librosa
+from metrics import CACHE_REQUESTS
+
+# Child of the beat detector logger, so messages end up in beat_detector.log
+logger = logging.getLogger('beat_detector.feature_store')
+
+# Margins used for harmonic-percussive separation throughout the pipeline
+HPSS_MARGIN = (3.0, 2.0)
+
+# Features that are memoized in memory but not persisted: the STFT alone is
+# several hundred MB for a long track at the native rate, barely compresses,
+# and is recomputed from the audio in about a second
+DERIVED_FEATURES = ("stft", "magnitude")
+
+# HPSS masks are persisted as uint8 in 1/MASK_LEVELS steps
+MASK_LEVELS = 255
+
+class FeatureStore:
+    """
+    Per-job store of spectral features, computed on first access and memoized.
+
+    The separation, beat detection and visualization stages all read the same
+    STFT, magnitude and HPSS masks from here instead of recomputing them. The
+    HPSS masks can be persisted as a compressed .npz next to the job
+    artifacts and reloaded later, so re-rendering the waveform image skips
+    HPSS; the STFT is recomputed from the audio when needed.
+    """
+
+    def __init__(self, audio_path=None, y=None, sr=None, n_fft=2048, hop_length=512):
+        """
+        Args:
+            audio_path: Path to the audio file the features are computed from
+            y: Already loaded audio signal (optional, avoids reloading the file)
+            sr: Sample rate of y, or the rate to load audio_path at (None keeps native)
+            n_fft: FFT window size
+            hop_length: Hop length between STFT frames
+        """
+        self.audio_path = audio_path
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self._y = y
+        self._sr = sr
+        self._features = {}
+
+    @classmethod
+    def load(cls, path, audio_path=None):
+        """
+        Load a store previously persisted with save().
+
+        Args:
+            path: Path to the .npz file
+            audio_path: Audio file to read the signal from if a stage needs it
+
+        Returns:
+            FeatureStore with all persisted features already memoized
+        """
+        logger.info(f"Loading feature store from {path}")
+        with np.load(path) as data:
+            store = cls(
+                audio_path=audio_path,
+                sr=int(data["sr"]),
+                n_fft=int(data["n_fft"]),
+                hop_length=int(data["hop_length"]),
+            )
+            for key in data.files:
+                if key in ("sr", "n_fft", "hop_length"):
+                    continue
+                value = data[key]
+                if cls._is_mask(key) and value.dtype == np.uint8:
+                    value = (value / MASK_LEVELS).astype(np.float16)
+                store._features[key] = value
+        return store
+
+    def save(self, path):
+        """
+        Persist the compact features computed so far as a compressed .npz file.
+
+        The STFT, the magnitude and the separated signals are not written
+        since they are cheap to derive from the audio and the masks, and the
+        masks are quantized to MASK_LEVELS steps.
+
+        Args:
+            path: Destination path of the .npz file
+
+        Returns:
+            The path that was written
+        """
+        arrays = {
+            key: value for key, value in self._features.items()
+            if key not in DERIVED_FEATURES and not key.startswith("hpss_signal_")
+        }
+        arrays = {
+            key: np.round(value.astype(np.float32) * MASK_LEVELS).astype(np.uint8) if self._is_mask(key) else value
+            for key, value in arrays.items()
+        }
+        logger.info(f"Saving {len(arrays)} features to {path}: {', '.join(sorted(arrays))}")
+        np.savez_compressed(
+            path,
+            sr=self.sr,
+            n_fft=self.n_fft,
+            hop_length=self.hop_length,
+            **arrays
+        )
+        return path
+
+    def _memoize(self, key, compute):
+        if key not in self._features:
+            CACHE_REQUESTS.inc(cache="feature_store", result="miss")
+            logger.info(f"Computing feature '{key}'")
+            self._features[key] = compute()
+        else:
+            CACHE_REQUESTS.inc(cache="feature_store", result="hit")
+        return self._features[key]
+
+    @staticmethod
+    def _is_mask(key):
+        return key.startswith("hpss_") and "_mask_" in key
+
+    @staticmethod
+    def _margin_key(margin):
+        return "_".join(str(float(m)) for m in np.atleast_1d(margin))
+
+    def _load_audio(self):
+        if self.audio_path is None:
+            raise ValueError("No audio signal or audio path available for feature store")
+        self._y, self._sr = librosa.load(self.audio_path, sr=self._sr)
+        logger.info(f"Feature store loaded audio with sample rate {self._sr}Hz, duration: {len(self._y)/self._sr:.2f}s")
+
+    @property
+    def y(self):
+        """Audio signal (mono)"""
+        if self._y is None:
+            self._load_audio()
+        return self._y
+
+    @property
+    def sr(self):
+        """Sample rate of the audio signal"""
+        if self._sr is None:
+            self._load_audio()
+        return self._sr
+
+    @property
+    def stft(self):
+        """Complex STFT of the signal"""
+        return self._memoize("stft", lambda: librosa.stft(
+            self.y, n_fft=self.n_fft, hop_length=self.hop_length
+        ).astype(np.complex64))
+
+    @property
+    def magnitude(self):
+        """Magnitude spectrogram"""
+        return self._memoize("magnitude", lambda: np.abs(self.stft))
+
+    def hpss_masks(self, margin=HPSS_MARGIN):
+        """
+        Soft harmonic and percussive masks for the STFT.
+
+        Args:
+            margin: HPSS margin, as passed to librosa.decompose.hpss
+
+        Returns:
+            Tuple of (harmonic_mask, percussive_mask)
+        """
+        margin_key = self._margin_key(margin)
+        harmonic_key = f"hpss_harmonic_mask_{margin_key}"
+        percussive_key = f"hpss_percussive_mask_{margin_key}"
+
+        if harmonic_key in self._features and percussive_key in self._features:
+            CACHE_REQUESTS.inc(cache="feature_store", result="hit")
+        else:
+            CACHE_REQUESTS.inc(cache="feature_store", result="miss")
+            logger.info(f"Computing HPSS masks with margin {margin}")
+            mask_h, mask_p = librosa.decompose.hpss(self.stft, margin=margin, mask=True)
+            self._features[harmonic_key] = mask_h.astype(np.float16)
+            self._features[percussive_key] = mask_p.astype(np.float16)
+
+        return self._features[harmonic_key], self._features[percussive_key]
+
+    def hpss(self, margin=HPSS_MARGIN):
+        """
+        Harmonic and percussive signals, equivalent to librosa.effects.hpss.
+
+        Args:
+            margin: HPSS margin, as passed to librosa.decompose.hpss
+
+        Returns:
+            Tuple of (y_harmonic, y_percussive)
+        """
+        def compute():
+            mask_h, mask_p = self.hpss_masks(margin)
+            length = len(self.y)
+            y_harmonic = librosa.istft(self.stft * mask_h, hop_length=self.hop_length, length=length)
+            y_percussive = librosa.istft(self.stft * mask_p, hop_length=self.hop_length, length=length)
+            return y_harmonic, y_percussive
+
+        return self._memoize(f"hpss_signal_{self._margin_key(margin)}", compute)
+
+    def hpss_at(self, y, sr, margin=HPSS_MARGIN):
+        """
+        Separate the same audio at another sample rate with this store's HPSS masks.
+
+        The masks are computed once at the store's (analysis) rate and looked
+        up for every bin and frame of an STFT with the same time and
+        frequency resolution at rate sr, so full-band stems cost one STFT and
+        two inverse STFTs instead of another HPSS. Above the analysis band
+        each frame takes the average mask of the octave below its top.
+
+        Args:
+            y: The signal at rate sr (mono)
+            sr: Its sample rate
+            margin: HPSS margin, as passed to librosa.decompose.hpss
+
+        Returns:
+            Tuple of (y_harmonic, y_percussive) at rate sr
+        """
+        if sr == self.sr:
+            return self.hpss(margin)
+
+        ratio = sr / self.sr
+        n_fft = 2 * int(round(self.n_fft * ratio / 2))
+        hop_length = int(round(self.hop_length * ratio))
+        stft = librosa.stft(y, n_fft=n_fft, hop_length=hop_length)
+
+        # Nearest analysis bin and frame of every bin and frame at rate sr
+        source_freqs = librosa.fft_frequencies(sr=self.sr, n_fft=self.n_fft)
+        freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+        bins = np.minimum(np.round(freqs / source_freqs[1]).astype(int), len(source_freqs) - 1)
+        masks = self.hpss_masks(margin)
+        frames = np.round(np.arange(stft.shape[1]) * hop_length / sr * self.sr / self.hop_length).astype(int)
+        frames = np.minimum(frames, masks[0].shape[1] - 1)
+
+        # The resampler rolls off the top of the analysis band
+        band_edge = 0.9 * self.sr / 2
+        above = freqs > band_edge
+        top_octave = (source_freqs >= band_edge / 2) & (source_freqs <= band_edge)
+        signals = []
+        for mask in masks:
+            mapped = mask[bins][:, frames].astype(np.float32)
+            mapped[above] = mask[top_octave].astype(np.float32).mean(axis=0)[frames]
+            signals.append(librosa.istft(stft * mapped, hop_length=hop_length, length=len(y)))
+        return tuple(signals)
@@ -0,0 +1,135 @@
+import os
+import signal
+import logging
+import threading
+import subprocess
+
+# Child of the backend logger, so messages end up in backend.log
+logger = logging.getLogger('backend.job_control')
+
+class JobCancelled(Exception):
+    """Raised inside a job once it has been cancelled"""
+    pass
+
+class CancellationToken:
+    """
+    Cooperative cancellation flag shared between the API and a running job.
+
+    The job calls check() between stages; cancel() additionally kills any
+    subprocess registered with the token, so downloads and encodes stop
+    consuming CPU and bandwidth immediately.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """Mark the job as cancelled and kill its registered subprocesses"""
+        self._event.set()
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            kill_process_group(process)
+
+    def check(self):
+        """Raise JobCancelled if the job has been cancelled"""
+        if self._event.is_set():
+            raise JobCancelled("Job was cancelled")
+
+    def wait(self, timeout):
+        """Sleep for up to timeout seconds, returning True early if cancelled"""
+        return self._event.wait(timeout)
+
+    def register_process(self, process):
+        """Track a subprocess so cancel() can kill it; kills it right away if already cancelled"""
+        with self._lock:
+            self._processes.add(process)
+        if self.cancelled:
+            kill_process_group(process)
+
+    def unregister_process(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+def kill_process_group(process):
+    """Kill a subprocess started with start_new_session=True together with its children"""
+    if process.poll() is not None:
+        return
+    logger.info(f"Killing process group of pid {process.pid}")
+    try:
+        os.killpg(os.getpgid(process.pid), signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, AttributeError):
+        process.kill()
+
+def run_killable(command, timeout=None, cancel_token=None, poll_interval=0.5):
+    """
+    Run a command in its own process group, killing it on timeout or cancellation
+
+    Args:
+        command: Command and arguments to run
+        timeout: Seconds after which the process is killed (None waits forever)
+        cancel_token: Optional CancellationToken that kills the process when cancelled
+        poll_interval: Seconds between cancellation checks
+
+    Returns:
+        subprocess.CompletedProcess with captured stdout/stderr
+
+    Raises:
+        TimeoutError: If the process did not finish in time
+        JobCancelled: If the token was cancelled while the process was running
+    """
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+    if cancel_token:
+        cancel_token.register_process(process)
+
+    # Drain the pipes in the background so a chatty process never blocks on a full pipe
+    output = {}
+    def drain(name, stream):
+        output[name] = stream.read()
+    readers = [
+        threading.Thread(target=drain, args=("stdout", process.stdout), daemon=True),
+        threading.Thread(target=drain, args=("stderr", process.stderr), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    try:
+        try:
+            remaining = timeout
+            while True:
+                wait = poll_interval if remaining is None else min(poll_interval, remaining)
+                try:
+                    process.wait(timeout=wait)
+                    break
+                except subprocess.TimeoutExpired:
+                    if cancel_token and cancel_token.cancelled:
+                        kill_process_group(process)
+                        process.wait()
+                        raise JobCancelled("Job was cancelled")
+                    if remaining is not None:
+                        remaining -= wait
+                        if remaining <= 0:
+                            kill_process_group(process)
+                            process.wait()
+                            raise TimeoutError(f"Command timed out after {timeout} seconds: {command[0]}")
+        finally:
+            for reader in readers:
+                reader.join()
+    finally:
+        if cancel_token:
+            cancel_token.unregister_process(process)
+
+    if cancel_token and cancel_token.cancelled:
+        raise JobCancelled("Job was cancelled")
+    return subprocess.CompletedProcess(command, process.returncode, output.get("stdout"), output.get("stderr"))
@@ -0,0 +1,134 @@
+import time
+import queue
+import logging
+import itertools
+import threading
+from job_control import CancellationToken, JobCancelled
+from job_scheduling import schedule_key
+
+# Child of the backend logger, so messages end up in backend.log
+logger = logging.getLogger('backend.job_queue')
+
+class AnalysisJob:
+    """One video waiting for or going through the analysis pipeline"""
+
+    def __init__(self, video_id, url, cancel_token=None, profile=False, batch_id=None, source_path=None,
+                 estimated_seconds=0.0, submitted_at=None, window=None):
+        self.video_id = video_id
+        self.url = url
+        # Local media file for uploads, analyzed instead of downloading url
+        self.source_path = source_path
+        self.cancel_token = cancel_token or CancellationToken()
+        self.profile = profile
+        self.batch_id = batch_id
+        # (start, end) in seconds to analyze only part of the media
+        self.window = window
+        # Estimated cost and queueing time, which order the jobs waiting for download
+        self.estimated_seconds = estimated_seconds
+        self.submitted_at = submitted_at or time.time()
+        # Result of the download stage, handed to the analysis stage
+        self.media = None
+
+    def __repr__(self):
+        return f"AnalysisJob(video_id={self.video_id!r}, batch_id={self.batch_id!r})"
+
+class AnalysisQueue:
+    """
+    Two-stage job queue: downloads run ahead of the CPU-bound analysis.
+
+    Jobs are downloaded by a pool of download_workers threads and then handed
+    to analysis_workers threads, so the network fetch of the next videos
+    overlaps with the analysis of the current ones. The hand-off queue holds
+    at most prefetch downloaded jobs, which bounds the disk used by media
+    that is waiting for a free analysis worker.
+
+    A job that fails or is cancelled while downloading is still passed on, so
+    the analysis stage reports its outcome in one place.
+
+    Jobs waiting for either stage start in the order of
+    job_scheduling.schedule_key: shortest estimated job first with
+    aging_rate, or arrival order without one.
+    """
+
+    def __init__(self, prepare, run, download_workers, analysis_workers, prefetch=None, aging_rate=None):
+        """
+        Args:
+            prepare: Called with the job in a download worker; may set job.media
+            run: Called with the job in an analysis worker
+            download_workers: Number of concurrent downloads
+            analysis_workers: Number of concurrent analyses
+            prefetch: Downloaded jobs that may wait for an analysis worker (defaults to analysis_workers)
+            aging_rate: See job_scheduling.schedule_key; None runs jobs in arrival order
+        """
+        self.prepare = prepare
+        self.run = run
+        self.download_workers = download_workers
+        self.analysis_workers = analysis_workers
+        self.aging_rate = aging_rate
+        self._pending = queue.PriorityQueue()
+        # Breaks ties between equal keys in submission order
+        self._sequence = itertools.count()
+        self._ready = queue.PriorityQueue(maxsize=prefetch or analysis_workers)
+        self._lock = threading.Lock()
+        self._started = False
+        self._stats = {"downloading": 0, "analyzing": 0}
+
+    def _start(self):
+        # Workers start with the first job so importing the app stays cheap
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for i in range(self.download_workers):
+            threading.Thread(target=self._download_loop, name=f"download-{i}", daemon=True).start()
+        for i in range(self.analysis_workers):
+            threading.Thread(target=self._analysis_loop, name=f"analysis-{i}", daemon=True).start()
+        logger.info(f"Job queue started with {self.download_workers} download and "
+                    f"{self.analysis_workers} analysis workers")
+
+    def submit(self, job):
+        """Queue a job for download and analysis"""
+        self._start()
+        self._pending.put(self._entry(job))
+
+    def _entry(self, job):
+        key = schedule_key(job.estimated_seconds, job.submitted_at, self.aging_rate)
+        return key, next(self._sequence), job
+
+    def _count(self, stage, delta):
+        with self._lock:
+            self._stats[stage] += delta
+
+    def _download_loop(self):
+        while True:
+            _, _, job = self._pending.get()
+            self._count("downloading", 1)
+            try:
+                if not job.cancel_token.cancelled:
+                    self.prepare(job)
+            except JobCancelled:
+                pass
+            except Exception as e:
+                logger.error(f"Error preparing {job}: {str(e)}")
+            finally:
+                self._count("downloading", -1)
+            self._ready.put(self._entry(job))
+
+    def _analysis_loop(self):
+        while True:
+            _, _, job = self._ready.get()
+            self._count("analyzing", 1)
+            try:
+                self.run(job)
+            except Exception as e:
+                logger.error(f"Error running {job}: {str(e)}")
+            finally:
+                self._count("analyzing", -1)
+
+    def stats(self):
+        """Number of jobs in each stage of the queue"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["waiting_for_download"] = self._pending.qsize()
+        stats["waiting_for_analysis"] = self._ready.qsize()
+        return stats
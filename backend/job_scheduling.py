@@ -0,0 +1,121 @@
+import os
+import json
+import logging
+import threading
+from artifact_manifest import write_json_atomic
+
+# Child of the backend logger, so messages end up in backend.log
+logger = logging.getLogger('backend.job_scheduling')
+
+# Seconds of work per second of media before any job of a stage finished:
+# downloads are network-bound, decoding an upload is cheap, and separation
+# plus beat detection dominate
+DEFAULT_STAGE_RATES = {"download": 0.1, "decode": 0.02, "analysis": 1.0}
+
+# Stages of a job by the kind of its source
+DOWNLOAD_STAGES = ("download", "analysis")
+UPLOAD_STAGES = ("decode", "analysis")
+
+def schedule_key(estimated_seconds, submitted_at, aging_rate):
+    """
+    Sort key of a queued job: shortest estimated job first, with aging
+
+    A job's effective cost is its estimated cost minus aging_rate times the
+    seconds it has waited. The waiting term is the same for every job at any
+    given moment, so ordering by estimated_seconds + aging_rate * submitted_at
+    is equivalent and never has to be recomputed. With aging_rate 1, a job
+    that arrives more than the estimated seconds of a queued job after it
+    runs after it, so long jobs cannot starve.
+
+    Args:
+        estimated_seconds: Estimated cost of the job
+        submitted_at: Wall-clock time the job was queued
+        aging_rate: Estimated seconds a job gains per second waited; None for arrival order
+
+    Returns:
+        Float, smaller runs first
+    """
+    if aging_rate is None:
+        return submitted_at
+    return estimated_seconds + aging_rate * submitted_at
+
+class CostModel:
+    """
+    Seconds of work per second of media for each pipeline stage.
+
+    Rates are exponentially weighted averages over finished jobs, saved to a
+    JSON file so they survive restarts and are shared by the API (which
+    estimates) and the worker processes (which measure). Changes written by
+    other processes are picked up on the next estimate.
+    """
+
+    def __init__(self, path=None, default_rates=DEFAULT_STAGE_RATES, smoothing=0.2):
+        """
+        Args:
+            path: JSON file the rates are kept in; None keeps them in memory
+            default_rates: Rates of stages without finished jobs
+            smoothing: Weight of each new measurement in the average
+        """
+        self.path = path
+        self.default_rates = dict(default_rates)
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._rates = {}
+        self._mtime = None
+        self._reload()
+
+    def _reload(self):
+        """Re-read the rates file if another process changed it"""
+        if self.path is None:
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path) as f:
+                rates = {stage: float(rate) for stage, rate in json.load(f).items()}
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable job cost file {self.path}: {str(e)}")
+            return
+        with self._lock:
+            self._rates = rates
+            self._mtime = mtime
+
+    def rate(self, stage):
+        """Seconds of work per second of media for a stage"""
+        with self._lock:
+            return self._rates.get(stage, self.default_rates.get(stage, 1.0))
+
+    def estimate(self, duration, stages=DOWNLOAD_STAGES):
+        """Estimated seconds to run the given stages on duration seconds of media"""
+        self._reload()
+        return sum(duration * self.rate(stage) for stage in stages)
+
+    def observe(self, stage, duration, seconds):
+        """Fold the measured seconds of a stage on duration seconds of media into its rate"""
+        if not duration or duration <= 0:
+            return
+        self._reload()
+        with self._lock:
+            measured = seconds / duration
+            previous = self._rates.get(stage)
+            self._rates[stage] = measured if previous is None else \
+                previous + self.smoothing * (measured - previous)
+            rates = dict(self._rates)
+        logger.info(f"Cost of stage {stage}: {rates[stage]:.3f} s per media second "
+                    f"(measured {measured:.3f} on {duration:.0f}s)")
+        if self.path is not None:
+            try:
+                write_json_atomic(self.path, rates)
+                with self._lock:
+                    self._mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                logger.warning(f"Could not save job costs to {self.path}: {str(e)}")
+
+    def snapshot(self):
+        """Current rate of every known stage"""
+        stages = set(self.default_rates) | set(self._rates)
+        return {stage: round(self.rate(stage), 4) for stage in sorted(stages)}
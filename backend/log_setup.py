@@ -0,0 +1,188 @@
+import os
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from collections import OrderedDict
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Per-module log files, in addition to backend.log which receives everything
+MODULE_LOG_FILES = {
+    "beat_detector": "beat_detector.log",
+    "video_downloader": "video_downloader.log",
+    "simple_youtube": "simple_youtube.log",
+}
+
+# Default minimum seconds between two messages of the same rate-limited
+# category and key; 0 disables limiting for that category
+DEFAULT_RATE_LIMITS = {
+    "progress": 2.0,
+    "poll": 10.0,
+}
+
+# Message groups the rate limiter remembers; the least recently logged ones
+# are forgotten first, so per-video keys do not accumulate forever
+MAX_RATE_LIMIT_GROUPS = 4096
+
+# Argument types that are safe to format later on the listener thread
+_IMMUTABLE_ARG_TYPES = (str, int, float, bool, type(None), bytes)
+
+_lock = threading.Lock()
+_listener = None
+_rate_filter = None
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drops repetitive messages that opt in to rate limiting.
+
+    A call opts in with extra={"rate_limit": "<category>"}. Messages are
+    grouped by logger, message template and first argument (usually the video
+    ID), and within a group at most one message per interval of the category
+    passes. Warnings and errors always pass. The next message that passes
+    reports how many were suppressed. At most max_groups groups are
+    remembered, least recently logged first out.
+    """
+
+    def __init__(self, limits=None, max_groups=MAX_RATE_LIMIT_GROUPS):
+        super().__init__()
+        self.limits = dict(DEFAULT_RATE_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self.max_groups = max_groups
+        # key -> [time of the last message that passed, messages suppressed since]
+        self._groups = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        category = getattr(record, "rate_limit", None)
+        if category is None or record.levelno > logging.INFO:
+            return True
+        interval = self.limits.get(category, 0)
+        if interval <= 0:
+            return True
+
+        first_arg = record.args[0] if isinstance(record.args, tuple) and record.args else None
+        key = (record.name, record.msg, first_arg)
+        with self._lock:
+            group = self._groups.get(key)
+            if group is not None:
+                self._groups.move_to_end(key)
+                if record.created - group[0] < interval:
+                    group[1] += 1
+                    return False
+                suppressed = group[1]
+                group[:] = [record.created, 0]
+            else:
+                suppressed = 0
+                self._groups[key] = [record.created, 0]
+                if len(self._groups) > self.max_groups:
+                    self._groups.popitem(last=False)
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} similar suppressed]"
+        return True
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves message formatting to the listener thread.
+
+    The stock handler formats every record in the calling thread. Records whose
+    arguments are immutable are enqueued as they are, so the caller only pays
+    for creating the record; others are formatted eagerly because their
+    arguments could change before the listener gets to them.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            # Tracebacks hold frames of the calling thread, render them now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(arg, _IMMUTABLE_ARG_TYPES) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+def _file_handler(path, formatter, name_filter=None):
+    handler = logging.handlers.RotatingFileHandler(
+        path,
+        maxBytes=10*1024*1024,  # 10MB
+        backupCount=5
+    )
+    handler.setFormatter(formatter)
+    if name_filter:
+        handler.addFilter(logging.Filter(name_filter))
+    return handler
+
+def log_filename(filename, process_name=None):
+    """Name of a log file for one process, e.g. backend-worker-0.log"""
+    if not process_name:
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}-{process_name}{ext}"
+
+def configure_logging(level=logging.INFO, rate_limits=None, log_dir=LOG_DIR, process_name=None):
+    """
+    Route all logging through a queue drained by a single listener thread
+
+    Handlers on the root logger are replaced by one queue handler, so callers
+    never block on console or file I/O. The listener writes to the console,
+    to backend.log and to the per-module log files. Safe to call more than
+    once; later calls only update the level and rate limits.
+
+    Rotating file handlers must not share a file across processes, so every
+    process other than the API passes its own process_name, which is added to
+    its file names (backend-worker-0.log, ...). It must call this before
+    importing modules that configure logging themselves.
+
+    Args:
+        level: Level of the root logger
+        rate_limits: Optional {category: seconds} overriding DEFAULT_RATE_LIMITS
+        log_dir: Directory of the log files; None logs to the console only, for
+            short-lived subprocesses whose parent captures their output
+        process_name: Suffix of this process' log files; None for the API process
+
+    Returns:
+        The RateLimitFilter in use
+    """
+    global _listener, _rate_filter
+    with _lock:
+        logging.root.setLevel(level)
+        if _listener is not None:
+            if rate_limits:
+                _rate_filter.limits.update(rate_limits)
+            return _rate_filter
+
+        formatter = logging.Formatter(LOG_FORMAT)
+        console = logging.StreamHandler()
+        console.setFormatter(formatter)
+        handlers = [console]
+        if log_dir is not None:
+            os.makedirs(log_dir, exist_ok=True)
+            handlers.append(_file_handler(os.path.join(log_dir, log_filename("backend.log", process_name)), formatter))
+            for name, filename in MODULE_LOG_FILES.items():
+                handlers.append(_file_handler(os.path.join(log_dir, log_filename(filename, process_name)), formatter, name))
+
+        log_queue = queue.SimpleQueue()
+        _rate_filter = RateLimitFilter(rate_limits)
+        queue_handler = LazyQueueHandler(log_queue)
+        queue_handler.addFilter(_rate_filter)
+
+        for handler in logging.root.handlers[:]:
+            logging.root.removeHandler(handler)
+        logging.root.addHandler(queue_handler)
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _rate_filter
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -3,67 +3,56 @@ import logging
 import os
 import signal
 import io
-import base64
-import numpy as np
-import matplotlib.pyplot as plt
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Response, Request
+import threading
+from fastapi import FastAPI, HTTPException, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
 import asyncio
-from pytube import YouTube
 import random
-from beat_detector import BeatDetector
+import time
 import traceback
-import tempfile
 import shutil
-from simple_youtube import SimpleYouTubeDownloader
-from video_downloader import download_video_and_audio, extract_audio_from_video
-import logging.handlers
-
-# Configure logging - Simplified approach
-LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
-os.makedirs(LOG_DIR, exist_ok=True)
-LOG_FILE = os.path.join(LOG_DIR, "backend.log")
-
-# First, reset the root logger
-for handler in logging.root.handlers[:]:
-    logging.root.removeHandler(handler)
-
-# Create the formatter
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-# Set up the root logger with a console handler
-console = logging.StreamHandler()
-console.setLevel(logging.INFO)
-console.setFormatter(formatter)
-logging.root.addHandler(console)
-logging.root.setLevel(logging.INFO)
-
-# Create the file handler that will write to the log file
-file_handler = logging.handlers.RotatingFileHandler(
-    LOG_FILE, 
-    maxBytes=10*1024*1024,  # 10MB
-    backupCount=5
-)
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(formatter)
-logging.root.addHandler(file_handler)
+import itertools
+import subprocess
+import sys
+import mimetypes
+import uuid
+import statistics
+from typing import List, Optional
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from audio_renditions import encode_rendition, encode_renditions, negotiate_format, rendition_path, RENDITION_FORMATS
+from video_renditions import encode_hls
+from job_control import CancellationToken, JobCancelled
+import metrics
+from profiling import should_profile, profile_call, PROFILE_FILENAME
+from thread_budget import ThreadBudget
+from artifact_janitor import ArtifactJanitor, make_temp_workspace
+from log_setup import configure_logging
+from response_encoding import FastJSONResponse, CompressionMiddleware, dumps, negotiate_encoding, compress
+from beat_map import encode_beat_map, CODECS as BEAT_MAP_CODECS
+from job_queue import AnalysisJob, AnalysisQueue
+from upload_stream import StreamingUpload, UploadTooLarge
+from job_control import run_killable
+from media_serving import serve_file
+from artifact_manifest import ArtifactIndex
+from durable_queue import DurableQueue
+from job_scheduling import CostModel, DOWNLOAD_STAGES, UPLOAD_STAGES
+
+# Minimum seconds between two progress log lines of one job, and between two
+# poll log lines for one video; warnings and errors are never limited
+LOG_PROGRESS_INTERVAL = 2.0
+LOG_POLL_INTERVAL = 10.0
+
+# Route all logging through the queue listener, so request handlers and
+# analysis stages never wait on log file I/O
+configure_logging(rate_limits={"progress": LOG_PROGRESS_INTERVAL, "poll": LOG_POLL_INTERVAL})
 
 # Get a logger for this module
 logger = logging.getLogger('backend')
-logger.info(f"Backend logging initialized. Log file: {LOG_FILE}")
-
-# Make sure log files are writable
-try:
-    with open(LOG_FILE, 'a') as f:
-        f.write("Test write to log file\n")
-    logger.info("Successfully wrote to log file")
-except Exception as e:
-    logger.error(f"Error writing to log file: {str(e)}")
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Create a static files directory if it doesn't exist
 STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
@@ -73,9 +62,42 @@ os.makedirs(STATIC_DIR, exist_ok=True)
 VIDEOS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "videos")
 os.makedirs(VIDEOS_DIR, exist_ok=True)
 
-# Mount static files
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
-app.mount("/videos", StaticFiles(directory=VIDEOS_DIR), name="videos")
+# Disk budget for the static and videos directories together; least recently
+# used videos are evicted once it is exceeded
+ARTIFACT_BUDGET_BYTES = 20 * 1024**3  # 20GB
+
+# With a prefix set, media responses carry X-Accel-Redirect to prefix +
+# the path relative to the backend directory and nginx sends the file itself
+# (see the internal-media locations in nginx-config.txt). Empty serves the
+# files from this process.
+ACCEL_REDIRECT_PREFIX = ""
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def serve_media(request, path, media_type=None, headers=None):
+    """Serve a media file with Range/If-Range, ETag and Last-Modified support, or hand it to nginx"""
+    if media_type is None:
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    try:
+        return serve_file(request, path, media_type, headers,
+                          accel_prefix=ACCEL_REDIRECT_PREFIX or None, accel_root=BACKEND_DIR)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+def serve_artifact_path(request, root, path):
+    """Serve a file below an artifact root, rejecting paths that escape it"""
+    full_path = os.path.realpath(os.path.join(root, path))
+    if not full_path.startswith(os.path.realpath(root) + os.sep):
+        raise HTTPException(status_code=404, detail="File not found")
+    return serve_media(request, full_path)
+
+# Static files, served through the same Range-aware path as the media endpoints
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def get_static_file(path: str, request: Request):
+    return serve_artifact_path(request, STATIC_DIR, path)
+
+@app.api_route("/videos/{path:path}", methods=["GET", "HEAD"])
+async def get_videos_file(path: str, request: Request):
+    return serve_artifact_path(request, VIDEOS_DIR, path)
 
 # Add a route to serve static files explicitly
 @app.get("/test")
@@ -90,34 +112,270 @@ app.add_middleware(
     allow_origins=["*"],  # Allow all origins
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],  # Specify methods explicitly
-    allow_headers=["Content-Type", "Content-Disposition", "Accept", "Authorization", "X-Requested-With"],  # Allow common headers
-    expose_headers=["Content-Type", "Content-Disposition"],
+    allow_headers=["Content-Type", "Content-Disposition", "Accept", "Authorization", "X-Requested-With", "If-None-Match"],  # Allow common headers
+    expose_headers=["Content-Type", "Content-Disposition", "ETag"],
     max_age=3600,  # Cache preflight requests for 1 hour
 )
 
+# JSON responses are compressed with brotli or gzip when the client accepts it
+app.add_middleware(CompressionMiddleware)
+
 # Create an explicit route for handling OPTIONS preflight requests
 @app.options("/{rest_of_path:path}")
 async def options_route(rest_of_path: str, request: Request):
     """Global OPTIONS handler to support preflight CORS requests."""
-    logger.info(f"Preflight request received for path: /{rest_of_path}")
+    logger.info("Preflight request received for path: /%s", rest_of_path, extra={"rate_limit": "poll"})
     # The response will be handled by the CORS middleware
     return {}
 
-# Initialize the simple YouTube downloader
-youtube_downloader = SimpleYouTubeDownloader()
+# Heavy subsystems (librosa, torch, matplotlib, yt-dlp, the separation and
+# beat models) are imported on first use instead of at module import, so the
+# server answers /api/live right away after a reload or worker spawn.
+# A warmup thread started at startup loads them and flips /api/ready.
+_youtube_downloader = None
+_youtube_downloader_lock = threading.Lock()
+
+def get_youtube_downloader():
+    """Return the shared SimpleYouTubeDownloader, importing yt-dlp on first use."""
+    global _youtube_downloader
+    with _youtube_downloader_lock:
+        if _youtube_downloader is None:
+            from simple_youtube import SimpleYouTubeDownloader
+            _youtube_downloader = SimpleYouTubeDownloader()
+        return _youtube_downloader
+
+# Readiness state of this process, updated by the warmup thread
+readiness = {
+    "ready": False,
+    "error": None,
+    "warmup_seconds": None,
+}
+
+def warm_up():
+    """
+    Import the analysis stack and load the models once, then mark the server ready.
+    
+    The models stay loaded in beat_detector's process-wide caches, so the
+    detector of every job reuses them instead of loading its own.
+    """
+    start = time.perf_counter()
+    try:
+        logger.info("Warming up analysis stack...")
+        get_youtube_downloader()
+        from beat_detector import BeatDetector
+        BeatDetector()
+        readiness["warmup_seconds"] = round(time.perf_counter() - start, 2)
+        readiness["ready"] = True
+        logger.info(f"Analysis stack warm after {readiness['warmup_seconds']}s, server is ready")
+    except Exception as e:
+        readiness["error"] = str(e)
+        logger.error(f"Warmup failed: {str(e)}")
+        logger.error(traceback.format_exc())
 
 # Store progress information for each video ID
 video_progress = {}
 
+# Called with every progress record in worker processes, which publish them
+# to the durable queue for the API
+progress_publisher = None
+
+# Every progress update gets a new version from this counter; the version is
+# the ETag of the progress response, so unchanged state is answered with 304.
+# It starts from the clock so versions of a previous run never match.
+progress_versions = itertools.count(time.time_ns() // 1000)
+
+# Encoded progress responses per video as (version, {content coding: body}),
+# reused until the version changes
+progress_bodies = {}
+
+# Encoded beat maps per video as (version, {codec: body})
+beat_map_bodies = {}
+
+# Longest ?wait= a progress long-poll may block for, in seconds
+PROGRESS_MAX_WAIT = 30.0
+
+# Futures of long-polls waiting for the next progress update, by video ID.
+# update_progress runs in worker threads, so access is guarded by a lock.
+progress_waiters = {}
+progress_waiters_lock = threading.Lock()
+
+# Cancellation tokens of the jobs that are currently running, by video ID
+job_tokens = {}
+
+# Submissions run off the event loop; the lock keeps the active-job check and
+# the registration of the new job atomic
+submission_lock = threading.Lock()
+
+# Cancellation tokens of the HLS encodes that follow completed analyses, by video ID
+hls_tokens = {}
+
+# Submission time of the queued and running jobs, and seconds from submission
+# to the result of the completed ones, by video ID
+job_submitted_at = {}
+job_seconds_to_result = {}
+
+def forget_video(video_id):
+    """Drop the in-memory state of a video whose artifacts were evicted"""
+    video_progress.pop(video_id, None)
+    progress_bodies.pop(video_id, None)
+    beat_map_bodies.pop(video_id, None)
+    artifact_index.discard(video_id, remove_file=False)
+    job_submitted_at.pop(video_id, None)
+    job_seconds_to_result.pop(video_id, None)
+    if durable_queue is not None:
+        durable_queue.forget(video_id)
+
+artifact_janitor = ArtifactJanitor([STATIC_DIR, VIDEOS_DIR], ARTIFACT_BUDGET_BYTES, on_evict=forget_video)
+
+# Manifests of the completed analyses in STATIC_DIR, loaded at startup
+artifact_index = ArtifactIndex(STATIC_DIR)
+
+@app.middleware("http")
+async def track_artifact_access(request: Request, call_next):
+    """Record accesses to the static mounts so the janitor evicts the least recently used videos.
+    
+    Only videos the janitor tracks are touched, so requests for unknown IDs do not add entries.
+    """
+    parts = request.url.path.split("/")
+    if len(parts) > 3 and parts[1] in ("static", "videos"):
+        artifact_janitor.touch(parts[2])
+    return await call_next(request)
+
+# Content-addressed static assets, e.g. /static/{video_id}/waveform-<hash>.png.
+# A new rendering gets a new name, so these can be cached forever.
+IMMUTABLE_ASSET_PATH = re.compile(r"^/static/[^/]+/[\w.-]+-[0-9a-f]{16}\.\w+$")
+
+@app.middleware("http")
+async def immutable_asset_headers(request: Request, call_next):
+    """Mark content-addressed static assets as immutable."""
+    response = await call_next(request)
+    if response.status_code == 200 and IMMUTABLE_ASSET_PATH.match(request.url.path):
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+def publish_asset(video_id, name, data=None, source_path=None):
+    """
+    Store a blob under static/{video_id}/ with a content hash in its name
+    
+    Args:
+        video_id: The YouTube video ID
+        name: File name such as waveform.png; the hash is inserted before the extension
+        data: Bytes to store, or
+        source_path: File to copy
+        
+    Returns:
+        The URL of the asset
+    """
+    if data is None:
+        with open(source_path, "rb") as f:
+            data = f.read()
+    stem, extension = os.path.splitext(name)
+    filename = f"{stem}-{hashlib.sha256(data).hexdigest()[:16]}{extension}"
+    video_dir = os.path.join(STATIC_DIR, video_id)
+    os.makedirs(video_dir, exist_ok=True)
+    asset_path = os.path.join(video_dir, filename)
+    if not os.path.exists(asset_path):
+        with open(asset_path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(asset_path + ".tmp", asset_path)
+    return f"/static/{video_id}/{filename}"
+
+# Window length for segment-parallel beat detection; longer inputs are split
+# into overlapping windows that run through beat_this concurrently
+BEAT_SEGMENT_SECONDS = 120.0
+
+# Sample rate of beat detection and the spectral features (beat_this' own
+# input rate); audio is resampled to it once at decode, while the published
+# stems and click tracks keep the native rate. None analyzes at the native rate
+ANALYSIS_SAMPLE_RATE = 22050
+
+# Keep the HPSS masks (about 5 MB per minute of audio) as features.npz, so
+# /api/waveform-image re-renders without recomputing HPSS
+PERSIST_FEATURES = False
+
+# Write the pre-mixed click tracks (four WAVs the length of the song). The
+# players stream them from /api/mix, which mixes the stems on request
+RENDER_CLICK_TRACKS = False
+
+# Fraction of jobs profiled even when the request did not ask for it
+PROFILE_SAMPLE_RATE = 0.0
+
+# Concurrent analyses; the cores are split into this many equal slices and
+# torch, BLAS, numba and ffmpeg of each job are limited to its slice
+MAX_CONCURRENT_JOBS = 2
+PIN_JOB_CPUS = False
+thread_budget = ThreadBudget(MAX_CONCURRENT_JOBS, pin_cpus=PIN_JOB_CPUS)
+
+# Downloads run ahead of the analysis in their own pool; at most
+# DOWNLOAD_PREFETCH downloaded videos wait for a free core slice
+MAX_CONCURRENT_DOWNLOADS = 3
+DOWNLOAD_PREFETCH = 2
+DOWNLOAD_FFMPEG_THREADS = 1
+# Seconds before a download, which runs in its own process, is killed
+DOWNLOAD_TIMEOUT = 1800
+
+# Largest number of videos accepted by one batch request
+MAX_BATCH_SIZE = 200
+
+# Largest accepted upload, and how long decoding it may take
+MAX_UPLOAD_BYTES = 4 * 1024 ** 3
+UPLOAD_DECODE_TIMEOUT = 900
+
+# Encode an HLS ladder (see video_renditions.HLS_LADDER) with segments that
+# start on downbeats, so the player starts and seeks without fetching the
+# full-size download; seconds before the encode is abandoned. The encode
+# follows the published analysis result, at most VIDEO_HLS_WORKERS at a time,
+# and adds hls_url to it when done
+VIDEO_HLS_ENABLED = True
+VIDEO_HLS_TIMEOUT = 3600
+VIDEO_HLS_WORKERS = 1
+
+# Where jobs run: "durable" queues them in an SQLite file that worker
+# processes (worker.py) claim with leases, so queued jobs survive crashes and
+# analysis scales over processes and nodes; "thread" runs them in this process
+JOB_QUEUE_BACKEND = "durable"
+JOB_QUEUE_PATH = os.path.join(BACKEND_DIR, "jobs.sqlite3")
+# Set to False when JOB_QUEUE_PATH is on a network filesystem shared by several nodes
+JOB_QUEUE_WAL = True
+# Worker processes the API starts on its own node; 0 to run worker.py separately
+LOCAL_WORKER_PROCESSES = MAX_CONCURRENT_JOBS
+# A worker that misses heartbeats for WORKER_LEASE_SECONDS loses its job,
+# which then runs again elsewhere, at most JOB_MAX_ATTEMPTS times in total
+WORKER_LEASE_SECONDS = 60.0
+WORKER_HEARTBEAT_SECONDS = 10.0
+JOB_MAX_ATTEMPTS = 3
+# Seconds between reads of the progress the workers publish
+PROGRESS_SYNC_INTERVAL = 0.5
+
+# Queued jobs start shortest first by estimated cost (duration times the
+# per-stage rates learned in JOB_COSTS_PATH). A waiting job gains
+# JOB_AGING_RATE seconds of cost per second waited, so long jobs still run;
+# None restores arrival order
+JOB_AGING_RATE = 1.0
+JOB_COSTS_PATH = os.path.join(BACKEND_DIR, "job_costs.json")
+# Assumed duration of videos whose metadata has none
+DEFAULT_JOB_DURATION = 180
+cost_model = CostModel(JOB_COSTS_PATH)
+
+# Requests may analyze only a window of a video (start/end in seconds). Every
+# stage then runs on the window's audio; WINDOW_PARTIAL_DOWNLOAD fetches just
+# that audio with yt-dlp download sections and plays the video through the
+# YouTube player, otherwise the whole video is downloaded and its audio cut
+MIN_WINDOW_SECONDS = 5.0
+WINDOW_PARTIAL_DOWNLOAD = True
+
 class VideoRequest(BaseModel):
     url: str
+    profile: bool = False  # Run the job under the profiler and keep the profile as an artifact
+    start: Optional[float] = None  # Analyze only from here (seconds of video time)
+    end: Optional[float] = None    # Analyze only up to here; the end of the video if omitted
 
 class VideoResponse(BaseModel):
     videoId: str
     duration: float
     steps: list
     audio_with_clicks_url: str
-    waveform_image: str
+    waveform_image_url: str
     progress: int = 0
     status_message: str = "Initializing"
     video_url: str = ""    # Added this for the local video URL
@@ -129,14 +387,23 @@ class ProgressResponse(BaseModel):
 
 def extract_video_id(url: str) -> str:
     """Extract video ID from various YouTube URL formats."""
+    return extract_video_info(url)[0]
+
+def extract_video_info(url):
+    """
+    Extract the video ID of a YouTube URL, and the duration if the metadata is available
+    
+    Returns:
+        Tuple of the video ID and the duration in seconds (None if unknown)
+    """
     logger.info(f"Extracting video ID from URL: {url}")
     
-    # Use the simple YouTube downloader to extract video ID
-    video_id = youtube_downloader.extract_video_id(url)
+    # Use the simple YouTube downloader to extract video ID; its metadata also has the duration
+    video_id, duration = get_youtube_downloader().extract_video_info(url)
     
     if video_id:
         logger.info(f"Extracted video ID: {video_id}")
-        return video_id
+        return video_id, duration
     
     # Fallback to our own parsing logic
     # Check for playlist URLs first and reject them
@@ -164,7 +431,7 @@ def extract_video_id(url: str) -> str:
     if match:
         video_id = match.group(6)
         logger.info(f"Extracted video ID: {video_id}")
-        return video_id
+        return video_id, None
     
     logger.error(f"Could not extract video ID from URL: {url}")
     raise ValueError("Invalid YouTube URL format. Please provide a direct link to a YouTube video.")
@@ -180,7 +447,7 @@ def update_progress(video_id, progress, message, data=None):
         data: Optional data object with complete results
     """
     # Log the progress update
-    logger.info(f"Progress update for {video_id}: {progress}% - {message}")
+    logger.info("Progress update for %s: %s%% - %s", video_id, progress, message, extra={"rate_limit": "progress"})
     
     # Create a complete record
     progress_record = {
@@ -200,17 +467,97 @@ def update_progress(video_id, progress, message, data=None):
         # Preserve existing data
         progress_record["data"] = video_progress[video_id]["data"]
     
+    # Time to result of jobs submitted through this process
+    if progress_record.get("completed") and video_id in job_submitted_at:
+        result = progress_record.get("data") or {}
+        submitted_at = job_submitted_at.pop(video_id)
+        if not result.get("error") and not result.get("cancelled"):
+            job_seconds_to_result[video_id] = time.time() - submitted_at
+            metrics.TIME_TO_RESULT.observe(job_seconds_to_result[video_id])
+    
     # Update the progress dictionary
+    progress_record["version"] = next(progress_versions)
     video_progress[video_id] = progress_record
+    notify_progress_waiters(video_id)
+    if progress_publisher is not None:
+        progress_publisher(video_id, {key: value for key, value in progress_record.items() if key != "version"})
+
+def notify_progress_waiters(video_id):
+    """Wake up the long-polls waiting for a new version of a video's progress"""
+    with progress_waiters_lock:
+        waiters = progress_waiters.pop(video_id, [])
+    for future in waiters:
+        future.get_loop().call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+
+async def wait_for_progress_change(video_id, version, timeout):
+    """Block until the progress version of a video differs from version, or timeout expires"""
+    deadline = time.monotonic() + timeout
+    while video_progress.get(video_id, {}).get("version", 0) == version:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        future = asyncio.get_running_loop().create_future()
+        with progress_waiters_lock:
+            progress_waiters.setdefault(video_id, []).append(future)
+        # Re-check after registering, an update may have landed in between
+        if video_progress.get(video_id, {}).get("version", 0) != version:
+            return
+        try:
+            await asyncio.wait_for(future, remaining)
+        except asyncio.TimeoutError:
+            with progress_waiters_lock:
+                waiters = progress_waiters.get(video_id, [])
+                if future in waiters:
+                    waiters.remove(future)
+                if not waiters:
+                    progress_waiters.pop(video_id, None)
 
 @app.get("/")
 async def root():
     return {"message": "Dance Learning Backend API"}
 
+@app.get("/api/live")
+async def liveness_probe():
+    """Liveness probe: answers as soon as the process serves requests."""
+    return {"status": "alive"}
+
+@app.get("/api/ready")
+async def readiness_probe():
+    """
+    Readiness probe: 200 once the models are loaded, 503 while warming up.
+
+    With the durable queue the models are loaded by the worker processes, so
+    the API is ready once any live worker is, and the workers are listed.
+    """
+    if durable_queue is not None:
+        workers = await asyncio.to_thread(durable_queue.workers)
+        ready = any(worker["state"] == "ready" for worker in workers)
+        errors = [worker["error"] for worker in workers if worker["error"]]
+        return JSONResponse(
+            content={
+                "status": "ready" if ready else "warming_up",
+                "warmup_seconds": min((worker["warmup_seconds"] for worker in workers
+                                       if worker["state"] == "ready"), default=None),
+                "error": errors[0] if errors and not ready else None,
+                "workers": [{key: worker[key] for key in ("worker_id", "state", "warmup_seconds", "error")}
+                            for worker in workers],
+            },
+            status_code=200 if ready else 503
+        )
+    status_code = 200 if readiness["ready"] else 503
+    return JSONResponse(
+        content={
+            "status": "ready" if readiness["ready"] else "warming_up",
+            "warmup_seconds": readiness["warmup_seconds"],
+            "error": readiness["error"],
+        },
+        status_code=status_code
+    )
+
 @app.get("/api/health")
 async def health_check(request: Request):
     """Health check endpoint for debugging connectivity issues."""
-    logger.info(f"Health check request received from {request.client.host}")
+    logger.info("Health check request received from %s", request.client.host, extra={"rate_limit": "poll"})
     
     # Get request origin for debugging
     origin = request.headers.get("origin", "Unknown")
@@ -242,37 +589,116 @@ async def health_check(request: Request):
         }
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Expose pipeline metrics in the Prometheus text format."""
+    snapshots = []
+    if durable_queue is not None:
+        # The jobs run in the worker processes: report the queue's view of the gauges
+        # and add the stage, job and cache metrics the workers published
+        stats = await asyncio.to_thread(durable_queue.stats)
+        metrics.QUEUE_DEPTH.set(stats["queued"])
+        metrics.JOBS_IN_FLIGHT.set(stats["running"])
+        snapshots = await asyncio.to_thread(durable_queue.worker_metrics)
+    else:
+        # Jobs count as queued until their analysis starts, downloads included
+        stats = job_queue.stats()
+        metrics.QUEUE_DEPTH.set(stats["waiting_for_download"] + stats["downloading"] + stats["waiting_for_analysis"])
+    return Response(content=metrics.generate_latest(snapshots), media_type=metrics.CONTENT_TYPE_LATEST)
+
+# Progress responses must be revalidated on every poll, which the ETag makes
+# cheap: unchanged state is answered with an empty 304
+PROGRESS_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, Authorization, If-None-Match",
+    "Access-Control-Expose-Headers": "ETag",
+    "Vary": "Accept-Encoding",
+}
+
+def etag_matches(if_none_match, etag):
+    """Check an If-None-Match header against an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    strip_weak = lambda tag: tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip()
+    return strip_weak(etag) in [strip_weak(tag) for tag in if_none_match.split(",")]
+
+async def progress_response(video_id: str, request: Request, wait: float):
+    """
+    Build a conditional progress response
+
+    With ?wait=N and an If-None-Match matching the current version, the
+    request blocks up to N seconds for the next update before answering 304.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    version = video_progress.get(video_id, {}).get("version", 0)
+    if wait > 0 and etag_matches(if_none_match, f'W/"{version}"'):
+        await wait_for_progress_change(video_id, version, min(wait, PROGRESS_MAX_WAIT))
+        version = video_progress.get(video_id, {}).get("version", 0)
+
+    etag = f'W/"{version}"'
+    headers = dict(PROGRESS_HEADERS, ETag=etag)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    # Serialize and compress once per version and content coding
+    cached = progress_bodies.get(video_id)
+    bodies = cached[1] if cached and cached[0] == version else {}
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding not in bodies:
+        if None not in bodies:
+            response = get_progress_for_video(video_id)
+            bodies[None] = (dumps(response.dict() if hasattr(response, 'dict') else response), None)
+        bodies[encoding] = compress(bodies[None][0], encoding)
+        if version:
+            progress_bodies[video_id] = (version, bodies)
+    body, applied = bodies[encoding]
+    if applied:
+        headers["Content-Encoding"] = applied
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.get("/api/progress/{video_id}")
-async def get_progress(video_id: str):
-    """Get the current progress of video analysis."""
-    logger.info(f"Progress request received for video: {video_id}")
-    response = get_progress_for_video(video_id)
-    # Add no-cache headers to prevent caching
-    headers = {
-        "Cache-Control": "no-cache, no-store, must-revalidate",
-        "Pragma": "no-cache",
-        "Expires": "0",
-        "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization",
-    }
-    return JSONResponse(content=response.dict() if hasattr(response, 'dict') else response, headers=headers)
+async def get_progress(video_id: str, request: Request, wait: float = 0):
+    """Get the current progress of video analysis; supports ETag revalidation and ?wait= long-polling."""
+    logger.info("Progress request received for video: %s", video_id, extra={"rate_limit": "poll"})
+    return await progress_response(video_id, request, wait)
 
 @app.get("/progress/{video_id}")
-async def get_progress_alternate(video_id: str):
+async def get_progress_alternate(video_id: str, request: Request, wait: float = 0):
     """Alternative endpoint for progress to handle client requests without /api prefix."""
-    logger.info(f"Progress request received (alternate path) for video: {video_id}")
-    response = get_progress_for_video(video_id)
-    # Add no-cache headers to prevent caching
-    headers = {
-        "Cache-Control": "no-cache, no-store, must-revalidate",
-        "Pragma": "no-cache",
-        "Expires": "0",
-        "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization",
-    }
-    return JSONResponse(content=response.dict() if hasattr(response, 'dict') else response, headers=headers)
+    logger.info("Progress request received (alternate path) for video: %s", video_id, extra={"rate_limit": "poll"})
+    return await progress_response(video_id, request, wait)
+
+@app.get("/api/beats/{video_id}")
+async def get_beat_map(video_id: str, request: Request, codec: str = "varint"):
+    """
+    Serve the beats and downbeats of a completed analysis as a binary beat map.
+    
+    codec=varint (default) stores millisecond deltas as LEB128 varints, about
+    2 bytes per beat; codec=f32 stores float32 seconds. See beat_map.py.
+    """
+    if codec not in BEAT_MAP_CODECS:
+        raise HTTPException(status_code=400, detail=f"Unknown codec {codec}, use one of: {', '.join(BEAT_MAP_CODECS)}")
+    progress_info = video_progress.get(video_id, {})
+    if not progress_info.get("completed") or "data" not in progress_info:
+        raise HTTPException(status_code=404, detail=f"No completed analysis for video {video_id}")
+    
+    version = progress_info["version"]
+    etag = f'"{version}-{codec}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    cached = beat_map_bodies.get(video_id)
+    bodies = cached[1] if cached and cached[0] == version else {}
+    if codec not in bodies:
+        data = progress_info["data"]
+        bodies[codec] = encode_beat_map(data.get("beats", []), data.get("downbeats", []), codec)
+        beat_map_bodies[video_id] = (version, bodies)
+    return Response(content=bodies[codec], media_type="application/octet-stream", headers=headers)
 
 def get_progress_for_video(video_id: str):
     """Helper function to get progress information for a video ID."""
@@ -282,7 +708,7 @@ def get_progress_for_video(video_id: str):
             
             # Check if the analysis is complete and has data
             if progress_info.get("completed", False) and "data" in progress_info:
-                logger.info(f"Returning complete data for video {video_id}")
+                logger.info("Returning complete data for video %s", video_id, extra={"rate_limit": "poll"})
                 return progress_info["data"]
             else:
                 # Return just progress info
@@ -307,43 +733,159 @@ def get_progress_for_video(video_id: str):
             "error": str(e)
         }
 
-@app.post("/api/analyze-video")
-async def analyze_video(request: VideoRequest, background_tasks: BackgroundTasks):
+def validate_video_url(url):
     """
-    Analyze a YouTube video to detect dance beats and generate steps.
+    Check that a URL points to a single YouTube video
+    
+    Returns:
+        Tuple of the video ID and the duration in seconds (None if unknown)
+        
+    Raises:
+        ValueError: For invalid URLs and playlists
     """
+    # Validate URL format early
+    if not re.match(r'https?://(www\.)?(youtube\.com|youtu\.be)/.+', url):
+        logger.error(f"Invalid YouTube URL format: {url}")
+        raise ValueError("Invalid YouTube URL format. Please provide a valid YouTube video URL.")
+        
+    # Check for playlist links early
+    if 'list=' in url or 'playlist' in url or '/p/' in url or 'RDCLAK5' in url:
+        logger.error(f"Playlist URL detected: {url}")
+        raise ValueError("Playlist URLs are not supported. Please provide a direct video URL.")
+    
     try:
-        logger.info(f"Received request to analyze video: {request.url}")
+        return extract_video_info(url)
+    except ValueError as e:
+        logger.error(f"Failed to extract video ID: {str(e)}")
+        raise ValueError(f"Invalid YouTube URL: {str(e)}")
+
+def parse_window(start, end, duration=None):
+    """
+    Check the time window a request asks to analyze
+    
+    Args:
+        start: Start in seconds of video time, or None for the beginning
+        end: End in seconds, or None for the end of the video
+        duration: Duration of the video in seconds, if known
+    
+    Returns:
+        Tuple of (start, end) in seconds, or None to analyze the whole video
         
-        # Validate URL format early
-        if not re.match(r'https?://(www\.)?(youtube\.com|youtu\.be)/.+', request.url):
-            logger.error(f"Invalid YouTube URL format: {request.url}")
-            raise ValueError("Invalid YouTube URL format. Please provide a valid YouTube video URL.")
-            
-        # Check for playlist links early
-        if 'list=' in request.url or 'playlist' in request.url or '/p/' in request.url or 'RDCLAK5' in request.url:
-            logger.error(f"Playlist URL detected: {request.url}")
-            raise ValueError("Playlist URLs are not supported. Please provide a direct video URL.")
+    Raises:
+        ValueError: For windows outside the video or shorter than MIN_WINDOW_SECONDS
+    """
+    if start is None and end is None:
+        return None
+    start = float(start or 0.0)
+    if end is None:
+        if not duration:
+            raise ValueError("An end time is required when the video duration is unknown")
+        end = duration
+    end = float(min(end, duration) if duration else end)
+    if start < 0 or end - start < MIN_WINDOW_SECONDS:
+        raise ValueError(f"The analysis window must start at 0 or later and be at least "
+                         f"{MIN_WINDOW_SECONDS:g} seconds long within the video")
+    return start, end
+
+def window_video_id(video_id, window):
+    """ID the analysis of a window is stored under, e.g. dQw4w9WgXcQ_t60000-120000 (milliseconds)"""
+    if window is None:
+        return video_id
+    return f"{video_id}_t{round(window[0] * 1000)}-{round(window[1] * 1000)}"
+
+def source_video_id(video_id, window):
+    """
+    ID of the video a window analysis was cut from, the inverse of window_video_id
+
+    The window is needed because YouTube IDs may themselves end like a window suffix.
+    """
+    suffix = window_video_id("", window)
+    return video_id[:-len(suffix)] if suffix and video_id.endswith(suffix) else video_id
+
+def window_offset(video_id):
+    """Video time at which the audio artifacts of a completed analysis start"""
+    window = ((video_progress.get(video_id) or {}).get("data") or {}).get("window")
+    return window["start"] if window else 0.0
+
+def submit_analysis(url, video_id, profile=False, batch_id=None, source_path=None, duration=None, window=None,
+                    staged_path=None):
+    """
+    Queue a video for analysis unless a job for it is already queued or running
+    
+    Args:
+        url: YouTube URL of the video ("" for uploads)
+        video_id: ID the artifacts and progress are stored under
+        profile: Whether the client asked for a profile
+        batch_id: Batch the job belongs to, if any
+        source_path: Uploaded media file to analyze instead of downloading url
+        duration: Media duration in seconds if known, which orders the queue
+        window: (start, end) in seconds to analyze only that part of the media
+        staged_path: Temporary file moved to source_path once the video is claimed,
+            so a concurrent duplicate never replaces the media of a queued job
+    
+    Returns:
+        True if a new job was queued
+    """
+    with submission_lock:
+        if video_id in active_jobs():
+            logger.info(f"Analysis of video {video_id} is already queued or running")
+            return False
         
-        try:
-            video_id = extract_video_id(request.url)
-        except ValueError as e:
-            logger.error(f"Failed to extract video ID: {str(e)}")
-            raise ValueError(f"Invalid YouTube URL: {str(e)}")
+        # The old manifest no longer describes the artifacts once they are rewritten
+        artifact_index.discard(video_id)
         
         # Initialize progress tracking for this video
-        update_progress(video_id, 0, "Starting analysis")
+        update_progress(video_id, 0, "Queued for analysis")
         
         # Create a unique directory for this video
         video_dir = os.path.join(STATIC_DIR, video_id)
         os.makedirs(video_dir, exist_ok=True)
+        if staged_path:
+            os.replace(staged_path, source_path)
+        artifact_janitor.track(video_id)
+        
+        profile = should_profile(profile, PROFILE_SAMPLE_RATE)
+        if window:
+            duration = window[1] - window[0]
+        estimated_seconds = cost_model.estimate(duration or DEFAULT_JOB_DURATION,
+                                                UPLOAD_STAGES if source_path else DOWNLOAD_STAGES)
+        logger.info(f"Estimated cost of {video_id}: {estimated_seconds:.0f}s for {duration or 'unknown'}s of media")
+        job_submitted_at[video_id] = time.time()
+        job_seconds_to_result.pop(video_id, None)
+        if durable_queue is not None:
+            # A worker process claims the job; its progress comes back through sync_queue_progress
+            return durable_queue.enqueue(video_id, url, source_path=source_path, profile=profile,
+                                         batch_id=batch_id, estimated_seconds=estimated_seconds,
+                                         window=window) is not None
+        
+        # Register a cancellation token so the job can be stopped via DELETE /api/jobs
+        cancel_token = CancellationToken()
+        job_tokens[video_id] = cancel_token
+        
+        job_queue.submit(AnalysisJob(video_id, url, cancel_token, profile=profile, batch_id=batch_id,
+                                     source_path=source_path, estimated_seconds=estimated_seconds,
+                                     submitted_at=job_submitted_at[video_id], window=window))
+        return True
 
-        # Add the analysis task to the background tasks
-        background_tasks.add_task(run_analysis_in_background, request.url, video_id)
+@app.post("/api/analyze-video")
+async def analyze_video(request: VideoRequest):
+    """
+    Analyze a YouTube video to detect dance beats and generate steps.
+    """
+    try:
+        logger.info(f"Received request to analyze video: {request.url}")
+        video_id, duration = await asyncio.to_thread(validate_video_url, request.url)
+        window = parse_window(request.start, request.end, duration)
+        video_id = window_video_id(video_id, window)
+        
+        await asyncio.to_thread(submit_analysis, request.url, video_id, profile=request.profile,
+                                duration=duration, window=window)
         
         # Return immediate response with just the video ID
         return {
             "videoId": video_id,
+            "sourceVideoId": source_video_id(video_id, window),
+            "window": {"start": window[0], "end": window[1]} if window else None,
             "progress": 0,
             "status_message": "Starting analysis..."
         }
@@ -356,114 +898,516 @@ async def analyze_video(request: VideoRequest, background_tasks: BackgroundTasks
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
-async def run_analysis_in_background(url, video_id):
-    """Run the video analysis in the background"""
-    logger.info(f"Starting background analysis for video {video_id}")
+def prepare_media(url, video_id, cancel_token, ffmpeg_threads=None, window=None):
+    """
+    Download the video and audio of a job and publish them in its static directory
+    
+    Download errors other than cancellation are logged and leave the job to
+    the YouTube player fallback. With a (start, end) window only that part of
+    the audio is published (see WINDOW_PARTIAL_DOWNLOAD).
     
+    Returns:
+        Dictionary with the local video_url ("" if unavailable), the duration
+        of the published audio and the window
+    """
+    from video_downloader import download_video_and_audio_process
+    
+    # Create a unique directory for this video in static dir
+    video_dir = os.path.join(STATIC_DIR, video_id)
+    if not os.path.exists(video_dir):
+        logger.info(f"Creating static directory: {video_dir}")
+        os.makedirs(video_dir, exist_ok=True)
+    else:
+        logger.info(f"Static directory already exists: {video_dir}")
+    
+    # Create a videos directory for this video ID
+    video_output_dir = os.path.join(VIDEOS_DIR, video_id)
+    if not os.path.exists(video_output_dir):
+        logger.info(f"Creating videos directory: {video_output_dir}")
+        os.makedirs(video_output_dir, exist_ok=True)
+    else:
+        logger.info(f"Videos directory already exists: {video_output_dir}")
+    
+    # Download the video using yt-dlp
+    logger.info(f"Starting video download for {video_id} from URL: {url}")
+    update_progress(video_id, 5, "Downloading video from YouTube...")
     try:
-        # Create a unique directory for this video in static dir
-        video_dir = os.path.join(STATIC_DIR, video_id)
-        if not os.path.exists(video_dir):
-            logger.info(f"Creating static directory: {video_dir}")
-            os.makedirs(video_dir, exist_ok=True)
-        else:
-            logger.info(f"Static directory already exists: {video_dir}")
+        with metrics.STAGE_SECONDS.time(stage="video_download", separator="none", engine="none"):
+            video_info = download_video_and_audio_process(url, video_output_dir, timeout=DOWNLOAD_TIMEOUT,
+                                                          cancel_token=cancel_token, ffmpeg_threads=ffmpeg_threads,
+                                                          section=window if WINDOW_PARTIAL_DOWNLOAD else None)
+        logger.info(f"Successfully downloaded video: {video_info.get('video_path', 'Not available')}")
+        logger.info(f"Successfully downloaded audio: {video_info.get('audio_path', 'Not available')}")
+        
+        # Update progress after download
+        update_progress(video_id, 12, "Video and audio downloaded, preparing files...")
+        
+        # Create symbolic link to the video in static directory
+        video_path = video_info.get('video_path', None)
+        static_video_path = os.path.join(video_dir, "video.mp4")
         
-        # Create a videos directory for this video ID
-        video_output_dir = os.path.join(VIDEOS_DIR, video_id)
-        if not os.path.exists(video_output_dir):
-            logger.info(f"Creating videos directory: {video_output_dir}")
-            os.makedirs(video_output_dir, exist_ok=True)
+        # Also get the audio path from the download function
+        audio_path = video_info.get('audio_path', None)
+        static_audio_path = os.path.join(video_dir, "original_audio.wav")
+        
+        # Copy the audio file for the beat detector to use directly
+        if audio_path and os.path.exists(audio_path) and window and not WINDOW_PARTIAL_DOWNLOAD:
+            logger.info(f"Cutting {window[0]:.1f}s to {window[1]:.1f}s of the audio to {static_audio_path}")
+            decode_audio(audio_path, static_audio_path, cancel_token, window)
+        elif audio_path and os.path.exists(audio_path):
+            logger.info(f"Copying original audio file to static directory: {static_audio_path}")
+            shutil.copy2(audio_path, static_audio_path)
+            logger.info(f"Successfully copied audio file: {audio_path} -> {static_audio_path}")
         else:
-            logger.info(f"Videos directory already exists: {video_output_dir}")
+            logger.warning(f"Audio file not found or not accessible: {audio_path}")
         
-        # Download the video using yt-dlp
-        logger.info(f"Starting video download for {video_id} from URL: {url}")
-        update_progress(video_id, 5, "Downloading video from YouTube...")
-        try:
-            video_info = download_video_and_audio(url, video_output_dir)
-            logger.info(f"Successfully downloaded video: {video_info.get('video_path', 'Not available')}")
-            logger.info(f"Successfully downloaded audio: {video_info.get('audio_path', 'Not available')}")
-            
-            # Update progress after download
-            update_progress(video_id, 12, "Video and audio downloaded, preparing files...")
-            
-            # Create symbolic link to the video in static directory
-            video_path = video_info.get('video_path', None)
-            static_video_path = os.path.join(video_dir, "video.mp4")
-            
-            # Also get the audio path from the download function
-            audio_path = video_info.get('audio_path', None)
-            static_audio_path = os.path.join(video_dir, "original_audio.wav")
-            
-            # Copy the audio file for the beat detector to use directly
-            if audio_path and os.path.exists(audio_path):
-                logger.info(f"Copying original audio file to static directory: {static_audio_path}")
-                shutil.copy2(audio_path, static_audio_path)
-                logger.info(f"Successfully copied audio file: {audio_path} -> {static_audio_path}")
-            else:
-                logger.warning(f"Audio file not found or not accessible: {audio_path}")
-            
-            # Update progress after copying audio
-            update_progress(video_id, 13, "Audio prepared for analysis...")
+        # Update progress after copying audio
+        update_progress(video_id, 13, "Audio prepared for analysis...")
+        
+        # Copy the video file to the static directory
+        video_url = ""
+        if video_path and os.path.exists(video_path):
+            logger.info(f"Copying video file to static directory: {static_video_path}")
             
-            # Copy the video file to the static directory
-            video_url = ""
-            if video_path and os.path.exists(video_path):
-                logger.info(f"Copying video file to static directory: {static_video_path}")
+            try:
+                shutil.copy2(video_path, static_video_path)
+                logger.info(f"Successfully copied video file: {video_path} -> {static_video_path}")
                 
-                try:
-                    shutil.copy2(video_path, static_video_path)
-                    logger.info(f"Successfully copied video file: {video_path} -> {static_video_path}")
-                    
-                    # Update video URL for frontend
-                    video_url = f"/static/{video_id}/video.mp4"
-                    logger.info(f"Video available at: {video_url}")
-                except Exception as copy_error:
-                    logger.error(f"Error copying video file: {str(copy_error)}")
-                    video_url = ""
-            else:
-                logger.error(f"Source video file not found: {video_path}")
+                # Update video URL for frontend
+                video_url = f"/static/{video_id}/video.mp4"
+                logger.info(f"Video available at: {video_url}")
+            except Exception as copy_error:
+                logger.error(f"Error copying video file: {str(copy_error)}")
                 video_url = ""
-            
-            # Set video duration from metadata
-            duration = video_info.get('duration', 180)  # Default to 3 minutes if missing
-            logger.info(f"Video duration: {duration} seconds")
-            
-            # Also copy the thumbnail if available
-            if video_info.get('thumbnail_path') and os.path.exists(video_info.get('thumbnail_path')):
-                thumbnail_ext = os.path.splitext(video_info.get('thumbnail_path'))[1]
-                static_thumb_path = os.path.join(video_dir, f"thumbnail{thumbnail_ext}")
-                logger.info(f"Copying thumbnail: {video_info.get('thumbnail_path')} -> {static_thumb_path}")
-                try:
-                    shutil.copy2(video_info.get('thumbnail_path'), static_thumb_path)
-                    logger.info("Thumbnail copied successfully")
-                except Exception as thumb_error:
-                    logger.error(f"Error copying thumbnail: {str(thumb_error)}")
-            else:
-                logger.warning(f"Thumbnail not found or not accessible: {video_info.get('thumbnail_path')}")
-            
-            update_progress(video_id, 15, "Media files prepared successfully")
-        except Exception as download_e:
-            logger.error(f"Error downloading video: {str(download_e)}")
-            logger.error(traceback.format_exc())
-            # Fallback to the original YouTube ID for streaming if download fails
+        elif window and WINDOW_PARTIAL_DOWNLOAD:
+            # The YouTube player plays it, in the same time as the results
+            logger.info(f"No video downloaded for the window of {video_id}")
+        else:
+            logger.error(f"Source video file not found: {video_path}")
             video_url = ""
-            # Use a default duration if needed
-            duration = 180  # 3 minutes default
-            update_progress(video_id, 15, "Video download failed, using YouTube player as fallback")
+        
+        # Set video duration from metadata
+        duration = video_info.get('duration', 180)  # Default to 3 minutes if missing
+        logger.info(f"Video duration: {duration} seconds")
+        if window:
+            duration = window[1] - window[0]
+        
+        # Also copy the thumbnail if available
+        if video_info.get('thumbnail_path') and os.path.exists(video_info.get('thumbnail_path')):
+            thumbnail_ext = os.path.splitext(video_info.get('thumbnail_path'))[1]
+            static_thumb_path = os.path.join(video_dir, f"thumbnail{thumbnail_ext}")
+            logger.info(f"Copying thumbnail: {video_info.get('thumbnail_path')} -> {static_thumb_path}")
+            try:
+                shutil.copy2(video_info.get('thumbnail_path'), static_thumb_path)
+                logger.info("Thumbnail copied successfully")
+            except Exception as thumb_error:
+                logger.error(f"Error copying thumbnail: {str(thumb_error)}")
+        else:
+            logger.warning(f"Thumbnail not found or not accessible: {video_info.get('thumbnail_path')}")
+        
+        update_progress(video_id, 15, "Media files prepared successfully")
+    except JobCancelled:
+        raise
+    except Exception as download_e:
+        logger.error(f"Error downloading video: {str(download_e)}")
+        logger.error(traceback.format_exc())
+        # Fallback to the original YouTube ID for streaming if download fails
+        video_url = ""
+        # Use a default duration if needed
+        duration = window[1] - window[0] if window else 180  # 3 minutes default
+        update_progress(video_id, 15, "Video download failed, using YouTube player as fallback")
+        return {"video_url": video_url, "duration": duration, "window": window, "download_error": str(download_e)}
+    
+    return {"video_url": video_url, "duration": duration, "window": window}
+
+def upload_duration(path):
+    """Duration read from the header of an audio upload; None for other formats, which get the default"""
+    import soundfile as sf
+    try:
+        return sf.info(path).duration
+    except RuntimeError:
+        return None
+
+@app.post("/api/upload")
+async def analyze_upload(request: Request, profile: bool = False, start: Optional[float] = None,
+                         end: Optional[float] = None):
+    """
+    Analyze an uploaded audio or video file (multipart/form-data, field "file").
+    
+    The upload is streamed to disk and hashed on the fly, so the file is never
+    held in memory. Files are identified by their content hash: a file that
+    was already analyzed, or is being analyzed, is not processed again.
+    With start/end only that window of the file is analyzed.
+    """
+    try:
+        upload = StreamingUpload(request.headers.get("content-type"), STATIC_DIR, max_bytes=MAX_UPLOAD_BYTES)
+        await upload.consume(request.stream())
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    duration = await asyncio.to_thread(upload_duration, upload.path)
+    try:
+        window = parse_window(start, end, duration)
+    except ValueError as e:
+        upload.discard()
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    video_id = window_video_id(f"upload-{upload.sha256[:16]}", window)
+    progress_info = video_progress.get(video_id, {})
+    already_done = progress_info.get("completed") and not (progress_info.get("data") or {}).get("error") \
+        and not (progress_info.get("data") or {}).get("cancelled")
+    # The file is only moved into the video's directory once submit_analysis claimed the video,
+    # so of two identical uploads arriving together one queues the job and the other reuses it
+    extension = os.path.splitext(upload.filename or "")[1].lower() or ".bin"
+    source_path = os.path.join(STATIC_DIR, video_id, f"upload{extension}")
+    if already_done or not await asyncio.to_thread(submit_analysis, "", video_id, profile=profile,
+                                                   source_path=source_path, duration=duration, window=window,
+                                                   staged_path=upload.path):
+        await asyncio.to_thread(upload.discard)
+        logger.info(f"Upload {upload.filename} matches video {video_id}, reusing its analysis")
+        return {"videoId": video_id, "cached": True, "progress": video_progress.get(video_id, {}).get("progress", 0)}
+    
+    return {
+        "videoId": video_id,
+        "cached": False,
+        "progress": 0,
+        "status_message": "Starting analysis..."
+    }
+
+class BatchRequest(BaseModel):
+    urls: List[str] = []
+    playlist_url: str = ""  # Expanded into its videos and appended to urls
+    profile: bool = False
+
+# Submitted batches by ID: the video IDs in submission order and the rejected URLs
+batches = {}
+
+@app.post("/api/batch")
+async def analyze_batch(request: BatchRequest):
+    """
+    Queue several videos for analysis at once.
+    
+    Downloads and analyses of the batch run with the queue's bounded
+    parallelism; GET /api/batch/{batch_id} reports the aggregate progress.
+    Invalid URLs are reported as rejected instead of failing the batch.
+    """
+    urls = list(request.urls)
+    if request.playlist_url:
+        from video_downloader import expand_playlist
+        try:
+            urls += await asyncio.to_thread(expand_playlist, request.playlist_url, MAX_BATCH_SIZE)
+        except Exception as e:
+            logger.error(f"Error expanding playlist {request.playlist_url}: {str(e)}")
+            raise HTTPException(status_code=400, detail=f"Could not read playlist: {str(e)}")
+    if not urls:
+        raise HTTPException(status_code=400, detail="No videos to analyze")
+    if len(urls) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batches are limited to {MAX_BATCH_SIZE} videos")
+    
+    # Video ID extraction may query YouTube, so validate all URLs concurrently off the event loop
+    validated = await asyncio.gather(*(asyncio.to_thread(validate_video_url, url) for url in urls),
+                                     return_exceptions=True)
+    
+    batch_id = uuid.uuid4().hex[:12]
+    video_ids, rejected = [], []
+    for url, info in zip(urls, validated):
+        if isinstance(info, Exception):
+            rejected.append({"url": url, "error": str(info)})
+            continue
+        video_id, duration = info
+        if video_id in video_ids:
+            continue
+        await asyncio.to_thread(submit_analysis, url, video_id, profile=request.profile, batch_id=batch_id,
+                                duration=duration)
+        video_ids.append(video_id)
+    
+    batches[batch_id] = {"video_ids": video_ids, "rejected": rejected, "created": time.time()}
+    logger.info(f"Batch {batch_id}: queued {len(video_ids)} videos, rejected {len(rejected)} URLs")
+    return {"batchId": batch_id, "videoIds": video_ids, "rejected": rejected}
+
+def job_state(progress_info):
+    """Summarize a progress record as queued, running, completed, failed or cancelled"""
+    data = progress_info.get("data") or {}
+    if progress_info.get("completed"):
+        if data.get("cancelled"):
+            return "cancelled"
+        if data.get("error"):
+            return "failed"
+        return "completed"
+    return "running" if progress_info.get("progress", 0) > 0 else "queued"
+
+@app.get("/api/batch/{batch_id}")
+async def get_batch_progress(batch_id: str):
+    """Aggregate progress of a batch, with the state of each video."""
+    batch = batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Unknown batch")
+    
+    videos = []
+    counts = {"queued": 0, "running": 0, "completed": 0, "failed": 0, "cancelled": 0}
+    for video_id in batch["video_ids"]:
+        progress_info = video_progress.get(video_id, {})
+        state = job_state(progress_info)
+        counts[state] += 1
+        videos.append({
+            "videoId": video_id,
+            "state": state,
+            "progress": progress_info.get("progress", 0),
+            "status_message": progress_info.get("status_message", ""),
+        })
+        if video_id in job_seconds_to_result:
+            videos[-1]["seconds_to_result"] = round(job_seconds_to_result[video_id], 1)
+    total = len(videos)
+    queue_stats = await asyncio.to_thread(durable_queue.stats) if durable_queue is not None else job_queue.stats()
+    # Median rather than mean, so one long recording does not hide how fast the short songs finished
+    seconds_to_result = [video["seconds_to_result"] for video in videos if "seconds_to_result" in video]
+    return {
+        "batchId": batch_id,
+        "total": total,
+        "counts": counts,
+        "progress": round(sum(video["progress"] for video in videos) / total, 1) if total else 100,
+        "done": counts["queued"] + counts["running"] == 0,
+        "elapsed_seconds": round(time.time() - batch["created"], 1),
+        "median_seconds_to_result": round(statistics.median(seconds_to_result), 1) if seconds_to_result else None,
+        "videos": videos,
+        "rejected": batch["rejected"],
+        "queue": queue_stats,
+    }
+
+@app.delete("/api/batch/{batch_id}")
+async def cancel_batch(batch_id: str):
+    """Cancel every queued or running job of a batch."""
+    batch = batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Unknown batch")
+    cancelled = await asyncio.to_thread(lambda: [video_id for video_id in batch["video_ids"]
+                                                 if cancel_analysis(video_id)])
+    logger.info(f"Cancelled {len(cancelled)} jobs of batch {batch_id}")
+    return {"batchId": batch_id, "cancelled": cancelled}
+
+def prefetch_job_media(job):
+    """Download stage of the job queue"""
+    start = time.perf_counter()
+    if job.source_path:
+        try:
+            job.media = prepare_upload_media(job.video_id, job.source_path, job.cancel_token, window=job.window)
+        except (ValueError, RuntimeError, OSError) as e:
+            # Reported as the job's failure by the analysis stage
+            logger.error(f"Error decoding upload for {job.video_id}: {str(e)}")
+            job.media = {"video_url": "", "duration": 0, "error": str(e)}
+            return
+        cost_model.observe("decode", job.media["duration"], time.perf_counter() - start)
+    else:
+        job.media = prepare_media(job.url, job.video_id, job.cancel_token, ffmpeg_threads=DOWNLOAD_FFMPEG_THREADS,
+                                  window=job.window)
+        # Failed downloads fall back to the YouTube player and a made-up duration
+        if not job.media.get("download_error"):
+            cost_model.observe("download", job.media["duration"], time.perf_counter() - start)
+
+def decode_audio(source_path, audio_path, cancel_token, window=None):
+    """
+    Decode media to a 16-bit WAV, optionally only the (start, end) window in seconds
+    
+    Formats libsndfile reads are converted block by block, seeking straight
+    to the window; everything else, including video containers, goes through
+    ffmpeg.
+    
+    Raises:
+        ValueError: If ffmpeg cannot decode the file
+    """
+    import soundfile as sf
+    
+    try:
+        with sf.SoundFile(source_path) as source, \
+                sf.SoundFile(audio_path, "w", samplerate=source.samplerate, channels=source.channels,
+                             subtype="PCM_16") as target:
+            frames = -1
+            if window:
+                source.seek(min(int(window[0] * source.samplerate), source.frames))
+                frames = int((window[1] - window[0]) * source.samplerate)
+            for block in source.blocks(blocksize=65536, frames=frames):
+                target.write(block)
+    except RuntimeError:
+        # Not a format libsndfile reads
+        cancel_token.check()
+        command = ["ffmpeg", "-y", "-v", "error", "-threads", str(DOWNLOAD_FFMPEG_THREADS)]
+        if window:
+            command += ["-ss", f"{window[0]:.3f}", "-to", f"{window[1]:.3f}"]
+        command += ["-i", source_path, "-vn", "-acodec", "pcm_s16le", audio_path]
+        result = run_killable(command, timeout=UPLOAD_DECODE_TIMEOUT, cancel_token=cancel_token)
+        if result.returncode != 0:
+            raise ValueError(f"Could not decode {os.path.basename(source_path)}: "
+                             f"{result.stderr.decode(errors='replace').strip()}")
+
+def prepare_upload_media(video_id, source_path, cancel_token, window=None):
+    """
+    Decode an uploaded media file, or a window of it, to the WAV the analysis reads
+    
+    MP4 uploads are also published as the video of the job; the whole video,
+    so it plays in the same time as the results of a window.
+    
+    Returns:
+        Dictionary with the local video_url ("" if unavailable), the duration
+        of the decoded audio and the window
+    """
+    import soundfile as sf
+    
+    video_dir = os.path.join(STATIC_DIR, video_id)
+    audio_path = os.path.join(video_dir, "original_audio.wav")
+    update_progress(video_id, 5, "Decoding uploaded file...")
+    decode_audio(source_path, audio_path, cancel_token, window)
+    
+    video_url = ""
+    if os.path.splitext(source_path)[1].lower() == ".mp4":
+        os.replace(source_path, os.path.join(video_dir, "video.mp4"))
+        video_url = f"/static/{video_id}/video.mp4"
+    
+    duration = sf.info(audio_path).duration
+    logger.info(f"Decoded upload for {video_id}: {duration:.1f} seconds")
+    update_progress(video_id, 15, "Uploaded file decoded")
+    return {"video_url": video_url, "duration": duration, "window": window}
+
+def run_queued_job(job):
+    """Analysis stage of the job queue: run the job on a core slice, optionally under the profiler"""
+    with thread_budget.job_slice() as cpu_slice:
+        if job.profile:
+            logger.info(f"Profiling analysis job for video {job.video_id}")
+            profile_path = os.path.join(STATIC_DIR, job.video_id, PROFILE_FILENAME)
+            return profile_call(profile_path, run_analysis_in_background, job.url, job.video_id,
+                                job.cancel_token, cpu_slice, job.media)
+        start = time.perf_counter()
+        run_analysis_in_background(job.url, job.video_id, job.cancel_token, cpu_slice, job.media)
+        # Only complete analyses say how long a video of this duration takes
+        if job_state(video_progress.get(job.video_id, {})) == "completed" and job.media:
+            cost_model.observe("analysis", job.media.get("duration"), time.perf_counter() - start)
+
+job_queue = AnalysisQueue(prefetch_job_media, run_queued_job,
+                          download_workers=MAX_CONCURRENT_DOWNLOADS,
+                          analysis_workers=thread_budget.max_jobs,
+                          prefetch=DOWNLOAD_PREFETCH,
+                          aging_rate=JOB_AGING_RATE)
+
+# The durable queue, opened at startup (or by worker.py) rather than at import,
+# so importing this module creates no queue file
+durable_queue = None
+
+def open_durable_queue(path=None):
+    """Open the durable job queue, at JOB_QUEUE_PATH unless another path is given"""
+    global durable_queue
+    durable_queue = DurableQueue(path or JOB_QUEUE_PATH, lease_seconds=WORKER_LEASE_SECONDS,
+                                 max_attempts=JOB_MAX_ATTEMPTS, wal=JOB_QUEUE_WAL,
+                                 aging_rate=JOB_AGING_RATE)
+    return durable_queue
+
+def active_jobs():
+    """IDs of the videos with a queued or running job or HLS encode, in this process or in the durable queue"""
+    active = set(job_tokens) | set(hls_tokens)
+    if durable_queue is not None:
+        active |= durable_queue.active_video_ids()
+    return active
+
+def cancel_analysis(video_id):
+    """Cancel the queued or running job of a video; returns False if there is none"""
+    if durable_queue is not None and durable_queue.cancel(video_id):
+        return True
+    cancel_token = job_tokens.get(video_id) or hls_tokens.get(video_id)
+    if cancel_token is None:
+        return False
+    cancel_token.cancel()
+    return True
+
+def sync_queue_progress():
+    """
+    Apply the progress records published by the worker processes to video_progress,
+    and enforce the artifact budget after their jobs end
+    """
+    seq = 0
+    while True:
+        finished = set()
+        try:
+            for seq, video_id, record in durable_queue.progress_since(seq):
+                data = record.get("data")
+                update_progress(video_id, record.get("progress", 0), record.get("status_message", ""), data)
+                if record.get("completed"):
+                    finished.add(video_id)
+                    if data and not data.get("error") and not data.get("cancelled"):
+                        artifact_index.refresh(video_id)
+        except Exception as e:
+            logger.error(f"Error reading job progress from the queue: {str(e)}")
+        # The workers do not evict (see run_analysis_in_background)
+        if finished:
+            enforce_artifact_budget(protected=finished)
+        time.sleep(PROGRESS_SYNC_INTERVAL)
+
+# Supervisor of the worker processes started by this API process
+local_workers = None
+
+def start_local_workers():
+    """Start worker.py for this node; it exits when this process does"""
+    global local_workers
+    command = [sys.executable, os.path.join(BACKEND_DIR, "worker.py"), "--processes", str(LOCAL_WORKER_PROCESSES),
+               "--queue", JOB_QUEUE_PATH, "--parent-pid", str(os.getpid())]
+    local_workers = subprocess.Popen(command, cwd=BACKEND_DIR)
+    logger.info(f"Started {LOCAL_WORKER_PROCESSES} local worker processes (supervisor pid {local_workers.pid})")
+
+def shift_result_times(results, offset):
+    """Move the beats, downbeats and steps of an analysis result by offset seconds"""
+    results["beats"] = [beat + offset for beat in results.get("beats", [])]
+    results["downbeats"] = [beat + offset for beat in results.get("downbeats", [])]
+    for step in results.get("steps", []):
+        step["start"] += offset
+        step["end"] += offset
+
+def run_analysis_in_background(url, video_id, cancel_token=None, cpu_slice=None, media=None):
+    """Run the video analysis in the background
+    
+    This is a plain function that runs in a worker thread of the job queue,
+    not on the event loop, which keeps progress polls and cancellation
+    requests responsive while the job runs.
+    
+    With a cpu_slice, worker pools and ffmpeg processes are sized to the
+    slice's threads. media is the result of prepare_media when the queue
+    already downloaded the video; otherwise it is downloaded here.
+    """
+    from beat_detector import BeatDetector
+    
+    logger.info(f"Starting background analysis for video {video_id}")
+    if cancel_token is None:
+        cancel_token = CancellationToken()
+    metrics.JOBS_IN_FLIGHT.inc()
+    
+    try:
+        # Download unless the job queue already did it ahead of the analysis
+        cancel_token.check()
+        if media is None:
+            media = prepare_media(url, video_id, cancel_token, ffmpeg_threads=cpu_slice.threads if cpu_slice else None)
+        if media.get("error"):
+            raise ValueError(media["error"])
+        video_url, duration = media["video_url"], media["duration"]
+        # Every stage works on the window's audio, in time relative to its start
+        window = media.get("window")
+        video_dir = os.path.join(STATIC_DIR, video_id)
+        
+        cancel_token.check()
         
         # Initialize the beat detector with a progress callback
         logger.info(f"Initializing BeatDetector for video {video_id}")
         update_progress(video_id, 16, "Initializing beat detection engine...")
-        detector = BeatDetector(tolerance=0.05)
+        # Under a thread budget torch already uses every core of the slice, so
+        # segment windows run one at a time instead of oversubscribing it
+        detector = BeatDetector(tolerance=0.05, segment_seconds=BEAT_SEGMENT_SECONDS,
+                                segment_workers=1 if cpu_slice else None, analysis_sr=ANALYSIS_SAMPLE_RATE,
+                                persist_features=PERSIST_FEATURES, render_click_tracks=RENDER_CLICK_TRACKS)
         logger.info(f"BeatDetector initialized successfully for {video_id}")
         
         # Create a progress callback
         def progress_callback(percent, message):
             # Scale the percent to start from 15% (after download) to 95%
             scaled_percent = 16 + int(percent * 0.79)
-            logger.info(f"Beat detection progress for {video_id}: {percent}% - {message} (scaled to {scaled_percent}%)")
+            logger.info("Beat detection progress for %s: %s%% - %s (scaled to %s%%)", video_id, percent, message, scaled_percent,
+                        extra={"rate_limit": "progress"})
             update_progress(video_id, scaled_percent, message)
         
         # Analyze the video with progress tracking
@@ -487,24 +1431,34 @@ async def run_analysis_in_background(url, video_id):
                 update_progress(video_id, 20, "Audio verified, starting analysis...")
                 
                 logger.info(f"Calling analyze_video for {video_id} with pre-downloaded audio file")
-                results = detector.analyze_video(audio_file_path, progress_callback=progress_callback, use_audio_path=True)
+                results = detector.analyze_video(audio_file_path, progress_callback=progress_callback, use_audio_path=True,
+                                                 cancel_token=cancel_token)
                 logger.info(f"Beat detection completed successfully for {video_id} using pre-downloaded audio")
+            except JobCancelled:
+                raise
             except Exception as audio_e:
                 logger.error(f"Error using pre-downloaded audio for {video_id}: {str(audio_e)}")
                 logger.error(traceback.format_exc())
+                if not url or window:
+                    # Uploads have no URL to fall back to, and the URL would analyze the whole video
+                    raise
                 logger.info(f"Falling back to URL-based download for {video_id}...")
                 update_progress(video_id, 20, "Pre-downloaded audio failed, fallback in progress...")
                 # Fall back to URL-based download
                 logger.info(f"Calling analyze_video for {video_id} with URL fallback: {url}")
-                results = detector.analyze_video(url, progress_callback=progress_callback)
+                results = detector.analyze_video(url, progress_callback=progress_callback, cancel_token=cancel_token)
                 logger.info(f"URL-based fallback analysis completed for {video_id}")
         else:
             # Fallback to URL-based download inside BeatDetector
             logger.warning(f"Pre-downloaded audio file not found for {video_id} at: {audio_file_path}")
+            if not url:
+                raise ValueError("No decoded audio available for the uploaded file")
+            if window:
+                raise ValueError("The audio of the analysis window could not be downloaded")
             logger.info(f"Using URL for beat detection for {video_id}: {url}")
             update_progress(video_id, 18, "Downloading audio for beat detection...")
             logger.info(f"Calling analyze_video for {video_id} with URL: {url}")
-            results = detector.analyze_video(url, progress_callback=progress_callback)
+            results = detector.analyze_video(url, progress_callback=progress_callback, cancel_token=cancel_token)
             logger.info(f"URL-based analysis completed for {video_id}")
             
         logger.info(f"Beat detection completed for video {video_id}")
@@ -549,6 +1503,13 @@ async def run_analysis_in_background(url, video_id):
                 logger.warning("Not enough beats to generate meaningful steps")
                 results["steps"] = []
         
+        # Clients get absolute video time
+        if window:
+            shift_result_times(results, window[0])
+        
+        cancel_token.check()
+        copy_start = time.perf_counter()
+        
         # Copy audio with clicks to static directory
         audio_url = ""
         if 'audio_with_clicks' in results and results['audio_with_clicks'] and os.path.exists(results['audio_with_clicks']):
@@ -559,7 +1520,7 @@ async def run_analysis_in_background(url, video_id):
                 audio_url = f"/static/{video_id}/audio_with_clicks.wav"
             except Exception as audio_error:
                 logger.error(f"Error copying audio with clicks: {str(audio_error)}")
-        else:
+        elif detector.render_click_tracks:
             logger.warning("Audio with clicks not generated or file does not exist")
             if 'audio_with_clicks' in results:
                 logger.warning(f"Missing file path: {results['audio_with_clicks']}")
@@ -574,7 +1535,7 @@ async def run_analysis_in_background(url, video_id):
                 harmonic_audio_url = f"/static/{video_id}/harmonic_with_clicks.wav"
             except Exception as harmonic_error:
                 logger.error(f"Error copying harmonic audio with clicks: {str(harmonic_error)}")
-        else:
+        elif detector.render_click_tracks:
             logger.warning("Harmonic audio with clicks not generated or file does not exist")
             
         # Copy percussive audio with clicks to static directory
@@ -587,7 +1548,7 @@ async def run_analysis_in_background(url, video_id):
                 percussive_audio_url = f"/static/{video_id}/percussive_with_clicks.wav"
             except Exception as percussive_error:
                 logger.error(f"Error copying percussive audio with clicks: {str(percussive_error)}")
-        else:
+        elif detector.render_click_tracks:
             logger.warning("Percussive audio with clicks not generated or file does not exist")
         
         # Also copy the original harmonic and percussive files
@@ -605,6 +1566,27 @@ async def run_analysis_in_background(url, video_id):
             shutil.copy2(results['percussive_path'], static_percussive_path)
             percussive_url = f"/static/{video_id}/percussive.wav"
         
+        # Copy the spectral feature store so later re-renders can reuse it
+        if 'features_path' in results and results['features_path'] and os.path.exists(results['features_path']):
+            static_features_path = os.path.join(video_dir, "features.npz")
+            logger.info(f"Copying spectral features to {static_features_path}")
+            try:
+                shutil.copy2(results['features_path'], static_features_path)
+            except Exception as features_error:
+                logger.error(f"Error copying spectral features: {str(features_error)}")
+        
+        # Copy the waveform peak pyramids served by /api/waveform
+        waveform_peaks_url = ""
+        for stem, peaks_path in (results.get('peaks_paths') or {}).items():
+            if peaks_path and os.path.exists(peaks_path):
+                static_peaks_path = os.path.join(video_dir, f"peaks_{stem}.bin")
+                logger.info(f"Copying {stem} waveform peaks to {static_peaks_path}")
+                try:
+                    shutil.copy2(peaks_path, static_peaks_path)
+                    waveform_peaks_url = f"/api/waveform/{video_id}"
+                except Exception as peaks_error:
+                    logger.error(f"Error copying {stem} waveform peaks: {str(peaks_error)}")
+        
         # Copy clicks-only audio to static directory
         clicks_only_url = ""
         if 'clicks_only' in results and results['clicks_only'] and os.path.exists(results['clicks_only']):
@@ -612,28 +1594,68 @@ async def run_analysis_in_background(url, video_id):
             logger.info(f"Copying clicks-only audio to {static_clicks_path}")
             shutil.copy2(results['clicks_only'], static_clicks_path)
             clicks_only_url = f"/static/{video_id}/clicks_only.wav"
-        else:
+        elif detector.render_click_tracks:
             logger.warning("Clicks-only audio not generated")
         
-        # Save waveform image if available
-        waveform_image = ""
-        if 'waveform_image' in results and results['waveform_image']:
-            logger.info(f"Waveform image received")
-            
-            # Check if the image data already includes the data:image prefix
-            if isinstance(results['waveform_image'], str) and not results['waveform_image'].startswith('data:image'):
-                waveform_image = results['waveform_image']
-            else:
-                # If it's already prefixed, use it as is
-                waveform_image = results['waveform_image']
-        else:
-            logger.warning("No waveform image data available")
-            waveform_image = ""
+        # Publish the waveform image as a cacheable asset instead of inlining it
+        waveform_image_url = ""
+        if results.get('waveform_image_path') and os.path.exists(results['waveform_image_path']):
+            try:
+                waveform_image_url = publish_asset(video_id, "waveform.png", source_path=results['waveform_image_path'])
+                logger.info(f"Waveform image available at: {waveform_image_url}")
+            except Exception as image_error:
+                logger.error(f"Error publishing waveform image: {str(image_error)}")
+        elif detector.render_waveform_image:
+            logger.warning("No waveform image available")
+        
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - copy_start, stage="artifact_copy",
+                                      separator=detector.separator_type, engine=detector.engine)
+        
+        # The temporary workspace is no longer needed once everything is copied
+        if results.get('temp_dir'):
+            shutil.rmtree(results['temp_dir'], ignore_errors=True)
+        
+        # Encode compressed renditions of every served track
+        cancel_token.check()
+        update_progress(video_id, 96, "Encoding compressed audio...")
+        renditions = {}
+        wav_tracks = {
+            track: os.path.join(video_dir, f"{track}.wav")
+            for track in AUDIO_TRACKS
+            if os.path.exists(os.path.join(video_dir, f"{track}.wav"))
+        }
+        try:
+            with detector.stage_timer("encode"):
+                if cpu_slice:
+                    encoded = encode_renditions(list(wav_tracks.values()), max_workers=cpu_slice.threads, threads_per_encode=1,
+                                                cancel_token=cancel_token)
+                else:
+                    encoded = encode_renditions(list(wav_tracks.values()), cancel_token=cancel_token)
+            for track, wav_path in wav_tracks.items():
+                renditions[track] = {
+                    fmt: f"/static/{video_id}/{os.path.basename(path)}"
+                    for fmt, path in encoded[wav_path].items()
+                }
+        except JobCancelled:
+            raise
+        except Exception as encode_error:
+            logger.error(f"Error encoding compressed renditions: {str(encode_error)}")
+            logger.error(traceback.format_exc())
+        
+        # The video is segmented for streaming after the result is published (see
+        # encode_hls_follow_up); players use video_url until hls_url is set. Windows
+        # skip it, so their cost stays proportional to the window
+        static_video_path = os.path.join(video_dir, "video.mp4")
+        hls_pending = VIDEO_HLS_ENABLED and bool(video_url) and not window and os.path.exists(static_video_path)
         
         # Update progress with complete data
         final_results = {
             "videoId": video_id,
-            "duration": results.get("duration", duration),  # Use previously set duration as fallback
+            # Players embed the source video, starting at the window
+            "sourceVideoId": source_video_id(video_id, window),
+            # Use previously set duration as fallback; windows end at their end in video time
+            "duration": window[1] if window else results.get("duration", duration),
+            "window": {"start": window[0], "end": window[1]} if window else None,
             "beats": results.get("beats", []),
             "downbeats": results.get("downbeats", []),
             "steps": results.get("steps", []),
@@ -644,22 +1666,53 @@ async def run_analysis_in_background(url, video_id):
             "harmonic_original_url": harmonic_url,
             "percussive_original_url": percussive_url,
             "clicks_only_url": clicks_only_url,
-            "waveform_image": waveform_image,
+            "waveform_image_url": waveform_image_url,
+            "waveform_peaks_url": waveform_peaks_url,
+            "beat_map_url": f"/api/beats/{video_id}",
+            "click_mix_url": f"/api/mix/{video_id}" if harmonic_url and percussive_url else "",
+            "renditions": renditions,
             "video_url": video_url,
+            "hls_url": "",
+            "hls_pending": hls_pending,
             "completed": True  # Explicitly mark as completed
         }
         
+        # Record the artifacts so the result survives a restart
+        try:
+            artifact_index.write(video_id, final_results)
+        except Exception as manifest_error:
+            logger.error(f"Error writing manifest for {video_id}: {str(manifest_error)}")
+        
         # Update progress with complete data and ensure it's marked as done
         update_progress(video_id, 100, "Analysis complete", final_results)
+        metrics.JOBS_TOTAL.inc(status="completed")
+        for entry in os.scandir(video_dir):
+            if entry.is_file():
+                metrics.BYTES_WRITTEN.inc(entry.stat().st_size, kind=os.path.splitext(entry.name)[1].lstrip(".") or "other")
         
         # Log success
         logger.info(f"Background analysis complete for video {video_id}.")
         logger.info(f"Found {len(results.get('beats', []))} beats and {len(results.get('downbeats', []))} downbeats.")
         logger.info(f"Generated {len(results.get('steps', []))} dance steps.")
         
+        if hls_pending:
+            hls_tokens[video_id] = CancellationToken()
+            hls_executor.submit(encode_hls_follow_up, video_id, final_results, hls_tokens[video_id],
+                                threads=cpu_slice.threads if cpu_slice else None)
+        
         # Return the results to signal completion
         return final_results
         
+    except JobCancelled:
+        logger.info(f"Background analysis cancelled for video {video_id}")
+        cancelled_result = {
+            "videoId": video_id,
+            "cancelled": True,
+            "completed": True
+        }
+        update_progress(video_id, 100, "Analysis cancelled", cancelled_result)
+        metrics.JOBS_TOTAL.inc(status="cancelled")
+        return None
     except Exception as e:
         logger.error(f"Error in background analysis: {str(e)}")
         logger.error(traceback.format_exc())
@@ -670,23 +1723,397 @@ async def run_analysis_in_background(url, video_id):
             "completed": True
         }
         update_progress(video_id, 100, f"Error: {str(e)}", error_result)
+        metrics.JOBS_TOTAL.inc(status="failed")
         return None
+    finally:
+        metrics.JOBS_IN_FLIGHT.dec()
+        if job_tokens.get(video_id) is cancel_token:
+            del job_tokens[video_id]
+        # Worker processes leave eviction to the API, which holds the access times and the
+        # state of the evicted videos; it enforces the budget when it sees the job end
+        if progress_publisher is None:
+            enforce_artifact_budget(protected={video_id})
+
+# Runs the HLS encodes that follow completed analyses, off the analysis slots
+hls_executor = ThreadPoolExecutor(max_workers=VIDEO_HLS_WORKERS, thread_name_prefix="hls")
+
+def encode_hls_follow_up(video_id, final_results, cancel_token, threads=None):
+    """
+    Encode the HLS ladder of a completed analysis and publish its hls_url
+
+    Runs after the result is published, so users get their beats without
+    waiting for the video encode and the analysis slot is free for the next
+    job. The result is republished with hls_url set (empty if the encode
+    failed) and hls_pending cleared.
+
+    Args:
+        video_id: Video whose static video.mp4 is encoded
+        final_results: The published analysis result
+        cancel_token: Token that stops the encode, see cancel_analysis
+        threads: Thread limit passed to ffmpeg
+    """
+    video_dir = os.path.join(STATIC_DIR, video_id)
+    hls_url = ""
+    try:
+        with metrics.STAGE_SECONDS.time(stage="hls", separator="none", engine="none"):
+            master_path = encode_hls(os.path.join(video_dir, "video.mp4"), os.path.join(video_dir, "hls"),
+                                     final_results["beats"], final_results["downbeats"], final_results["duration"] or 0,
+                                     threads=threads, timeout=VIDEO_HLS_TIMEOUT, cancel_token=cancel_token)
+        if master_path:
+            hls_url = f"/static/{video_id}/hls/{os.path.basename(master_path)}"
+    except JobCancelled:
+        logger.info(f"HLS encode of {video_id} cancelled")
+    except Exception as hls_error:
+        logger.error(f"Error encoding HLS ladder: {str(hls_error)}")
+        logger.error(traceback.format_exc())
+    finally:
+        if hls_tokens.get(video_id) is cancel_token:
+            del hls_tokens[video_id]
+    
+    # Evicted or reanalyzed meanwhile
+    if not os.path.isdir(video_dir) or video_progress.get(video_id, {}).get("data") is not final_results:
+        return
+    results = dict(final_results, hls_url=hls_url, hls_pending=False)
+    try:
+        artifact_index.write(video_id, results)
+    except Exception as manifest_error:
+        logger.error(f"Error writing manifest for {video_id}: {str(manifest_error)}")
+    update_progress(video_id, 100, "Analysis complete", results)
+
+def enforce_artifact_budget(protected=()):
+    """Keep the artifact directories within the disk budget, sparing active jobs and protected videos"""
+    try:
+        artifact_janitor.enforce(protected=active_jobs() | set(protected))
+    except Exception as e:
+        logger.error(f"Error enforcing artifact budget: {str(e)}")
+
+@app.get("/api/storage")
+async def get_storage_report():
+    """Report artifact disk usage, the budget and how many bytes could be reclaimed."""
+    return await asyncio.to_thread(lambda: artifact_janitor.report(protected=active_jobs()))
+
+@app.post("/api/storage/cleanup")
+async def cleanup_storage():
+    """Remove orphaned temp workspaces and evict least recently used videos over the budget."""
+    return await asyncio.to_thread(lambda: artifact_janitor.enforce(protected=active_jobs()))
+
+@app.delete("/api/jobs/{video_id}")
+async def cancel_job(video_id: str):
+    """
+    Cancel a running analysis job.
+    
+    The job stops at its next stage boundary; running download processes are
+    killed immediately.
+    """
+    if not await asyncio.to_thread(cancel_analysis, video_id):
+        logger.warning(f"Cancel requested for unknown or finished job: {video_id}")
+        raise HTTPException(status_code=404, detail="No running job for this video")
+    
+    logger.info(f"Cancelling analysis job for video {video_id}")
+    update_progress(video_id, video_progress.get(video_id, {}).get("progress", 0), "Cancelling analysis...")
+    return {
+        "videoId": video_id,
+        "cancelled": True
+    }
+
+# Audio tracks served from a video's static directory, each as <track>.wav
+# plus compressed renditions
+AUDIO_TRACKS = (
+    "audio_with_clicks",
+    "harmonic_with_clicks",
+    "percussive_with_clicks",
+    "harmonic",
+    "percussive",
+    "clicks_only",
+    "original_audio",
+)
+
+def serve_audio_track(video_id, track, request, format=None):
+    """Serve an audio track in the best format the client accepts."""
+    if track not in AUDIO_TRACKS:
+        raise HTTPException(status_code=404, detail=f"Unknown audio track: {track}")
+    artifact_janitor.touch(video_id)
+    
+    wav_path = os.path.join(STATIC_DIR, video_id, f"{track}.wav")
+    if not os.path.exists(wav_path):
+        logger.error(f"Audio file not found: {wav_path}")
+        raise HTTPException(status_code=404, detail="Audio file not found")
+    
+    if artifact_index.get(video_id):
+        available = ["wav"] + [fmt for fmt in RENDITION_FORMATS
+                               if artifact_index.has(video_id, os.path.basename(rendition_path(wav_path, fmt)))]
+    else:
+        available = ["wav"] + [fmt for fmt in RENDITION_FORMATS if os.path.exists(rendition_path(wav_path, fmt))]
+    fmt = negotiate_format(request.headers.get("accept"), available, format)
+    if fmt is None:
+        raise HTTPException(status_code=406, detail=f"Format not available: {format}")
+    
+    headers = {"Vary": "Accept"}
+    if fmt == "wav":
+        return serve_media(request, wav_path, "audio/wav", headers)
+    return serve_media(request, rendition_path(wav_path, fmt), RENDITION_FORMATS[fmt]["media_type"], headers)
 
 @app.get("/api/audio/{video_id}")
-async def get_audio_with_clicks(video_id: str):
+async def get_audio_with_clicks(video_id: str, request: Request, format: str = None):
     """
     Serve the audio file with clicks for a specific video.
     """
-    audio_path = os.path.join(STATIC_DIR, video_id, "audio_with_clicks.wav")
+    return serve_audio_track(video_id, "audio_with_clicks", request, format)
+
+@app.get("/api/audio/{video_id}/{track}")
+async def get_audio_track(video_id: str, track: str, request: Request, format: str = None):
+    """
+    Serve any audio track of a video, negotiating Opus/AAC/WAV via Accept or ?format=.
+    """
+    return serve_audio_track(video_id, track, request, format)
+
+def render_waveform_image(video_id):
+    """
+    Render and publish the waveform PNG of a completed analysis
     
+    Reads the HPSS masks from the persisted features.npz when the job kept
+    it, so only the STFT is recomputed from the audio.
+    
+    Returns:
+        Path of the published PNG
+    """
+    from feature_store import FeatureStore
+    from beat_detector import render_waveform_image as render_png
+    
+    data = (video_progress.get(video_id) or {}).get("data") or {}
+    video_dir = os.path.join(STATIC_DIR, video_id)
+    audio_path = os.path.join(video_dir, "original_audio.wav")
     if not os.path.exists(audio_path):
-        logger.error(f"Audio file not found: {audio_path}")
-        raise HTTPException(status_code=404, detail="Audio file not found")
+        raise HTTPException(status_code=404, detail="Audio not found")
+    
+    features_path = os.path.join(video_dir, "features.npz")
+    if os.path.exists(features_path):
+        features = FeatureStore.load(features_path, audio_path)
+    else:
+        features = FeatureStore(audio_path, sr=ANALYSIS_SAMPLE_RATE)
+    
+    # The audio of a window starts at its start
+    offset = window_offset(video_id)
+    beats = [beat - offset for beat in data.get("beats", [])]
+    downbeats = [beat - offset for beat in data.get("downbeats", [])]
+    image = io.BytesIO()
+    render_png(features, beats, downbeats, image)
+    url = publish_asset(video_id, "waveform.png", data=image.getvalue())
+    return os.path.join(STATIC_DIR, video_id, os.path.basename(url))
+
+@app.get("/api/waveform-image/{video_id}")
+async def get_waveform_image(video_id: str, request: Request):
+    """
+    Serve the matplotlib waveform image, rendering it on first request.
+    
+    Jobs no longer render it by default; players draw the /api/waveform peaks.
+    """
+    progress_info = video_progress.get(video_id, {})
+    if not progress_info.get("completed") or "beats" not in (progress_info.get("data") or {}):
+        raise HTTPException(status_code=404, detail="Analysis results not found")
+    artifact_janitor.touch(video_id)
+    
+    video_dir = os.path.join(STATIC_DIR, video_id)
+    published = sorted(name for name in os.listdir(video_dir)
+                       if name.startswith("waveform-") and name.endswith(".png")) if os.path.isdir(video_dir) else []
+    if published:
+        image_path = os.path.join(video_dir, published[0])
+    else:
+        image_path = await asyncio.to_thread(render_waveform_image, video_id)
+    return serve_media(request, image_path, "image/png")
+
+@app.get("/api/waveform/{video_id}")
+async def get_waveform_peaks(video_id: str, stem: str = "mix", zoom: int = 0, start: float = 0.0, end: float = None):
+    """
+    Serve min/max waveform peaks for a time range at a given zoom level.
+    
+    The body holds interleaved (min, max) pairs as little-endian int8 or int16;
+    zoom 0 is the coarsest overview and each level doubles the resolution.
+    Times are video time, also for analyses of a window.
+    """
+    if stem not in ("mix", "harmonic", "percussive"):
+        raise HTTPException(status_code=400, detail=f"Unknown stem: {stem}")
+    
+    peaks_path = os.path.join(STATIC_DIR, video_id, f"peaks_{stem}.bin")
+    if not os.path.exists(peaks_path):
+        logger.error(f"Waveform peaks not found: {peaks_path}")
+        raise HTTPException(status_code=404, detail="Waveform peaks not found")
+    artifact_janitor.touch(video_id)
+    
+    from waveform_peaks import read_peak_range
+    
+    offset = window_offset(video_id)
+    try:
+        info, data = read_peak_range(peaks_path, zoom, start - offset, None if end is None else end - offset)
+    except ValueError as e:
+        logger.error(f"Error reading waveform peaks {peaks_path}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    headers = {
+        "X-Peaks-Sample-Rate": str(info["sample_rate"]),
+        "X-Peaks-Bits": str(info["bits"]),
+        "X-Peaks-Zoom": str(info["zoom"]),
+        "X-Peaks-Max-Zoom": str(info["max_zoom"]),
+        "X-Peaks-Samples-Per-Bucket": str(info["samples_per_bucket"]),
+        "X-Peaks-Start-Bucket": str(info["start_bucket"]),
+        "X-Peaks-Start-Time": f"{info['start_time'] + offset:.6f}",
+        "Access-Control-Expose-Headers": "X-Peaks-Sample-Rate, X-Peaks-Bits, X-Peaks-Zoom, X-Peaks-Max-Zoom, "
+                                         "X-Peaks-Samples-Per-Bucket, X-Peaks-Start-Bucket, X-Peaks-Start-Time",
+    }
+    return Response(content=data, media_type="application/octet-stream", headers=headers)
+
+# Stem files mixed by /api/mix, relative to the video's static directory
+MIX_STEMS = {
+    "mix": "original_audio.wav",
+    "harmonic": "harmonic.wav",
+    "percussive": "percussive.wav",
+}
+
+def encode_click_mix(mixer, video_dir, key, first_frame, last_frame, fmt):
+    """
+    Encode a mix to a compressed file cached in the video's directory
     
-    return FileResponse(audio_path, media_type="audio/wav")
+    Returns:
+        Path of the cached file, or None if the encode failed
+    """
+    cached_path = os.path.join(video_dir, f"mix_{key}{RENDITION_FORMATS[fmt]['extension']}")
+    if os.path.exists(cached_path):
+        return cached_path
+    wav_path = os.path.join(video_dir, f".mix_{key}_{uuid.uuid4().hex}.wav")
+    try:
+        mixer.write_wav(wav_path, first_frame, last_frame)
+        encoded_path = encode_rendition(wav_path, fmt)
+        if encoded_path is None:
+            return None
+        os.replace(encoded_path, cached_path)
+        return cached_path
+    finally:
+        if os.path.exists(wav_path):
+            os.remove(wav_path)
+
+@app.get("/api/mix/{video_id}")
+async def get_click_mix(video_id: str, request: Request, mix: float = 1.0, harmonic: float = 0.0,
+                        percussive: float = 0.0, clicks: float = 1.0, start: float = 0.0,
+                        end: float = None, format: str = None, normalize: bool = True):
+    """
+    Stream a mix of the stored stems and the click track, rendered on the fly.
+    
+    Per-stem gains are linear; with normalize enabled each stem is first scaled
+    to a 0.7 peak and the clicks to a 0.8 peak, like the pre-rendered click
+    tracks. Only the requested time range (in video time) is rendered. Without
+    ?format= the format is negotiated via Accept like /api/audio: Opus and AAC
+    mixes are encoded once and cached next to the stems, WAV output is
+    streamed and honours HTTP Range requests.
+    """
+    if format not in (None, "wav", "pcm", *RENDITION_FORMATS):
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    
+    from waveform_peaks import read_peak_amplitude
+    from click_mixer import ClickMixer, parse_range_header, WAV_HEADER_SIZE, SAMPLE_WIDTH
+    
+    progress_info = video_progress.get(video_id, {})
+    data = progress_info.get("data") or {}
+    if not progress_info.get("completed") or "beats" not in data:
+        raise HTTPException(status_code=404, detail="Analysis results not found")
+    
+    video_dir = os.path.join(STATIC_DIR, video_id)
+    stem_paths = {
+        stem: os.path.join(video_dir, filename)
+        for stem, filename in MIX_STEMS.items()
+        if os.path.exists(os.path.join(video_dir, filename))
+    }
+    if not stem_paths:
+        raise HTTPException(status_code=404, detail="Audio stems not found")
+    artifact_janitor.touch(video_id)
+    
+    gains = {"mix": mix, "harmonic": harmonic, "percussive": percussive}
+    if normalize:
+        for stem in stem_paths:
+            peaks_path = os.path.join(video_dir, f"peaks_{stem}.bin")
+            if gains[stem] and os.path.exists(peaks_path):
+                peak = read_peak_amplitude(peaks_path)
+                if peak > 0:
+                    gains[stem] *= 0.7 / peak
+    
+    # The stems of a window start at its start
+    offset = window_offset(video_id)
+    beats = [beat - offset for beat in data.get("beats", [])]
+    downbeats = [beat - offset for beat in data.get("downbeats", [])]
+    try:
+        if normalize:
+            mixer = ClickMixer(stem_paths, gains, beats, downbeats, click_gain=clicks, click_peak=0.8)
+        else:
+            mixer = ClickMixer(stem_paths, gains, beats, downbeats, click_gain=clicks * 0.8)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    first_frame = min(max(int((start - offset) * mixer.sr), 0), mixer.num_frames)
+    last_frame = mixer.num_frames if end is None else \
+        min(max(int((end - offset) * mixer.sr), first_frame), mixer.num_frames)
+    
+    fmt = format or negotiate_format(request.headers.get("accept"), ["wav", *RENDITION_FORMATS])
+    if fmt in RENDITION_FORMATS:
+        # The cache key covers everything that changes the rendered samples
+        key = hashlib.sha1(repr((sorted(stem_paths), gains, clicks, normalize, beats, downbeats,
+                                 first_frame, last_frame)).encode()).hexdigest()[:16]
+        encoded_path = await asyncio.to_thread(encode_click_mix, mixer, video_dir, key, first_frame, last_frame, fmt)
+        if encoded_path:
+            return serve_media(request, encoded_path, RENDITION_FORMATS[fmt]["media_type"], {"Vary": "Accept"})
+        if format:
+            raise HTTPException(status_code=503, detail=f"Could not encode the mix as {format}")
+        logger.warning(f"Could not encode the mix of {video_id} as {fmt}, streaming WAV")
+    
+    if format == "pcm":
+        headers = {
+            "X-Sample-Rate": str(mixer.sr),
+            "Access-Control-Expose-Headers": "X-Sample-Rate",
+        }
+        return StreamingResponse(mixer.stream_pcm(first_frame, last_frame), media_type="audio/L16", headers=headers)
+    
+    total_size = WAV_HEADER_SIZE + (last_frame - first_frame) * SAMPLE_WIDTH
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Access-Control-Expose-Headers": "Accept-Ranges, Content-Range, Content-Length",
+        "Vary": "Accept",
+    }
+    range_header = request.headers.get("range")
+    if range_header:
+        try:
+            byte_start, byte_end = parse_range_header(range_header, total_size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{total_size}"
+            return Response(status_code=416, headers=headers)
+        status_code = 206
+        headers["Content-Range"] = f"bytes {byte_start}-{byte_end}/{total_size}"
+    else:
+        byte_start, byte_end = 0, total_size - 1
+        status_code = 200
+    headers["Content-Length"] = str(byte_end - byte_start + 1)
+    
+    return StreamingResponse(
+        mixer.stream_wav_bytes(first_frame, last_frame, byte_start, byte_end),
+        status_code=status_code,
+        media_type="audio/wav",
+        headers=headers
+    )
+
+@app.get("/api/profile/{video_id}")
+async def get_profile(video_id: str):
+    """
+    Download the profile of a profiled analysis job.
+    
+    Summarize it locally with: python profiling.py profile.pstats
+    """
+    profile_path = os.path.join(STATIC_DIR, video_id, PROFILE_FILENAME)
+    
+    if not os.path.exists(profile_path):
+        logger.error(f"Profile not found: {profile_path}")
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    return FileResponse(profile_path, media_type="application/octet-stream", filename=f"{video_id}.pstats")
 
 @app.get("/api/video/{video_id}")
-async def get_video(video_id: str):
+async def get_video(video_id: str, request: Request):
     """
     Serve the downloaded video file for a specific video ID.
     """
@@ -696,21 +2123,29 @@ async def get_video(video_id: str):
         logger.error(f"Video file not found: {video_path}")
         raise HTTPException(status_code=404, detail="Video file not found")
     
-    return FileResponse(video_path, media_type="video/mp4")
+    artifact_janitor.touch(video_id)
+    return serve_media(request, video_path, "video/mp4")
 
 @app.get("/api/thumbnail/{video_id}")
-async def get_thumbnail(video_id: str):
+async def get_thumbnail(video_id: str, request: Request):
     """
     Serve the thumbnail image for a specific video ID.
     """
-    # Try to find the thumbnail file with different extensions
+    # Completed analyses list their thumbnail in the manifest
+    thumbnail = artifact_index.find(video_id, "thumbnail")
+    if thumbnail:
+        artifact_janitor.touch(video_id)
+        return serve_media(request, os.path.join(STATIC_DIR, video_id, thumbnail))
+    
+    # Otherwise try to find the thumbnail file with different extensions
     for ext in ['.jpg', '.png', '.webp']:
         thumb_path = os.path.join(STATIC_DIR, video_id, f"thumbnail{ext}")
         if os.path.exists(thumb_path):
             media_type = f"image/{ext[1:]}"
             if ext == '.jpg':
                 media_type = "image/jpeg"
-            return FileResponse(thumb_path, media_type=media_type)
+            artifact_janitor.touch(video_id)
+            return serve_media(request, thumb_path, media_type)
     
     # If no thumbnail found, return a 404
     logger.error(f"Thumbnail not found for video ID: {video_id}")
@@ -726,20 +2161,25 @@ async def analyze_video_dummy(request: VideoRequest):
         logger.info(f"Received request to analyze video (dummy): {request.url}")
         
         video_id = extract_video_id(request.url)
+        youtube_downloader = get_youtube_downloader()
         
         try:
             # Get video details using our simple downloader - more reliable than direct pytube
             logger.info(f"Fetching video information using simple downloader: {request.url}")
             
             # Create a temporary directory for the dummy analysis
-            temp_dir = tempfile.mkdtemp()
+            temp_dir = make_temp_workspace()
             
             # Try to get basic video info without downloading audio
-            _, duration, title = youtube_downloader.download_audio(request.url, temp_dir, max_retries=1)
+            try:
+                _, duration, title = youtube_downloader.download_audio(request.url, temp_dir, max_retries=1)
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
             
             # If we couldn't get the duration, try using pytube directly
             if not duration:
                 try:
+                    from pytube import YouTube
                     yt = YouTube(request.url)
                     duration = yt.length  # Duration in seconds
                     title = yt.title
@@ -752,7 +2192,8 @@ async def analyze_video_dummy(request: VideoRequest):
             logger.info(f"Video duration: {duration} seconds, Title: {title}")
             
             # Create a simple visualization
-            waveform_image = create_dummy_waveform(duration)
+            waveform_png = create_dummy_waveform(duration)
+            waveform_image_url = publish_asset(video_id, "waveform_dummy.png", data=waveform_png) if waveform_png else ""
             
             # Generate 5 equal steps
             num_steps = 5
@@ -773,7 +2214,7 @@ async def analyze_video_dummy(request: VideoRequest):
                 "duration": duration,
                 "steps": steps,
                 "audio_with_clicks_url": "",
-                "waveform_image": waveform_image,
+                "waveform_image_url": waveform_image_url,
                 "is_dummy_data": True  # Flag to indicate this is fallback data
             }
             
@@ -802,9 +2243,12 @@ def create_dummy_waveform(duration):
         duration (float): Duration in seconds
         
     Returns:
-        str: Base64 encoded PNG image
+        bytes: PNG image, empty on failure
     """
     try:
+        import numpy as np
+        import matplotlib.pyplot as plt
+        
         # Create a simple visualization with matplotlib
         plt.figure(figsize=(12, 4))
         
@@ -831,14 +2275,10 @@ def create_dummy_waveform(duration):
         plt.savefig(buffer, format='png', dpi=100)
         plt.close()
         
-        buffer.seek(0)
-        image_data = buffer.getvalue()
-        base64_encoded = base64.b64encode(image_data).decode('utf-8')
-        
-        return base64_encoded
+        return buffer.getvalue()
     except Exception as e:
         logger.error(f"Error creating dummy waveform: {str(e)}")
-        return ""
+        return b""
 
 @app.on_event("startup")
 async def startup_event():
@@ -850,6 +2290,56 @@ async def startup_event():
     logger.info(f"Videos directory: {VIDEOS_DIR}")
     os.makedirs(STATIC_DIR, exist_ok=True)
     os.makedirs(VIDEOS_DIR, exist_ok=True)
+    
+    if JOB_QUEUE_BACKEND == "durable":
+        open_durable_queue()
+    artifact_janitor.load()
+    
+    # Serve the analyses completed before the restart right away
+    recover_completed_analyses()
+    
+    # Jobs run in worker processes; follow their progress and start this node's workers
+    if durable_queue is not None:
+        threading.Thread(target=sync_queue_progress, name="progress-sync", daemon=True).start()
+        if LOCAL_WORKER_PROCESSES:
+            start_local_workers()
+    
+    # Load the heavy subsystems in the background; /api/ready flips when done. With the
+    # durable queue this process never analyzes, the workers warm up instead
+    if durable_queue is None:
+        threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+    
+    # Clean up after previous runs without delaying startup
+    threading.Thread(target=startup_cleanup, name="startup-cleanup", daemon=True).start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop this node's worker processes; their running jobs are retried after a restart."""
+    if local_workers is not None and local_workers.poll() is None:
+        local_workers.terminate()
+
+def recover_completed_analyses():
+    """Rebuild the artifact index and restore the results of completed analyses."""
+    try:
+        manifests = artifact_index.load()
+    except Exception as e:
+        logger.error(f"Error loading artifact manifests: {str(e)}")
+        return
+    for video_id, manifest in manifests.items():
+        if video_id not in video_progress:
+            # An HLS encode still pending at shutdown did not survive it
+            result = dict(manifest["result"], hls_pending=False)
+            update_progress(video_id, 100, "Analysis complete", result)
+    logger.info(f"Recovered {len(manifests)} completed analyses")
+
+def startup_cleanup():
+    """Enforce the artifact budget and remove temp workspaces left by previous runs."""
+    try:
+        cleanup = artifact_janitor.enforce(protected=active_jobs())
+        logger.info(f"Startup cleanup reclaimed {cleanup['reclaimed_bytes']} bytes, "
+                    f"evicted {len(cleanup['evicted_videos'])} videos")
+    except Exception as e:
+        logger.error(f"Error during startup cleanup: {str(e)}")
 
 @app.get("/api/external-check")
 async def external_check(request: Request):
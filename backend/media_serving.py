@@ -0,0 +1,151 @@
+import os
+import re
+import stat
+import anyio
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+from fastapi.responses import Response
+
+# Bytes read per chunk when the server cannot send the file itself
+CHUNK_SIZE = 256 * 1024
+
+def file_etag(st):
+    """Strong ETag from inode, size and modification time"""
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+def parse_byte_range(range_header, size):
+    """
+    Parse a single-range Range header
+
+    Returns:
+        (start, end) inclusive, None if the header should be ignored (absent,
+        malformed or several ranges), or "unsatisfiable"
+    """
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", (range_header or "").strip(), re.ASCII)
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    first, last = match.groups()
+    if not first:
+        # The last N bytes; none of an empty file
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            return "unsatisfiable"
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return "unsatisfiable"
+    return start, min(end, size - 1)
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get("if-range")
+    # A weak ETag or a date other than Last-Modified means the client's copy is stale
+    return if_range is None or if_range == etag or if_range == last_modified
+
+class FileRangeResponse(Response):
+    """
+    Sends (part of) a file.
+
+    Uses the ASGI zero-copy extension when the server offers it, and
+    http.response.pathsend for whole files; otherwise the file is read in
+    CHUNK_SIZE pieces with pread in a worker thread.
+    """
+
+    def __init__(self, path, start, length, status_code, headers, media_type):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.length = length
+        self.whole_file = start == 0 and status_code == 200
+
+    async def __call__(self, scope, receive, send):
+        extensions = scope.get("extensions") or {}
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        if self.whole_file and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": self.path})
+            return
+
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            if "http.response.zerocopy" in extensions:
+                await send({"type": "http.response.zerocopy", "file": fd,
+                            "offset": self.start, "count": self.length, "more_body": False})
+                return
+            offset, remaining = self.start, self.length
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(os.pread, fd, min(CHUNK_SIZE, remaining), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # The file shrank underneath us; end the body anyway
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            os.close(fd)
+
+def serve_file(request, path, media_type, headers=None, accel_prefix=None, accel_root=None):
+    """
+    Serve a file with ETag/Last-Modified validation and single-range support
+
+    Args:
+        request: The incoming request
+        path: File to serve
+        media_type: Content-Type of the file
+        headers: Extra response headers
+        accel_prefix: If set, hand the transfer to nginx with X-Accel-Redirect
+            to accel_prefix + the path relative to accel_root
+        accel_root: Directory that accel_prefix maps to in nginx
+
+    Returns:
+        A response; raises FileNotFoundError if the file does not exist
+    """
+    st = os.stat(path)
+    if not stat.S_ISREG(st.st_mode):
+        raise FileNotFoundError(path)
+    etag = file_etag(st)
+    last_modified = formatdate(st.st_mtime, usegmt=True)
+    base_headers = dict(headers or {})
+    base_headers.update({"ETag": etag, "Last-Modified": last_modified, "Accept-Ranges": "bytes"})
+
+    if accel_prefix:
+        # nginx evaluates the conditionals and Range itself and sends the file with sendfile
+        relative = os.path.relpath(path, accel_root)
+        base_headers["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + quote(relative)
+        return Response(headers=base_headers, media_type=media_type)
+
+    if _not_modified(request, etag, st.st_mtime):
+        return Response(status_code=304, headers=base_headers)
+
+    size = st.st_size
+    byte_range = None
+    if _if_range_matches(request, etag, last_modified):
+        byte_range = parse_byte_range(request.headers.get("range"), size)
+    if byte_range == "unsatisfiable":
+        base_headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=base_headers)
+
+    if byte_range is None:
+        base_headers["Content-Length"] = str(size)
+        return FileRangeResponse(path, 0, size, 200, base_headers, media_type)
+    start, end = byte_range
+    base_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    base_headers["Content-Length"] = str(end - start + 1)
+    return FileRangeResponse(path, start, end - start + 1, 206, base_headers, media_type)
@@ -0,0 +1,222 @@
+import time
+import math
+import threading
+from contextlib import contextmanager
+
+# Minimal Prometheus text-format metrics, so the backend does not need
+# prometheus_client. Only what the analysis pipeline uses is implemented:
+# counters, gauges and histograms with labels. Worker processes publish
+# snapshot() of their counters and histograms, and the API adds them to its
+# own values in generate_latest().
+
+# Bucket bounds in seconds, covering sub-second stages up to long downloads
+STAGE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+    def snapshot(self):
+        """Values as a JSON-serializable list of [label values, value]"""
+        with self._lock:
+            return [[list(key), value] for key, value in sorted(self._values.items())]
+
+    def _merged(self, snapshots):
+        """Own values plus those of the same metric in other processes' snapshots"""
+        with self._lock:
+            values = {key: self._copy(value) for key, value in self._values.items()}
+        for snapshot in snapshots:
+            for key, value in snapshot.get(self.name, ()):
+                key = tuple(key)
+                values[key] = self._add(values[key], value) if key in values else self._copy(value)
+        return values
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    @staticmethod
+    def _add(value, other):
+        return value + other
+
+class Counter(_Metric):
+    """Monotonically increasing value"""
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self, snapshots=()):
+        lines = self._header()
+        for key, value in sorted(self._merged(snapshots).items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+    type_name = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the with-block, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def _copy(value):
+        counts, total = value
+        return list(counts), total
+
+    @staticmethod
+    def _add(value, other):
+        return [a + b for a, b in zip(value[0], other[0])], value[1] + other[1]
+
+    def expose(self, snapshots=()):
+        lines = self._header()
+        for key, (counts, total) in sorted(self._merged(snapshots).items()):
+            for bound, count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+REGISTRY = []
+
+def snapshot():
+    """
+    Values of the counters and histograms of this process, for generate_latest() in another
+
+    Gauges are left out: they describe the state of one process and do not add up.
+    """
+    return {metric.name: metric.snapshot() for metric in REGISTRY if not isinstance(metric, Gauge)}
+
+def merge_snapshots(snapshots):
+    """
+    Add up snapshot() results into one, e.g. those of workers that stopped
+
+    Returns:
+        Snapshot with the summed values of every metric and label set
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for name, values in snapshot.items():
+            totals = merged.setdefault(name, {})
+            for key, value in values:
+                key = tuple(key)
+                if key not in totals:
+                    totals[key] = value
+                elif isinstance(value, list):
+                    # Histogram: [bucket counts, sum]
+                    totals[key] = [[a + b for a, b in zip(totals[key][0], value[0])], totals[key][1] + value[1]]
+                else:
+                    totals[key] += value
+    return {name: [[list(key), value] for key, value in sorted(totals.items())] for name, totals in merged.items()}
+
+def generate_latest(snapshots=()):
+    """
+    Render every registered metric in the Prometheus text exposition format
+
+    Args:
+        snapshots: snapshot() results of other processes, added to this process' values
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose(snapshots))
+    return "\n".join(lines) + "\n"
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# Pipeline metrics
+STAGE_SECONDS = Histogram(
+    "analysis_stage_seconds",
+    "Duration of each analysis pipeline stage in seconds",
+    ("stage", "separator", "engine"),
+)
+JOBS_TOTAL = Counter(
+    "analysis_jobs_total",
+    "Finished analysis jobs by outcome",
+    ("status",),
+)
+TIME_TO_RESULT = Histogram(
+    "analysis_time_to_result_seconds",
+    "Seconds from submission to the result of completed analysis jobs",
+)
+QUEUE_DEPTH = Gauge(
+    "analysis_queue_depth",
+    "Analysis jobs accepted but not started yet",
+)
+JOBS_IN_FLIGHT = Gauge(
+    "analysis_jobs_in_flight",
+    "Analysis jobs currently running",
+)
+CACHE_REQUESTS = Counter(
+    "analysis_cache_requests_total",
+    "Cache lookups by cache and result (hit or miss)",
+    ("cache", "result"),
+)
+BYTES_WRITTEN = Counter(
+    "analysis_artifact_bytes_written_total",
+    "Bytes of artifacts written to the static directory, by kind",
+    ("kind",),
+)
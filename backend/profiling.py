@@ -0,0 +1,74 @@
+import io
+import sys
+import random
+import pstats
+import logging
+import argparse
+import cProfile
+
+# Child of the backend logger, so messages end up in backend.log
+logger = logging.getLogger('backend.profiling')
+
+# File name of the profile saved next to a job's artifacts
+PROFILE_FILENAME = "profile.pstats"
+
+def should_profile(requested, sample_rate):
+    """
+    Decide whether a job runs under the profiler
+
+    Args:
+        requested: True if the client asked for a profile
+        sample_rate: Fraction of all other jobs to profile (0 disables sampling)
+    """
+    return bool(requested) or (sample_rate > 0 and random.random() < sample_rate)
+
+def profile_call(output_path, func, *args, **kwargs):
+    """
+    Run a function under cProfile and save the stats, also if it raises
+
+    Only the calling thread is profiled; work handed to thread pools or
+    subprocesses shows up as time spent waiting on them.
+
+    Args:
+        output_path: Path to write the pstats file to
+        func: Function to run
+        *args, **kwargs: Arguments for func
+
+    Returns:
+        The return value of func
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        try:
+            profiler.dump_stats(output_path)
+            logger.info(f"Saved profile to {output_path}")
+        except Exception as e:
+            logger.error(f"Error saving profile to {output_path}: {str(e)}")
+
+def summarize(profile_path, limit=25, sort="cumulative"):
+    """
+    Summarize a saved profile as text
+
+    Args:
+        profile_path: Path to a pstats file
+        limit: Number of functions to list
+        sort: pstats sort key, e.g. cumulative, tottime or ncalls
+
+    Returns:
+        The summary as a string
+    """
+    output = io.StringIO()
+    stats = pstats.Stats(profile_path, stream=output)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the top functions of a saved job profile")
+    parser.add_argument("profile", help="Path to a profile.pstats file")
+    parser.add_argument("-n", "--limit", type=int, default=25, help="Number of functions to show (default: 25)")
+    parser.add_argument("-s", "--sort", default="cumulative",
+                        help="Sort key: cumulative, tottime, ncalls, ... (default: cumulative)")
+    args = parser.parse_args()
+    sys.stdout.write(summarize(args.profile, args.limit, args.sort))
@@ -1,44 +1,19 @@
 import os
+import sys
+import json
 import logging
 import tempfile
 import re
 import time
 import yt_dlp
 from pydub import AudioSegment
-import logging.handlers
+from job_control import run_killable
+from log_setup import configure_logging
 
-# Configure logging - Simplified approach
-LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
-os.makedirs(LOG_DIR, exist_ok=True)
-LOG_FILE = os.path.join(LOG_DIR, "simple_youtube.log")
-
-# Create a logger for this module
+# Messages go through the queue-based setup shared by all backend modules
+configure_logging()
 logger = logging.getLogger('simple_youtube')
 
-# Check if the logger already has handlers to avoid duplicates
-if not logger.handlers:
-    # Add a file handler
-    file_handler = logging.handlers.RotatingFileHandler(
-        LOG_FILE,
-        maxBytes=10*1024*1024,  # 10MB
-        backupCount=5
-    )
-    file_handler.setLevel(logging.INFO)
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    logger.setLevel(logging.INFO)
-
-# Test write to log file
-try:
-    with open(LOG_FILE, 'a') as f:
-        f.write("SimpleYouTubeDownloader initialized\n")
-    logger.info("Successfully wrote to simple_youtube log file")
-except Exception as e:
-    logger.error(f"Error writing to simple_youtube log file: {str(e)}")
-
-logger.info("Simple YouTube downloader logging initialized")
-
 class SimpleYouTubeDownloader:
     """
     A simplified YouTube downloader that focuses on reliability using yt-dlp.
@@ -134,6 +109,74 @@ class SimpleYouTubeDownloader:
         # If all attempts failed, return None
         return None, None, None
     
+    def download_audio_process(self, youtube_url, output_dir=None, timeout=None, cancel_token=None):
+        """
+        Download audio with yt-dlp running in a separate, killable process.
+        
+        Unlike download_audio, the download really stops on timeout or
+        cancellation: the yt-dlp process and its ffmpeg children are killed.
+        
+        Args:
+            youtube_url (str): URL of the YouTube video
+            output_dir (str, optional): Directory to save the audio file
+            timeout (float, optional): Seconds before the download is killed
+            cancel_token (CancellationToken, optional): Token that kills the download when cancelled
+            
+        Returns:
+            tuple: (file_path, duration, title) or (None, None, None) on failure
+            
+        Raises:
+            TimeoutError: If the download did not finish in time
+            JobCancelled: If the token was cancelled during the download
+        """
+        if output_dir is None:
+            output_dir = tempfile.mkdtemp()
+            logger.info(f"Created temporary directory: {output_dir}")
+        
+        logger.info(f"Downloading audio from {youtube_url} in a subprocess")
+        output_file = os.path.join(output_dir, "audio.wav")
+        wav_path = os.path.join(output_dir, "temp_audio.wav")
+        
+        command = [
+            sys.executable, "-m", "yt_dlp",
+            "--format", "bestaudio/best",
+            "--extract-audio", "--audio-format", "wav",
+            "--output", os.path.join(output_dir, "temp_audio.%(ext)s"),
+            "--no-playlist", "--geo-bypass", "--retries", "5", "--no-color",
+            "--dump-json", "--no-simulate",
+            youtube_url,
+        ]
+        
+        start_time = time.time()
+        result = run_killable(command, timeout=timeout, cancel_token=cancel_token)
+        logger.info(f"Download and conversion completed in {time.time() - start_time:.2f} seconds")
+        
+        if result.returncode != 0:
+            logger.error(f"yt-dlp exited with code {result.returncode}: {result.stderr.decode(errors='replace').strip()}")
+            return None, None, None
+        
+        title, duration = 'Unknown Title', 0
+        lines = result.stdout.decode(errors='replace').strip().splitlines()
+        if lines:
+            try:
+                info = json.loads(lines[-1])
+                title = info.get('title', title)
+                duration = info.get('duration', duration)
+            except ValueError:
+                logger.warning("Could not parse yt-dlp metadata output")
+        
+        if os.path.exists(wav_path):
+            os.rename(wav_path, output_file)
+            logger.info(f"Renamed {wav_path} to {output_file}")
+        
+        if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
+            logger.info(f"Successfully downloaded and converted audio: {output_file}")
+            logger.info(f"Title: {title}, Duration: {duration}s")
+            return output_file, duration, title
+        
+        logger.error(f"Output file is missing or empty: {output_file}")
+        return None, None, None
+    
     def extract_video_id(self, url):
         """
         Extract the video ID from a YouTube URL.
@@ -144,11 +187,23 @@ class SimpleYouTubeDownloader:
         Returns:
             str: Video ID or None if not found
         """
+        return self.extract_video_info(url)[0]
+    
+    def extract_video_info(self, url):
+        """
+        Extract the video ID and duration from a YouTube URL.
+        
+        Args:
+            url (str): YouTube URL
+            
+        Returns:
+            tuple: (video ID or None if not found, duration in seconds or None if unknown)
+        """
         try:
             # First try using yt-dlp
             with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
                 info_dict = ydl.extract_info(url, download=False)
-                return info_dict.get('id')
+                return info_dict.get('id'), info_dict.get('duration')
         except Exception as e:
             logger.warning(f"Error extracting video ID using yt-dlp: {str(e)}")
             
@@ -162,10 +217,10 @@ class SimpleYouTubeDownloader:
             for pattern in patterns:
                 match = re.search(pattern, url)
                 if match:
-                    return match.group(1)
+                    return match.group(1), None
         
         logger.error(f"Could not extract video ID from URL: {url}")
-        return None
+        return None, None
 
 # Simple test for the module
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+import io
+import os
+import shutil
+import numpy as np
+import soundfile as sf
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from main import parse_window, window_video_id, source_video_id, shift_result_times, MIN_WINDOW_SECONDS
+
+@pytest.mark.parametrize("start, end, duration, expected", [
+    (None, None, 300.0, None),
+    (None, None, None, None),
+    (60, 120, 300.0, (60.0, 120.0)),
+    (None, 90, 300.0, (0.0, 90.0)),
+    (200, None, 300.0, (200.0, 300.0)),
+    # Ends past the video are clamped to it
+    (250, 400, 300.0, (250.0, 300.0)),
+    (10, 70, None, (10.0, 70.0)),
+])
+def test_parse_window(start, end, duration, expected):
+    assert parse_window(start, end, duration) == expected
+
+@pytest.mark.parametrize("start, end, duration", [
+    (30, None, None),
+    (-5, 60, 300.0),
+    (60, 60 + MIN_WINDOW_SECONDS / 2, 300.0),
+    (120, 60, 300.0),
+    (299, None, 300.0),
+    (400, 500, 300.0),
+])
+def test_parse_window_rejects(start, end, duration):
+    with pytest.raises(ValueError):
+        parse_window(start, end, duration)
+
+def test_window_video_ids():
+    assert window_video_id("dQw4w9WgXcQ", None) == "dQw4w9WgXcQ"
+    assert window_video_id("dQw4w9WgXcQ", (60.0, 120.5)) == "dQw4w9WgXcQ_t60000-120500"
+    assert source_video_id("dQw4w9WgXcQ_t60000-120500", (60.0, 120.5)) == "dQw4w9WgXcQ"
+    assert source_video_id("dQw4w9WgXcQ", None) == "dQw4w9WgXcQ"
+    # A YouTube ID may end like a window suffix
+    assert source_video_id("abcd_t12-34", None) == "abcd_t12-34"
+    assert source_video_id("abcd_t12-34_t0-30000", (0.0, 30.0)) == "abcd_t12-34"
+
+def test_shift_result_times():
+    results = {
+        "beats": [0.5, 1.0],
+        "downbeats": [0.5],
+        "steps": [{"start": 0.0, "end": 8.0, "description": "Step 1"}],
+    }
+    shift_result_times(results, 60.0)
+    assert results["beats"] == [60.5, 61.0]
+    assert results["downbeats"] == [60.5]
+    assert results["steps"] == [{"start": 60.0, "end": 68.0, "description": "Step 1"}]
+
+    empty = {}
+    shift_result_times(empty, 10.0)
+    assert empty == {"beats": [], "downbeats": []}
+
+@pytest.fixture
+def submitted(monkeypatch):
+    jobs = []
+    monkeypatch.setattr(main.job_queue, "submit", jobs.append)
+    yield jobs
+    for job in jobs:
+        main.forget_video(job.video_id)
+        main.job_tokens.pop(job.video_id, None)
+        shutil.rmtree(os.path.join(main.STATIC_DIR, job.video_id), ignore_errors=True)
+
+def test_upload_window(submitted):
+    client = TestClient(main.app)
+    buffer = io.BytesIO()
+    sf.write(buffer, np.random.default_rng(0).uniform(-0.1, 0.1, 8000 * 40), 8000, format="WAV")
+    data = buffer.getvalue()
+
+    too_short = client.post("/api/upload?start=10&end=12", files={"file": ("song.wav", data, "audio/wav")})
+    assert too_short.status_code == 400
+    past_end = client.post("/api/upload?start=50", files={"file": ("song.wav", data, "audio/wav")})
+    assert past_end.status_code == 400
+
+    response = client.post("/api/upload?start=10&end=30", files={"file": ("song.wav", data, "audio/wav")})
+    assert response.status_code == 200
+    video_id = response.json()["videoId"]
+    assert video_id.endswith("_t10000-30000")
+    assert [(job.video_id, job.window) for job in submitted] == [(video_id, (10.0, 30.0))]
+    assert os.path.exists(submitted[0].source_path)
+
+    # The whole file is a different analysis
+    whole = client.post("/api/upload", files={"file": ("song.wav", data, "audio/wav")})
+    assert whole.json()["videoId"] == source_video_id(video_id, (10.0, 30.0))
+    assert submitted[-1].window is None
@@ -0,0 +1,82 @@
+import os
+import json
+import hashlib
+import pytest
+
+import artifact_manifest
+from artifact_manifest import ArtifactIndex, MANIFEST_NAME, list_artifacts, write_json_atomic
+
+RESULT = {"videoId": "abc", "beats": [0.5, 1.0], "completed": True}
+
+@pytest.fixture
+def root(tmp_path):
+    video_dir = tmp_path / "abc"
+    (video_dir / "hls").mkdir(parents=True)
+    (video_dir / "hls.partial").mkdir()
+    (video_dir / "audio.wav").write_bytes(b"RIFF" * 100)
+    (video_dir / "thumbnail.jpg").write_bytes(b"\xff\xd8" * 10)
+    (video_dir / "hls" / "master.m3u8").write_text("#EXTM3U\n")
+    (video_dir / "hls.partial" / "segment.ts").write_bytes(b"x")
+    (video_dir / "upload.wav.tmp").write_bytes(b"x")
+    return tmp_path
+
+def test_list_artifacts_skips_temporary_files(root):
+    artifacts = list_artifacts(str(root / "abc"))
+    assert sorted(artifacts) == ["audio.wav", "hls/master.m3u8", "thumbnail.jpg"]
+    assert artifacts["audio.wav"] == {"size": 400, "sha256": hashlib.sha256(b"RIFF" * 100).hexdigest()}
+
+def test_write_json_atomic(tmp_path):
+    path = str(tmp_path / "rates.json")
+    write_json_atomic(path, {"analysis": 1.5})
+    write_json_atomic(path, {"analysis": 2.0})
+    assert json.loads(open(path).read()) == {"analysis": 2.0}
+    assert os.listdir(tmp_path) == ["rates.json"]
+
+def test_written_manifest_is_indexed_and_reloaded(root):
+    index = ArtifactIndex(str(root))
+    manifest = index.write("abc", RESULT)
+    assert manifest["result"] == RESULT
+    assert index.has("abc", "hls/master.m3u8") and not index.has("abc", "video.mp4")
+    assert index.find("abc", "thumbnail") == "thumbnail.jpg"
+    assert index.find("abc", "waveform") is None
+
+    reloaded = ArtifactIndex(str(root))
+    assert list(reloaded.load()) == ["abc"]
+    assert reloaded.get("abc")["result"] == RESULT
+
+def test_load_ignores_stale_manifests(root):
+    ArtifactIndex(str(root)).write("abc", RESULT)
+
+    # A changed artifact invalidates the manifest
+    (root / "abc" / "audio.wav").write_bytes(b"RIFF")
+    assert ArtifactIndex(str(root)).load() == {}
+    (root / "abc" / "audio.wav").write_bytes(b"RIFF" * 100)
+    assert list(ArtifactIndex(str(root)).load()) == ["abc"]
+
+    # So does a missing one
+    os.remove(root / "abc" / "thumbnail.jpg")
+    assert ArtifactIndex(str(root)).load() == {}
+
+def test_load_ignores_other_pipeline_versions_and_corrupt_files(root, monkeypatch):
+    ArtifactIndex(str(root)).write("abc", RESULT)
+    monkeypatch.setattr(artifact_manifest, "PIPELINE_VERSION", artifact_manifest.PIPELINE_VERSION + 1)
+    assert ArtifactIndex(str(root)).load() == {}
+
+    (root / "abc" / MANIFEST_NAME).write_text("{not json")
+    assert ArtifactIndex(str(root)).load() == {}
+
+def test_refresh_and_discard(root):
+    index = ArtifactIndex(str(root))
+    assert index.refresh("abc") is None
+    ArtifactIndex(str(root)).write("abc", RESULT)
+    assert index.refresh("abc")["video_id"] == "abc"
+    assert index.find("abc", "audio") == "audio.wav"
+
+    index.discard("abc", remove_file=False)
+    assert index.get("abc") is None
+    assert os.path.exists(root / "abc" / MANIFEST_NAME)
+    index.refresh("abc")
+    index.discard("abc")
+    assert index.get("abc") is None
+    assert not os.path.exists(root / "abc" / MANIFEST_NAME)
+    index.discard("abc")
@@ -0,0 +1,41 @@
+import pytest
+
+from audio_renditions import negotiate_format, parse_accept, rendition_path
+
+ALL_FORMATS = ["wav", "opus", "aac"]
+
+@pytest.mark.parametrize("accept, available, expected", [
+    # Browsers that name Ogg/Opus
+    ("audio/webm,audio/ogg,audio/wav;q=0.9,application/ogg;q=0.7,video/*;q=0.6,*/*;q=0.5", ALL_FORMATS, "opus"),
+    ("audio/ogg, audio/mp4", ALL_FORMATS, "opus"),
+    ("audio/ogg;q=0.5, audio/mp4", ALL_FORMATS, "aac"),
+    ("audio/x-m4a", ALL_FORMATS, "aac"),
+    # A listed type beats a wildcard of the same q
+    ("audio/*, audio/ogg", ALL_FORMATS, "opus"),
+    # Wildcards only, as Safari sends: the most widely playable format
+    ("*/*", ALL_FORMATS, "aac"),
+    (None, ALL_FORMATS, "aac"),
+    ("*/*", ["wav", "opus"], "wav"),
+    ("audio/*", ["opus"], "opus"),
+    # q=0 rules a format out
+    ("audio/mp4;q=0, */*", ALL_FORMATS, "wav"),
+    ("audio/mp4;q=0, audio/wav;q=0, */*", ALL_FORMATS, "opus"),
+    # Nothing acceptable falls back to WAV
+    ("text/html", ALL_FORMATS, "wav"),
+    ("audio/ogg", ["wav", "aac"], "wav"),
+])
+def test_negotiate_format(accept, available, expected):
+    assert negotiate_format(accept, available) == expected
+
+def test_requested_format_wins_if_available():
+    assert negotiate_format("audio/ogg", ALL_FORMATS, requested="aac") == "aac"
+    assert negotiate_format("audio/ogg", ["wav"], requested="opus") is None
+
+def test_parse_accept():
+    assert parse_accept("Audio/OGG; q=0.5, audio/mp4;q=bad, , audio/wav") == {
+        "audio/ogg": 0.5, "audio/mp4": 0.0, "audio/wav": 1.0}
+    assert parse_accept(None) == {"*/*": 1.0}
+
+def test_rendition_path():
+    assert rendition_path("/static/abc/harmonic_with_clicks.wav", "opus") == "/static/abc/harmonic_with_clicks.opus"
+    assert rendition_path("/static/abc/audio.wav", "aac") == "/static/abc/audio.m4a"
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from beat_map import encode_varints, decode_varints, encode_beat_map, decode_beat_map, HEADER
+
+@pytest.mark.parametrize("value, encoded", [
+    (0, b"\x00"),
+    (1, b"\x01"),
+    (127, b"\x7f"),
+    (128, b"\x80\x01"),
+    (300, b"\xac\x02"),
+    (16384, b"\x80\x80\x01"),
+    (2 ** 35, b"\x80\x80\x80\x80\x80\x01"),
+])
+def test_varint_encoding(value, encoded):
+    assert encode_varints([value]) == encoded
+    values, consumed = decode_varints(encoded + b"\x05", 1)
+    assert values.tolist() == [value] and consumed == len(encoded)
+
+def test_varint_round_trip_mixed_lengths():
+    values = [0, 5, 127, 128, 500, 2 ** 20, 2 ** 40, 3]
+    data = encode_varints(values)
+    decoded, consumed = decode_varints(data, len(values))
+    assert decoded.tolist() == values and consumed == len(data)
+    assert encode_varints([]) == b""
+    assert decode_varints(b"", 0)[1] == 0
+
+def test_truncated_varints_are_rejected():
+    with pytest.raises(ValueError):
+        decode_varints(b"\x80\x80", 1)
+    with pytest.raises(ValueError):
+        decode_varints(encode_varints([1, 2]), 3)
+
+@pytest.fixture
+def grid():
+    # beat_this reports times on a 50 fps grid; tempo drifts slightly over an hour
+    rng = np.random.default_rng(0)
+    frames = np.cumsum(rng.integers(22, 26, 7000))
+    beats = frames / 50.0
+    return beats, beats[::4]
+
+def test_varint_beat_map_round_trip(grid):
+    beats, downbeats = grid
+    data = encode_beat_map(beats, downbeats, "varint")
+    decoded_beats, decoded_downbeats = decode_beat_map(data)
+    np.testing.assert_allclose(decoded_beats, beats, atol=0.5e-3)
+    np.testing.assert_allclose(decoded_downbeats, downbeats, atol=0.5e-3)
+    # Deltas of ~0.5 s in ms take two bytes each, downbeat deltas of ~2 s two as well
+    assert len(data) == HEADER.size + 2 * (len(beats) + len(downbeats))
+
+def test_float32_beat_map_round_trip(grid):
+    beats, downbeats = grid
+    data = encode_beat_map(beats, downbeats, "f32")
+    decoded_beats, decoded_downbeats = decode_beat_map(data)
+    np.testing.assert_allclose(decoded_beats, beats, rtol=1e-7)
+    np.testing.assert_allclose(decoded_downbeats, downbeats, rtol=1e-7)
+    assert len(data) == HEADER.size + 4 * (len(beats) + len(downbeats))
+
+def test_beat_map_sorts_and_clamps_times():
+    beats, downbeats = decode_beat_map(encode_beat_map([1.5, -0.2, 0.5], [], "varint", unit_us=10))
+    np.testing.assert_allclose(beats, [0.0, 0.5, 1.5])
+    assert len(downbeats) == 0
+
+def test_beat_map_errors():
+    with pytest.raises(ValueError):
+        encode_beat_map([1.0], [1.0], "zstd")
+    with pytest.raises(ValueError):
+        decode_beat_map(b"RIFF" + bytes(12))
@@ -0,0 +1,206 @@
+import os
+import time
+import tempfile
+import threading
+
+import numpy as np
+import librosa
+import soundfile as sf
+import pytest
+
+import beat_detector
+from beat_detector import BeatDetector, ModelPool, split_into_segments, stitch_segment_beats
+
+def test_split_into_segments_covers_signal():
+    """Windows overlap by the requested amount and cover the whole signal"""
+    sr = 100
+    segments = split_into_segments(25 * sr, sr, segment_seconds=10, overlap_seconds=2)
+    
+    assert segments[0][0] == 0
+    assert segments[-1][1] == 25 * sr
+    for (prev_start, prev_end), (start, end) in zip(segments, segments[1:]):
+        assert prev_end - start == 2 * sr
+
+def test_stitch_merges_agreeing_beats_in_overlap():
+    """Beats seen by both windows are merged once, unmatched ones split at the midpoint"""
+    bounds = [(0.0, 10.0), (8.0, 18.0)]
+    left = np.array([1.0, 5.0, 8.5, 9.02, 9.8])
+    right = np.array([8.18, 8.52, 9.0, 12.0])
+    
+    stitched = stitch_segment_beats([left, right], bounds, tolerance=0.05)
+    
+    # 8.5/8.52 and 9.02/9.0 agree; 9.8 (left, past the midpoint) and
+    # 8.18 (right, before the midpoint) lack a partner and are dropped
+    np.testing.assert_allclose(stitched, [1.0, 5.0, 8.51, 9.01, 12.0])
+
+def test_split_into_segments_short_and_invalid():
+    """A signal shorter than one window is a single window; overlaps must leave a hop"""
+    assert split_into_segments(5 * 100, 100, segment_seconds=10, overlap_seconds=2) == [(0, 500)]
+    assert split_into_segments(18 * 100, 100, segment_seconds=10, overlap_seconds=2) == [(0, 1000), (800, 1800)]
+    with pytest.raises(ValueError):
+        split_into_segments(25 * 100, 100, segment_seconds=10, overlap_seconds=10)
+
+def detect_on_windows(grid, bounds, jitter=0.0, seed=0):
+    """Beats of grid each window would report, with optional per-window timing jitter"""
+    rng = np.random.default_rng(seed)
+    return [grid[(grid >= start) & (grid < end)] + rng.uniform(-jitter, jitter, np.sum((grid >= start) & (grid < end)))
+            for start, end in bounds]
+
+def test_stitch_regular_grid_has_no_duplicates():
+    """Beats of a steady grid detected by every window come out exactly once"""
+    grid = np.arange(0.25, 60.0, 0.5)
+    sr = 100
+    bounds = [(start / sr, end / sr) for start, end in split_into_segments(60 * sr, sr, 20, 4)]
+    
+    stitched = stitch_segment_beats(detect_on_windows(grid, bounds, jitter=0.01), bounds, tolerance=0.05)
+    
+    assert len(stitched) == len(grid)
+    np.testing.assert_allclose(stitched, grid, atol=0.01)
+    assert np.all(np.diff(stitched) > 0)
+
+def test_stitch_beats_missing_in_one_window():
+    """A beat only one window saw is kept where that window is the reliable one"""
+    bounds = [(0.0, 10.0), (8.0, 18.0)]
+    grid = np.arange(0.5, 18.0, 0.5)
+    left, right = detect_on_windows(grid, bounds)
+    # The left window missed 8.5 (before the midpoint 9), the right one missed 9.5 (after it)
+    left = left[left != 8.5]
+    right = right[right != 9.5]
+    
+    stitched = stitch_segment_beats([left, right], bounds, tolerance=0.05)
+    
+    # The right window's lone 8.5 lies before the midpoint and the left window's lone 9.5
+    # after it, where the other window is trusted, so both are dropped
+    np.testing.assert_allclose(stitched, grid[(grid != 8.5) & (grid != 9.5)])
+
+def test_stitch_midpoint_split_without_agreement():
+    """With no matching beats, the overlap is taken from the left window up to the midpoint"""
+    bounds = [(0.0, 10.0), (8.0, 18.0)]
+    left = np.array([8.1, 8.9, 9.3])
+    right = np.array([8.6, 9.0, 9.6])
+    
+    stitched = stitch_segment_beats([left, right], bounds, tolerance=0.05)
+    
+    # 8.9/9.0 and 9.3/9.6 are further apart than the tolerance
+    np.testing.assert_allclose(stitched, [8.1, 8.9, 9.0, 9.6])
+
+def test_stitch_empty_and_single_window():
+    assert len(stitch_segment_beats([], [], tolerance=0.05)) == 0
+    np.testing.assert_allclose(stitch_segment_beats([np.array([1.0, 2.0])], [(0.0, 10.0)], tolerance=0.05),
+                               [1.0, 2.0])
+
+CLICK_BEATS = np.arange(0.5, 299.5, 0.5)
+CLICK_DOWNBEATS = CLICK_BEATS[::4]
+
+@pytest.fixture(scope="module")
+def long_click_track():
+    """A synthetic five-minute click track at 120 BPM with accented downbeats"""
+    sr = 22050
+    duration = 300.0
+    y = librosa.clicks(times=CLICK_BEATS, sr=sr, click_freq=1000, length=int(duration * sr))
+    y += librosa.clicks(times=CLICK_DOWNBEATS, sr=sr, click_freq=1500, length=int(duration * sr))
+    
+    temp_dir = tempfile.mkdtemp()
+    path = os.path.join(temp_dir, "clicks.wav")
+    sf.write(path, librosa.util.normalize(y) * 0.8, sr)
+    return path
+
+class FakeBeatModel:
+    """
+    Stands in for beat_this: reports the click onsets of the window, the
+    louder (two-tone) ones as downbeats, and fails if two threads share it
+    """
+    instances = []
+    
+    def __init__(self, dbn=False):
+        self.in_use = threading.Lock()
+        self.calls = 0
+        FakeBeatModel.instances.append(self)
+    
+    def __call__(self, signal, sr):
+        assert self.in_use.acquire(blocking=False), "model used by two threads at once"
+        try:
+            time.sleep(0.01)
+            self.calls += 1
+            return self.onsets(signal, sr, 0.2), self.onsets(signal, sr, 0.6)
+        finally:
+            self.in_use.release()
+    
+    @staticmethod
+    def onsets(signal, sr, threshold):
+        loud = np.flatnonzero(np.abs(signal) > threshold)
+        if len(loud) == 0:
+            return np.array([])
+        starts = loud[np.insert(np.diff(loud) > 0.1 * sr, 0, True)]
+        return starts / sr
+
+@pytest.fixture
+def fake_beat_this(monkeypatch):
+    """Replace the beat_this model with FakeBeatModel"""
+    FakeBeatModel.instances = []
+    monkeypatch.setattr(beat_detector, "BEAT_THIS_AVAILABLE", True)
+    monkeypatch.setattr(beat_detector, "File2Beats", FakeBeatModel, raising=False)
+    monkeypatch.setattr(beat_detector, "Audio2Beats", FakeBeatModel, raising=False)
+    monkeypatch.setattr(beat_detector, "beat_this_models", ModelPool(FakeBeatModel, "fake"))
+    return FakeBeatModel
+
+def test_segmented_inference_stitches_stubbed_model(long_click_track, fake_beat_this):
+    """Windows run concurrently on separate models and stitch back into the full beat grid"""
+    detector = BeatDetector(segment_seconds=30.0, segment_overlap=5.0, segment_workers=4)
+    
+    beats, downbeats, tempo = detector.detect_beats_with_beat_this_segmented(long_click_track)
+    
+    for detected, expected in ((beats, CLICK_BEATS), (downbeats, CLICK_DOWNBEATS)):
+        assert len(detected) == len(expected)
+        assert np.abs(np.asarray(detected) - expected).max() <= detector.tolerance
+    assert abs(tempo - 120.0) < 1.0
+    # One model per concurrent window, each window inferred exactly once
+    assert 1 < len(fake_beat_this.instances) <= 4
+    assert sum(model.calls for model in fake_beat_this.instances) == len(
+        split_into_segments(300 * 22050, 22050, 30.0, 5.0))
+
+def test_segmented_inference_matches_whole_file(long_click_track):
+    """Stitched segment-parallel output matches whole-file inference within the detector tolerance"""
+    pytest.importorskip("beat_this")
+    detector = BeatDetector(segment_seconds=60.0, segment_overlap=10.0)
+    if not detector.beat_this_available:
+        pytest.skip("beat_this model could not be loaded")
+    
+    whole_beats, whole_downbeats, whole_tempo = detector.detect_beats_with_beat_this(long_click_track)
+    seg_beats, seg_downbeats, seg_tempo = detector.detect_beats_with_beat_this_segmented(long_click_track)
+    
+    for whole, stitched in ((whole_beats, seg_beats), (whole_downbeats, seg_downbeats)):
+        assert len(stitched) == len(whole)
+        distances = np.abs(np.asarray(stitched) - np.asarray(whole))
+        assert distances.max() <= detector.tolerance
+    assert abs(seg_tempo - whole_tempo) < 1.0
+
+def test_detectors_share_loaded_models(long_click_track, fake_beat_this):
+    """Later detectors reuse the process' models instead of loading their own"""
+    BeatDetector(segment_seconds=30.0, segment_overlap=5.0).detect_beats_with_beat_this_segmented(long_click_track)
+    loaded = len(fake_beat_this.instances)
+    assert loaded == beat_detector.DEFAULT_SEGMENT_WORKERS
+    
+    detector = BeatDetector(segment_seconds=30.0, segment_overlap=5.0)
+    detector.detect_beats_with_beat_this_segmented(long_click_track)
+    detector.detect_beats_with_beat_this(long_click_track)
+    assert len(fake_beat_this.instances) == loaded
+
+def test_detectors_share_audio_separator(monkeypatch):
+    """The separator model is loaded once per process, not once per detector"""
+    loads = []
+    class FakeSeparator:
+        def load_model(self):
+            loads.append(self)
+    monkeypatch.setattr(beat_detector, "AUDIO_SEPARATOR_AVAILABLE", True)
+    monkeypatch.setattr(beat_detector, "AudioSeparator", FakeSeparator, raising=False)
+    monkeypatch.setattr(beat_detector, "_audio_separator", None)
+    
+    first, second = BeatDetector(), BeatDetector()
+    
+    assert len(loads) == 1
+    assert first.audio_separator is second.audio_separator
+    assert first.separator_type == "audio_separator"
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,82 @@
+import io
+import numpy as np
+import soundfile as sf
+import pytest
+
+from click_mixer import (ClickMixer, add_clicks, make_click, parse_range_header, wav_header, WAV_HEADER_SIZE)
+
+SR = 8000
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-200", (800, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=900-5000", (900, 999)),
+    (" bytes=0-0 ", (0, 0)),
+])
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, 1000) == expected
+
+@pytest.mark.parametrize("header", [None, "", "bytes=-", "items=0-10", "bytes=0-10,20-30", "bytes=1000-",
+                                    "bytes=50-10"])
+def test_parse_range_header_rejects(header):
+    with pytest.raises(ValueError):
+        parse_range_header(header, 1000)
+
+def test_add_clicks_across_blocks():
+    """Clicks straddling block edges render the same as in one block"""
+    click = make_click(SR, 1000)
+    frames = np.array([0, 1000 - len(click) // 2, 700, 2500])
+    whole = np.zeros(4000, dtype=np.float32)
+    add_clicks(whole, 0, frames, click, gain=0.5)
+    blocks = np.zeros(4000, dtype=np.float32)
+    for start in range(0, 4000, 333):
+        add_clicks(blocks[start:start + 333], start, frames, click, gain=0.5)
+    np.testing.assert_allclose(blocks, whole, atol=1e-6)
+
+@pytest.fixture
+def stems(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = {}
+    for stem in ("harmonic", "percussive"):
+        paths[stem] = str(tmp_path / f"{stem}.wav")
+        sf.write(paths[stem], 0.2 * rng.uniform(-1, 1, 3 * SR), SR, subtype="FLOAT")
+    return paths
+
+def test_wav_header_is_readable():
+    data = wav_header(SR, 100) + bytes(200)
+    info = sf.info(io.BytesIO(data))
+    assert len(wav_header(SR, 100)) == WAV_HEADER_SIZE
+    assert (info.samplerate, info.channels, info.frames) == (SR, 1, 100)
+
+def test_mix_matches_stems(stems):
+    mixer = ClickMixer(stems, {"harmonic": 0.5, "percussive": 1.0}, [], [], click_gain=0.0)
+    expected = 0.5 * sf.read(stems["harmonic"], dtype="float32")[0] + sf.read(stems["percussive"], dtype="float32")[0]
+    np.testing.assert_allclose(mixer.render(1000, 500), expected[1000:1500], atol=1e-6)
+    # Reading past the end gives silence
+    assert not mixer.render(3 * SR, 10).any()
+
+def test_stream_wav_bytes_ranges(stems):
+    """Any byte range, including odd offsets inside samples, is a slice of the full file"""
+    mixer = ClickMixer(stems, {"harmonic": 1.0}, [0.5, 1.0, 1.5], [0.5], click_gain=0.5)
+    first, last = SR // 2, 2 * SR
+    full = b"".join(mixer.stream_wav_bytes(first, last, 0, WAV_HEADER_SIZE + 2 * (last - first) - 1))
+    audio, sr = sf.read(io.BytesIO(full), dtype="float32")
+    assert sr == SR and len(audio) == last - first
+    # 16-bit quantization truncates, and the reader scales by 1/32768
+    np.testing.assert_allclose(audio, mixer.render(first, last - first), atol=2 / 32767)
+
+    for byte_start, byte_end in [(0, 10), (20, 60), (45, 1001), (1001, len(full) - 1)]:
+        assert b"".join(mixer.stream_wav_bytes(first, last, byte_start, byte_end)) == full[byte_start:byte_end + 1]
+
+def test_click_peak_normalizes_clicks(stems):
+    beats = np.arange(0.25, 2.75, 0.25)
+    mixer = ClickMixer(stems, {"harmonic": 0.0}, beats, beats[::4], click_gain=1.0, click_peak=0.8)
+    clicks = mixer.render(0, mixer.num_frames)
+    assert np.abs(clicks).max() == pytest.approx(0.8, abs=1e-3)
+
+    # Stems of different sample rates cannot be mixed
+    sf.write(stems["percussive"], np.zeros(SR), SR * 2)
+    with pytest.raises(ValueError):
+        ClickMixer(stems, {"harmonic": 1.0, "percussive": 1.0}, [], [])
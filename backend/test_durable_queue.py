@@ -0,0 +1,165 @@
+import time
+import threading
+import pytest
+
+import metrics
+from durable_queue import DurableQueue, QueueWorker, RETIRED_METRICS_LEASES, RETIRED_WORKER_ID
+
+LEASE_SECONDS = 0.05
+
+@pytest.fixture
+def queue(tmp_path):
+    return DurableQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=LEASE_SECONDS, max_attempts=2)
+
+def expire_leases():
+    time.sleep(LEASE_SECONDS * 2)
+
+def job_state(queue, job_id):
+    return queue._connection().execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()["state"]
+
+def latest_progress(queue, video_id):
+    return [record for _, vid, record in queue.progress_since(0) if vid == video_id][-1]
+
+def test_enqueue_skips_videos_with_an_active_job(queue):
+    assert queue.enqueue("a") is not None
+    assert queue.enqueue("a") is None
+    queue.claim("w1")
+    assert queue.enqueue("a") is None
+    assert queue.active_video_ids() == {"a"}
+
+def test_claim_orders_by_arrival_or_estimated_cost(tmp_path):
+    fifo = DurableQueue(str(tmp_path / "fifo.sqlite3"))
+    fifo.enqueue("long", estimated_seconds=600)
+    fifo.enqueue("short", estimated_seconds=10)
+    assert [fifo.claim("w")["video_id"] for _ in range(2)] == ["long", "short"]
+
+    shortest_first = DurableQueue(str(tmp_path / "sjf.sqlite3"), aging_rate=1.0)
+    shortest_first.enqueue("long", estimated_seconds=600)
+    shortest_first.enqueue("short", estimated_seconds=10)
+    assert [shortest_first.claim("w")["video_id"] for _ in range(2)] == ["short", "long"]
+    assert shortest_first.claim("w") is None
+
+def test_expired_lease_is_reclaimed(queue):
+    job_id = queue.enqueue("a")
+    assert queue.claim("w1")["attempts"] == 1
+    # A live lease is not handed out again
+    assert queue.claim("w2") is None
+    expire_leases()
+
+    job = queue.claim("w2")
+    assert (job["id"], job["worker_id"], job["attempts"]) == (job_id, "w1", 2)
+    assert queue.heartbeat(job_id, "w1") == "lost"
+    assert queue.heartbeat(job_id, "w2") == "ok"
+
+    # The worker that lost its lease cannot record an outcome
+    queue.complete(job_id, "w1", "failed", "stale worker")
+    assert job_state(queue, job_id) == "running"
+    queue.complete(job_id, "w2", "completed")
+    assert job_state(queue, job_id) == "completed"
+    assert queue.heartbeat(job_id, "w2") == "lost"
+
+def test_heartbeat_keeps_the_lease(queue):
+    job_id = queue.enqueue("a")
+    queue.claim("w1")
+    for _ in range(4):
+        time.sleep(LEASE_SECONDS / 2)
+        assert queue.heartbeat(job_id, "w1") == "ok"
+    assert queue.claim("w2") is None
+
+def test_job_fails_after_max_attempts(queue):
+    job_id = queue.enqueue("a")
+    for worker_id in ("w1", "w2"):
+        assert queue.claim(worker_id)["id"] == job_id
+        expire_leases()
+    assert queue.claim("w3") is None
+    assert job_state(queue, job_id) == "failed"
+    record = latest_progress(queue, "a")
+    assert record["completed"] and "2 attempts" in record["data"]["error"]
+    assert queue.stats()["failed"] == 1
+    assert queue.active_video_ids() == set()
+
+def test_cancel_queued_job_ends_it(queue):
+    job_id = queue.enqueue("a")
+    assert queue.cancel("a")
+    assert job_state(queue, job_id) == "cancelled"
+    assert latest_progress(queue, "a")["data"]["cancelled"]
+    assert queue.claim("w1") is None
+    assert not queue.cancel("a")
+
+def test_cancel_running_job_is_reported_by_heartbeat(queue):
+    job_id = queue.enqueue("a")
+    queue.claim("w1")
+    assert queue.cancel("a")
+    assert job_state(queue, job_id) == "running"
+    assert queue.heartbeat(job_id, "w1") == "cancel"
+    queue.complete(job_id, "w1", "cancelled")
+    assert job_state(queue, job_id) == "cancelled"
+
+def test_cancelled_job_with_expired_lease_is_not_retried(queue):
+    job_id = queue.enqueue("a")
+    queue.claim("w1")
+    queue.cancel("a")
+    expire_leases()
+    assert queue.claim("w2") is None
+    assert job_state(queue, job_id) == "cancelled"
+
+def test_complete_rejects_active_states(queue):
+    job_id = queue.enqueue("a")
+    queue.claim("w1")
+    with pytest.raises(ValueError):
+        queue.complete(job_id, "w1", "queued")
+
+def snapshot(jobs, seconds):
+    return {
+        "analysis_jobs_total": [[["completed"], jobs]],
+        "analysis_time_to_result_seconds": [[[], [[0, jobs], seconds]]],
+    }
+
+def test_stale_worker_metrics_are_folded(queue):
+    queue.publish_metrics("host:1/0", snapshot(2, 30.0))
+    queue.publish_metrics("host:2/0", snapshot(3, 45.0))
+    time.sleep(RETIRED_METRICS_LEASES * LEASE_SECONDS * 1.5)
+    queue.publish_metrics("host:3/0", snapshot(1, 10.0))
+    rows = queue._connection().execute("SELECT worker_id FROM worker_metrics ORDER BY worker_id").fetchall()
+    assert [row["worker_id"] for row in rows] == ["host:3/0", RETIRED_WORKER_ID]
+
+    # Folding again adds to the retired row instead of replacing it
+    time.sleep(RETIRED_METRICS_LEASES * LEASE_SECONDS * 1.5)
+    queue.publish_metrics("host:4/0", snapshot(0, 0.0))
+    assert len(queue.worker_metrics()) == 2
+    merged = metrics.merge_snapshots(queue.worker_metrics())
+    assert merged["analysis_jobs_total"] == [[["completed"], 6]]
+    assert merged["analysis_time_to_result_seconds"] == [[[], [[0, 6], 85.0]]]
+
+def test_queue_worker_cancels_lost_and_cancelled_jobs(queue):
+    started = {}
+
+    def start_job(job, token, done):
+        started[job["video_id"]] = (job, token, done)
+
+    worker = QueueWorker(queue, start_job, capacity=2, worker_id="w1", poll_seconds=0.01,
+                         heartbeat_seconds=LEASE_SECONDS / 5)
+    thread = threading.Thread(target=worker.run, daemon=True)
+    thread.start()
+    try:
+        queue.enqueue("a")
+        queue.enqueue("b")
+        deadline = time.time() + 5
+        while len(started) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        assert set(started) == {"a", "b"}
+
+        queue.cancel("a")
+        # Another worker takes over "b" as if w1 had stalled
+        queue._connection().execute("UPDATE jobs SET worker_id = 'w2' WHERE video_id = 'b'")
+        deadline = time.time() + 5
+        while not (started["a"][1].cancelled and started["b"][1].cancelled) and time.time() < deadline:
+            time.sleep(0.01)
+        assert started["a"][1].cancelled and started["b"][1].cancelled
+        assert worker.lost_video_ids == {"b"}
+
+        started["a"][2]("cancelled")
+        assert queue.stats()["cancelled"] == 1
+    finally:
+        worker.stop()
+        thread.join(timeout=5)
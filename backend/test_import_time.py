@@ -0,0 +1,54 @@
+import os
+import sys
+import json
+import subprocess
+
+# Importing main must stay cheap so reloads and new workers answer /api/live quickly
+IMPORT_BUDGET_SECONDS = 3.0
+
+# Modules that take seconds to import and must only be loaded on first use
+HEAVY_MODULES = (
+    "librosa",
+    "torch",
+    "matplotlib",
+    "scipy",
+    "yt_dlp",
+    "pytube",
+    "pydub",
+    "beat_this",
+    "audio_separator",
+    "beat_detector",
+)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def import_main():
+    """Import main in a fresh interpreter and report the import time and loaded heavy modules"""
+    script = (
+        "import sys, time, json\n"
+        "start = time.perf_counter()\n"
+        "import main\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps({'seconds': elapsed, 'heavy': heavy}))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    return json.loads(result.stdout.decode().strip().splitlines()[-1])
+
+def test_main_import_skips_heavy_modules():
+    """None of the heavy subsystems are imported by main at import time"""
+    assert import_main()["heavy"] == []
+
+def test_main_import_within_budget():
+    """Importing main stays within the import-time budget"""
+    seconds = import_main()["seconds"]
+    assert seconds < IMPORT_BUDGET_SECONDS, f"import main took {seconds:.2f}s"
+
+if __name__ == "__main__":
+    print(import_main())
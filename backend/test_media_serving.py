@@ -0,0 +1,97 @@
+import os
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from media_serving import parse_byte_range, serve_file
+
+@pytest.mark.parametrize("header, size, expected", [
+    ("bytes=0-99", 1000, (0, 99)),
+    ("bytes=100-", 1000, (100, 999)),
+    ("bytes=-200", 1000, (800, 999)),
+    ("bytes=-5000", 1000, (0, 999)),
+    ("bytes=900-5000", 1000, (900, 999)),
+    ("bytes=999-999", 1000, (999, 999)),
+    # Ignored: absent, malformed or several ranges
+    (None, 1000, None),
+    ("", 1000, None),
+    ("bytes=5", 1000, None),
+    ("bytes=-", 1000, None),
+    ("bytes=--5", 1000, None),
+    ("bytes=a-b", 1000, None),
+    ("items=0-5", 1000, None),
+    ("bytes=0-5,10-20", 1000, None),
+    # Not satisfiable
+    ("bytes=1000-", 1000, "unsatisfiable"),
+    ("bytes=50-10", 1000, "unsatisfiable"),
+    ("bytes=-0", 1000, "unsatisfiable"),
+    ("bytes=-10", 0, "unsatisfiable"),
+    ("bytes=0-", 0, "unsatisfiable"),
+])
+def test_parse_byte_range(header, size, expected):
+    assert parse_byte_range(header, size) == expected
+
+DATA = bytes(range(256)) * 40
+
+@pytest.fixture
+def media_file(tmp_path):
+    path = tmp_path / "clip one.wav"
+    path.write_bytes(DATA)
+    return path
+
+@pytest.fixture
+def client(media_file):
+    app = FastAPI()
+
+    @app.get("/media")
+    def media(request: Request):
+        return serve_file(request, str(media_file), "audio/wav", headers={"Cache-Control": "no-cache"})
+
+    @app.get("/accel")
+    def accel(request: Request):
+        return serve_file(request, str(media_file), "audio/wav", accel_prefix="/protected/",
+                          accel_root=os.path.dirname(media_file))
+
+    return TestClient(app)
+
+def test_full_and_partial_responses(client):
+    full = client.get("/media")
+    assert full.status_code == 200 and full.content == DATA
+    assert full.headers["accept-ranges"] == "bytes"
+    assert full.headers["cache-control"] == "no-cache"
+
+    part = client.get("/media", headers={"Range": "bytes=100-299"})
+    assert part.status_code == 206 and part.content == DATA[100:300]
+    assert part.headers["content-range"] == f"bytes 100-299/{len(DATA)}"
+
+    tail = client.get("/media", headers={"Range": "bytes=-10"})
+    assert tail.status_code == 206 and tail.content == DATA[-10:]
+
+    past_end = client.get("/media", headers={"Range": f"bytes={len(DATA)}-"})
+    assert past_end.status_code == 416
+    assert past_end.headers["content-range"] == f"bytes */{len(DATA)}"
+
+def test_conditional_requests(client):
+    first = client.get("/media")
+    etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+
+    assert client.get("/media", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/media", headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+    assert client.get("/media", headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get("/media", headers={"If-None-Match": '"other"'}).status_code == 200
+
+    # If-Range: the range applies only while the client's copy is current
+    assert client.get("/media", headers={"Range": "bytes=0-9", "If-Range": etag}).status_code == 206
+    stale = client.get("/media", headers={"Range": "bytes=0-9", "If-Range": '"old"'})
+    assert stale.status_code == 200 and stale.content == DATA
+
+def test_changed_file_gets_a_new_etag(client, media_file):
+    etag = client.get("/media").headers["etag"]
+    media_file.write_bytes(DATA[:100])
+    response = client.get("/media", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.content == DATA[:100]
+
+def test_accel_redirect(client):
+    response = client.get("/accel")
+    assert response.headers["x-accel-redirect"] == "/protected/clip%20one.wav"
+    assert response.content == b""
@@ -0,0 +1,76 @@
+import time
+import threading
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from main import etag_matches
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+@pytest.fixture
+def video_id():
+    video_id = f"test-progress-{time.time_ns()}"
+    main.update_progress(video_id, 10, "Downloading")
+    yield video_id
+    main.forget_video(video_id)
+
+@pytest.mark.parametrize("if_none_match, etag, expected", [
+    ('W/"5"', 'W/"5"', True),
+    ('"5"', 'W/"5"', True),
+    ('W/"4", W/"5"', 'W/"5"', True),
+    ("*", 'W/"5"', True),
+    ('W/"4"', 'W/"5"', False),
+    ('W/"55"', 'W/"5"', False),
+    (None, 'W/"5"', False),
+    ("", 'W/"5"', False),
+])
+def test_etag_matches(if_none_match, etag, expected):
+    assert etag_matches(if_none_match, etag) == expected
+
+def test_unchanged_progress_is_answered_with_304(client, video_id):
+    first = client.get(f"/api/progress/{video_id}")
+    assert first.status_code == 200
+    assert first.json()["progress"] == 10
+    assert first.headers["cache-control"] == "no-cache"
+    etag = first.headers["etag"]
+
+    again = client.get(f"/api/progress/{video_id}", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    assert again.headers["etag"] == etag
+
+    main.update_progress(video_id, 40, "Detecting beats")
+    changed = client.get(f"/progress/{video_id}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["progress"] == 40
+    assert changed.headers["etag"] != etag
+
+def test_body_is_encoded_once_per_version(client, video_id):
+    client.get(f"/api/progress/{video_id}")
+    version, bodies = main.progress_bodies[video_id]
+    client.get(f"/api/progress/{video_id}")
+    assert main.progress_bodies[video_id][1] is bodies
+
+    main.update_progress(video_id, 50, "Detecting beats")
+    client.get(f"/api/progress/{video_id}")
+    assert main.progress_bodies[video_id][0] > version
+
+def test_long_poll_wakes_on_update(client, video_id):
+    etag = client.get(f"/api/progress/{video_id}").headers["etag"]
+    timer = threading.Timer(0.2, main.update_progress, (video_id, 60, "Separating"))
+    timer.start()
+    start = time.monotonic()
+    response = client.get(f"/api/progress/{video_id}?wait=10", headers={"If-None-Match": etag})
+    timer.join()
+    assert response.status_code == 200
+    assert response.json()["progress"] == 60
+    assert time.monotonic() - start < 5
+
+def test_long_poll_times_out_with_304(client, video_id):
+    etag = client.get(f"/api/progress/{video_id}").headers["etag"]
+    start = time.monotonic()
+    response = client.get(f"/api/progress/{video_id}?wait=0.3", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert 0.25 < time.monotonic() - start < 5
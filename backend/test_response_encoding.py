@@ -0,0 +1,94 @@
+import gzip
+import json
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from fastapi.testclient import TestClient
+
+import response_encoding
+from response_encoding import (CompressionMiddleware, FastJSONResponse, compress, dumps, negotiate_encoding,
+                               COMPRESS_MIN_BYTES)
+
+BIG = {"beats": [i * 0.5 for i in range(2000)]}
+
+@pytest.mark.parametrize("accept_encoding, brotli, expected", [
+    ("gzip, deflate, br", True, "br"),
+    ("gzip, deflate, br", False, "gzip"),
+    ("br;q=0.5, gzip", True, "gzip"),
+    ("br;q=0, gzip;q=0", True, None),
+    ("*", True, "br"),
+    ("*;q=0.1, gzip;q=0", False, None),
+    ("identity", True, None),
+    ("GZIP;q=bad, br", False, None),
+    (None, True, None),
+])
+def test_negotiate_encoding(monkeypatch, accept_encoding, brotli, expected):
+    monkeypatch.setattr(response_encoding, "BROTLI_AVAILABLE", brotli)
+    assert negotiate_encoding(accept_encoding) == expected
+
+def test_compress():
+    body = dumps(BIG)
+    compressed, applied = compress(body, "gzip")
+    assert applied == "gzip" and gzip.decompress(compressed) == body
+    # Same bytes on every call, so cached bodies and ETags stay stable
+    assert compress(body, "gzip")[0] == compressed
+    assert compress(b"{}", "gzip") == (b"{}", None)
+    assert compress(body, None) == (body, None)
+
+def test_compress_brotli():
+    brotli = pytest.importorskip("brotli")
+    body = dumps(BIG)
+    compressed, applied = compress(body, "br")
+    assert applied == "br" and brotli.decompress(compressed) == body
+
+def test_dumps_matches_json():
+    content = {"a": [1, 2.5, None], "b": "ünïcode", "c": {"d": True}}
+    assert json.loads(dumps(content)) == content
+    assert b" " not in dumps(content)
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(response_encoding, "BROTLI_AVAILABLE", False)
+
+    def chunks():
+        yield dumps(BIG)[:COMPRESS_MIN_BYTES]
+        yield dumps(BIG)[COMPRESS_MIN_BYTES:]
+
+    app = Starlette(routes=[
+        Route("/json", lambda request: FastJSONResponse(BIG)),
+        Route("/small", lambda request: FastJSONResponse({"ok": True})),
+        Route("/text", lambda request: PlainTextResponse("x" * 5000)),
+        Route("/encoded", lambda request: Response(gzip.compress(dumps(BIG)), media_type="application/json",
+                                                   headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})),
+        Route("/stream", lambda request: StreamingResponse(chunks(), media_type="application/json")),
+    ])
+    app.add_middleware(CompressionMiddleware)
+    return TestClient(app)
+
+def test_middleware_compresses_json(client):
+    response = client.get("/json", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(dumps(BIG))
+    assert response.json() == BIG
+
+    plain = client.get("/json", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.content == dumps(BIG)
+
+def test_middleware_skips_other_responses(client):
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert small.headers["vary"] == "Accept-Encoding"
+
+    text = client.get("/text", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in text.headers
+
+    encoded = client.get("/encoded", headers={"Accept-Encoding": "gzip"})
+    assert encoded.headers["vary"] == "Accept-Encoding"
+    assert encoded.json() == BIG
+
+    streamed = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in streamed.headers
+    assert streamed.json() == BIG
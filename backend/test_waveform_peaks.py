@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from waveform_peaks import build_peak_pyramid, write_peak_file, read_peak_range, read_peak_amplitude
+
+SR = 8000
+
+@pytest.fixture
+def signal():
+    # 10 s ramp from -1 to 1, so every bucket has a distinct min and max
+    return np.linspace(-1.0, 1.0, 10 * SR, dtype=np.float32)
+
+def decode(meta, data):
+    values = np.frombuffer(data, dtype=f"<i{meta['bits'] // 8}").reshape(-1, 2)
+    return values / np.iinfo(np.int8 if meta["bits"] == 8 else np.int16).max
+
+def test_pyramid_halves_each_level(signal):
+    pyramid = build_peak_pyramid(signal, base_block=64, min_buckets=100)
+
+    assert len(pyramid[0]) == len(signal) // 64
+    for finer, coarser in zip(pyramid, pyramid[1:]):
+        assert len(coarser) == (len(finer) + 1) // 2
+    assert len(pyramid[-1]) <= 100 < len(pyramid[-2])
+    # Every level spans the same extremes
+    for level in pyramid:
+        assert level[:, 0].min() == pytest.approx(-1.0)
+        assert level[:, 1].max() == pytest.approx(1.0)
+
+def test_pyramid_pads_odd_levels():
+    pyramid = build_peak_pyramid(np.array([0.1, -0.2, 0.3, -0.4, 0.5]), base_block=1, min_buckets=1)
+
+    assert [len(level) for level in pyramid] == [5, 3, 2, 1]
+    np.testing.assert_allclose(pyramid[1], [[-0.2, 0.1], [-0.4, 0.3], [0.5, 0.5]])
+    np.testing.assert_allclose(pyramid[-1], [[-0.4, 0.5]])
+
+@pytest.mark.parametrize("bits", [8, 16])
+def test_read_range_round_trip(tmp_path, signal, bits):
+    path = str(tmp_path / "peaks.bin")
+    write_peak_file(path, signal, SR, base_block=64, bits=bits, min_buckets=100)
+    pyramid = build_peak_pyramid(signal, base_block=64, min_buckets=100)
+    tolerance = 1.0 / np.iinfo(np.int8 if bits == 8 else np.int16).max
+
+    # Zoom 0 is the coarsest level, the whole signal by default
+    meta, data = read_peak_range(path)
+    assert (meta["zoom"], meta["max_zoom"], meta["bits"]) == (0, len(pyramid) - 1, bits)
+    assert meta["samples_per_bucket"] == 64 * 2 ** (len(pyramid) - 1)
+    np.testing.assert_allclose(decode(meta, data), pyramid[-1], atol=tolerance)
+
+    # The finest level for 2 s to 3 s
+    meta, data = read_peak_range(path, zoom=meta["max_zoom"], start=2.0, end=3.0)
+    first = int(2.0 * SR / 64)
+    assert meta["start_bucket"] == first
+    assert meta["start_time"] == pytest.approx(2.0, abs=64 / SR)
+    np.testing.assert_allclose(decode(meta, data), pyramid[0][first:first + meta["num_buckets"]], atol=tolerance)
+    assert meta["num_buckets"] == int(np.ceil(3.0 * SR / 64)) - first
+
+def test_read_range_clamps_zoom_and_times(tmp_path, signal):
+    path = str(tmp_path / "peaks.bin")
+    write_peak_file(path, signal, SR, base_block=64, min_buckets=100)
+
+    meta, data = read_peak_range(path, zoom=99, start=-5.0, end=100.0)
+    assert meta["zoom"] == meta["max_zoom"]
+    assert meta["start_bucket"] == 0
+    assert meta["num_buckets"] == len(signal) // 64
+
+    meta, data = read_peak_range(path, start=20.0, end=30.0)
+    assert meta["num_buckets"] == 0 and data == b""
+
+def test_peak_file_errors(tmp_path, signal):
+    with pytest.raises(ValueError):
+        write_peak_file(str(tmp_path / "peaks.bin"), signal, SR, bits=12)
+
+    path = tmp_path / "not-peaks.bin"
+    path.write_bytes(b"RIFF" + bytes(32))
+    with pytest.raises(ValueError):
+        read_peak_range(str(path))
+
+def test_read_peak_amplitude(tmp_path, signal):
+    path = str(tmp_path / "peaks.bin")
+    write_peak_file(path, signal * 0.5, SR, bits=16)
+    assert read_peak_amplitude(path) == pytest.approx(0.5, abs=1e-4)
@@ -0,0 +1,146 @@
+import os
+import logging
+import importlib
+import threading
+from contextlib import contextmanager
+
+# Child of the backend logger, so messages end up in backend.log
+logger = logging.getLogger('backend.thread_budget')
+
+_optional_modules = {}
+
+def optional_module(name):
+    """
+    Import an optional thread-pool library on first use
+
+    torch and numba take seconds to import, so they are only loaded once a
+    job actually needs limiting. Returns None if the library is not installed.
+    """
+    if name not in _optional_modules:
+        try:
+            _optional_modules[name] = importlib.import_module(name)
+        except ImportError:
+            _optional_modules[name] = None
+    return _optional_modules[name]
+
+class CoreSlice:
+    """The share of CPU cores assigned to one job"""
+
+    def __init__(self, index, cores):
+        self.index = index
+        self.cores = cores
+        self.threads = len(cores)
+
+    def ffmpeg_args(self):
+        """Arguments limiting an ffmpeg process to this slice"""
+        return ["-threads", str(self.threads)]
+
+    def __repr__(self):
+        return f"CoreSlice(index={self.index}, cores={self.cores})"
+
+class ThreadBudget:
+    """
+    Splits the machine's cores into equal slices, one per concurrent job.
+
+    A job holds a slice for its whole run; further jobs wait until a slice is
+    free. While a slice is held, numba in the job thread (its thread count is
+    thread-local) is limited to the slice size, and the slice is exposed so
+    ffmpeg and worker pools can be sized to it. The BLAS/OpenMP pools (via
+    threadpoolctl) and torch's intra-op pool are process-wide, so they are
+    limited once, when the first job starts, to the size of the smallest
+    slice and never restored: a job ending must not lift the limit of jobs
+    still running. With pin_cpus, the job thread (and every subprocess it
+    starts) is also pinned to the slice's cores.
+    """
+
+    def __init__(self, max_jobs, total_cores=None, pin_cpus=False, slice_index=None):
+        """
+        Args:
+            max_jobs: Number of jobs that may run concurrently
+            total_cores: Cores to divide (defaults to the cores available to this process)
+            pin_cpus: Pin job threads to their slice's cores (Linux only)
+            slice_index: Hand out only this slice, for one of max_jobs worker
+                processes sharing the machine
+        """
+        if hasattr(os, "sched_getaffinity"):
+            available = sorted(os.sched_getaffinity(0))
+        else:
+            available = list(range(os.cpu_count() or 1))
+        if total_cores:
+            available = available[:total_cores]
+
+        self.max_jobs = max(1, min(max_jobs, len(available)))
+        self.pin_cpus = pin_cpus and hasattr(os, "sched_setaffinity")
+        per_job = len(available) // self.max_jobs
+        self._free = [CoreSlice(i, available[i * per_job:(i + 1) * per_job]) for i in range(self.max_jobs)]
+        if slice_index is not None:
+            self._free = [self._free[slice_index % self.max_jobs]]
+        self._condition = threading.Condition()
+        self._process_threads = min(len(core_slice.cores) for core_slice in self._free)
+        self._process_pools_limited = False
+        self._blas_limits = None
+        logger.info(f"Thread budget: {self.max_jobs} slices of {per_job} cores"
+                    f"{' (pinned)' if self.pin_cpus else ''}")
+
+    @property
+    def threads_per_job(self):
+        return len(self._free[0].cores) if self._free else None
+
+    def _limit_process_pools(self):
+        """Limit the process-wide BLAS/OpenMP and torch pools to the smallest slice, once"""
+        with self._condition:
+            if self._process_pools_limited:
+                return
+            self._process_pools_limited = True
+        torch = optional_module("torch")
+        if torch is not None:
+            torch.set_num_threads(self._process_threads)
+        threadpoolctl = optional_module("threadpoolctl")
+        if threadpoolctl is not None:
+            self._blas_limits = threadpoolctl.threadpool_limits(limits=self._process_threads)
+        logger.info(f"Limited the process-wide thread pools to {self._process_threads} threads")
+
+    def _acquire(self):
+        with self._condition:
+            while not self._free:
+                self._condition.wait()
+            return self._free.pop(0)
+
+    def _release(self, core_slice):
+        with self._condition:
+            self._free.append(core_slice)
+            self._free.sort(key=lambda s: s.index)
+            self._condition.notify()
+
+    @contextmanager
+    def job_slice(self):
+        """
+        Hold a core slice for the duration of the with-block, waiting for one if necessary
+
+        Yields:
+            CoreSlice assigned to the job
+        """
+        core_slice = self._acquire()
+        logger.info(f"Assigned {core_slice} to job on thread {threading.get_ident()}")
+        self._limit_process_pools()
+
+        native_id = threading.get_native_id()
+        previous_affinity = None
+        if self.pin_cpus:
+            previous_affinity = os.sched_getaffinity(native_id)
+            os.sched_setaffinity(native_id, core_slice.cores)
+
+        numba = optional_module("numba")
+        previous_numba_threads = None
+        if numba is not None:
+            previous_numba_threads = numba.get_num_threads()
+            numba.set_num_threads(min(core_slice.threads, numba.config.NUMBA_NUM_THREADS))
+
+        try:
+            yield core_slice
+        finally:
+            if previous_numba_threads is not None:
+                numba.set_num_threads(previous_numba_threads)
+            if previous_affinity is not None:
+                os.sched_setaffinity(native_id, previous_affinity)
+            self._release(core_slice)
@@ -0,0 +1,145 @@
+import os
+import asyncio
+import hashlib
+import logging
+import tempfile
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:
+    # Releases before 0.0.13 only ship the multipart package name
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Child of the backend logger, so messages end up in backend.log
+logger = logging.getLogger('backend.upload_stream')
+
+# Request body bytes handed to the parser per thread hop
+WRITE_BATCH_BYTES = 1024 * 1024
+
+class UploadTooLarge(Exception):
+    """The uploaded file exceeds the size limit"""
+
+class StreamingUpload:
+    """
+    Streams one file field of a multipart/form-data body to disk.
+
+    The body is parsed as it arrives; the file's bytes are written to a
+    temporary file and hashed on the way, so neither the request nor the file
+    is ever held in memory. Parsing and disk writes run in a worker thread in
+    batches of WRITE_BATCH_BYTES to keep the event loop free.
+    """
+
+    def __init__(self, content_type, dest_dir, field_name="file", max_bytes=None):
+        """
+        Args:
+            content_type: Content-Type header of the request, including the boundary
+            dest_dir: Directory for the temporary file (the same filesystem as its final place)
+            field_name: Name of the form field holding the file
+            max_bytes: Size limit of the file, None for no limit
+        """
+        mime_type, params = parse_options_header(content_type or "")
+        if mime_type != b"multipart/form-data" or b"boundary" not in params:
+            raise ValueError("Expected a multipart/form-data request")
+
+        self.dest_dir = dest_dir
+        self.field_name = field_name
+        self.max_bytes = max_bytes
+        self.path = None
+        self.filename = None
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = None
+        self._in_file_part = False
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._parser = MultipartParser(params[b"boundary"], callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", errors="replace")
+        self._in_file_part = name == self.field_name and b"filename" in options and self._file is None
+        if self._in_file_part:
+            self.filename = os.path.basename(options[b"filename"].decode("utf-8", errors="replace"))
+            handle, self.path = tempfile.mkstemp(prefix=".upload-", suffix=".part", dir=self.dest_dir)
+            self._file = os.fdopen(handle, "wb")
+
+    def _on_part_data(self, data, start, end):
+        if not self._in_file_part:
+            return
+        chunk = data[start:end]
+        self.size += len(chunk)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def _on_part_end(self):
+        if self._in_file_part:
+            self._file.close()
+            self._in_file_part = False
+
+    async def consume(self, chunks):
+        """
+        Parse the request body
+
+        Args:
+            chunks: Async iterator over the body, e.g. request.stream()
+
+        Raises:
+            ValueError: If the body holds no file in field_name
+            UploadTooLarge: If the file exceeds max_bytes
+        """
+        try:
+            batch = bytearray()
+            async for chunk in chunks:
+                batch += chunk
+                if len(batch) >= WRITE_BATCH_BYTES:
+                    await asyncio.to_thread(self._parser.write, bytes(batch))
+                    batch.clear()
+            if batch:
+                await asyncio.to_thread(self._parser.write, bytes(batch))
+            self._parser.finalize()
+        except BaseException:
+            self.discard()
+            raise
+        finally:
+            if self._file is not None and not self._file.closed:
+                self._file.close()
+        if self.path is None:
+            raise ValueError(f"No file uploaded in form field '{self.field_name}'")
+        logger.info(f"Received upload {self.filename} ({self.size} bytes, sha256 {self.sha256[:16]})")
+
+    def discard(self):
+        """Remove the temporary file"""
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
@@ -1,44 +1,21 @@
 import os
+import sys
 import json
 import shutil
 import yt_dlp
 import logging
+import argparse
 import subprocess
 from pathlib import Path
-import logging.handlers
+from job_control import JobCancelled, run_killable
+from log_setup import configure_logging, LOG_DIR
 
-# Configure logging - Simplified approach
-LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
-os.makedirs(LOG_DIR, exist_ok=True)
-LOG_FILE = os.path.join(LOG_DIR, "video_downloader.log")
-
-# Create a logger for this module
+# Messages go through the queue-based setup shared by all backend modules. As
+# the download subprocess (see download_video_and_audio_process) this module
+# logs to stderr only; the parent captures it and owns the log files
+configure_logging(log_dir=None if __name__ == "__main__" else LOG_DIR)
 logger = logging.getLogger('video_downloader')
 
-# Check if the logger already has handlers to avoid duplicates
-if not logger.handlers:
-    # Add a file handler
-    file_handler = logging.handlers.RotatingFileHandler(
-        LOG_FILE,
-        maxBytes=10*1024*1024,  # 10MB
-        backupCount=5
-    )
-    file_handler.setLevel(logging.INFO)
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    logger.setLevel(logging.INFO)
-
-# Test write to log file
-try:
-    with open(LOG_FILE, 'a') as f:
-        f.write("Video downloader initialized\n")
-    logger.info("Successfully wrote to video_downloader log file")
-except Exception as e:
-    logger.error(f"Error writing to video_downloader log file: {str(e)}")
-
-logger.info("Video downloader logging initialized")
-
 def check_ffmpeg_installation():
     """Check if FFmpeg is installed and accessible"""
     try:
@@ -47,7 +24,7 @@ def check_ffmpeg_installation():
     except (subprocess.SubprocessError, FileNotFoundError):
         return False
 
-def download_video_and_audio(video_url, output_dir="downloads"):
+def download_video_and_audio(video_url, output_dir="downloads", cancel_token=None, ffmpeg_threads=None, section=None):
     """
     Downloads both video+audio and audio-only files from a given URL,
     naming files by the video ID, and returns the filepaths.
@@ -56,10 +33,26 @@ def download_video_and_audio(video_url, output_dir="downloads"):
     Args:
         video_url (str): URL of the video to download
         output_dir (str): Directory to save downloads
+        cancel_token (CancellationToken, optional): Aborts the download when cancelled
+        ffmpeg_threads (int, optional): Thread limit for the ffmpeg merge/extract steps
+        section (tuple, optional): (start, end) in seconds; only this part of the audio
+            is downloaded, and no video (video_path is None)
         
     Returns:
         dict: Contains video_path, audio_path, video_id, metadata, etc.
+        
+    Raises:
+        JobCancelled: If the token was cancelled during the download
     """
+    # yt-dlp calls progress hooks for every downloaded chunk; raising from the
+    # hook aborts the transfer
+    def cancel_hook(status):
+        if cancel_token:
+            cancel_token.check()
+    
+    # Arguments passed to every ffmpeg postprocessor yt-dlp runs
+    ffmpeg_args = {'ffmpeg': ['-threads', str(ffmpeg_threads)]} if ffmpeg_threads else {}
+    
     # First, check for FFmpeg
     if not check_ffmpeg_installation():
         logger.warning("FFmpeg doesn't appear to be installed or is not in PATH")
@@ -87,46 +80,57 @@ def download_video_and_audio(video_url, output_dir="downloads"):
     # Use video_id for filename
     video_filename = os.path.join(output_dir, f"{video_id}")
     
-    # Try downloading with merging first
-    try:
-        logger.info(f"Downloading video+audio for {video_id}...")
-        video_opts = {
-            'format': 'bestvideo+bestaudio/best',
-            'merge_output_format': 'mp4',
-            'outtmpl': f'{video_filename}.%(ext)s',
-            'quiet': False,
-            'progress': True,
-            'writeinfojson': True,  # Save video metadata
-            'writethumbnail': True,  # Save thumbnail
-        }
-        
-        with yt_dlp.YoutubeDL(video_opts) as ydl:
-            info = ydl.extract_info(video_url, download=True)
-            video_path = f"{video_filename}.{info.get('ext', 'mp4')}"
-    
-    except Exception as e:
-        logger.error(f"Error with merged download: {e}")
-        logger.info("Trying alternative download method...")
-        
-        # Fallback to downloading best available format without merging
+    # A section is analyzed from its audio alone, so its video is not downloaded
+    if not section:
+        # Try downloading with merging first
         try:
-            video_opts_fallback = {
-                'format': 'best',  # Just get best available combined format
-                'outtmpl': f'{video_filename}_fallback.%(ext)s',
+            logger.info(f"Downloading video+audio for {video_id}...")
+            video_opts = {
+                'format': 'bestvideo+bestaudio/best',
+                'merge_output_format': 'mp4',
+                'postprocessor_args': ffmpeg_args,
+                'outtmpl': f'{video_filename}.%(ext)s',
                 'quiet': False,
                 'progress': True,
+                'progress_hooks': [cancel_hook],
                 'writeinfojson': True,  # Save video metadata
                 'writethumbnail': True,  # Save thumbnail
             }
             
-            with yt_dlp.YoutubeDL(video_opts_fallback) as ydl:
+            with yt_dlp.YoutubeDL(video_opts) as ydl:
                 info = ydl.extract_info(video_url, download=True)
-                video_path = f"{video_filename}_fallback.{info.get('ext', 'mp4')}"
-                logger.info(f"Successfully downloaded with fallback method to {video_path}")
+                video_path = f"{video_filename}.{info.get('ext', 'mp4')}"
+        
+        except JobCancelled:
+            raise
+        except Exception as e:
+            if cancel_token and cancel_token.cancelled:
+                raise JobCancelled("Job was cancelled")
+            logger.error(f"Error with merged download: {e}")
+            logger.info("Trying alternative download method...")
+            
+            # Fallback to downloading best available format without merging
+            try:
+                video_opts_fallback = {
+                    'format': 'best',  # Just get best available combined format
+                    'outtmpl': f'{video_filename}_fallback.%(ext)s',
+                    'quiet': False,
+                    'progress': True,
+                    'progress_hooks': [cancel_hook],
+                    'writeinfojson': True,  # Save video metadata
+                    'writethumbnail': True,  # Save thumbnail
+                }
+                
+                with yt_dlp.YoutubeDL(video_opts_fallback) as ydl:
+                    info = ydl.extract_info(video_url, download=True)
+                    video_path = f"{video_filename}_fallback.{info.get('ext', 'mp4')}"
+                    logger.info(f"Successfully downloaded with fallback method to {video_path}")
+            
+            except Exception as fallback_error:
+                if cancel_token and cancel_token.cancelled:
+                    raise JobCancelled("Job was cancelled")
+                logger.error(f"Fallback download also failed: {fallback_error}")
         
-        except Exception as fallback_error:
-            logger.error(f"Fallback download also failed: {fallback_error}")
-    
     # Set up audio-only download options
     # Use video_id for filename
     audio_filename = os.path.join(output_dir, f"{video_id}_audio")
@@ -140,17 +144,29 @@ def download_video_and_audio(video_url, output_dir="downloads"):
                 'preferredcodec': 'wav',
                 'preferredquality': '192',
             }],
+            'postprocessor_args': ffmpeg_args,
             'outtmpl': f'{audio_filename}.%(ext)s',
             'quiet': False,
             'progress': True,
+            'progress_hooks': [cancel_hook],
         }
+        if section:
+            logger.info(f"Downloading audio from {section[0]:.1f}s to {section[1]:.1f}s only")
+            audio_opts['download_ranges'] = yt_dlp.utils.download_range_func(None, [section])
+            # The thumbnail normally comes with the video download
+            audio_opts['writethumbnail'] = True
+            audio_opts['outtmpl'] = {'default': f'{audio_filename}.%(ext)s', 'thumbnail': f'{video_filename}.%(ext)s'}
         
         with yt_dlp.YoutubeDL(audio_opts) as ydl:
             ydl.extract_info(video_url, download=True)
             # Audio path will have the format extension changed by the postprocessor
             audio_path = f"{audio_filename}.wav"
     
+    except JobCancelled:
+        raise
     except Exception as e:
+        if cancel_token and cancel_token.cancelled:
+            raise JobCancelled("Job was cancelled")
         logger.error(f"Error downloading audio: {e}")
         logger.info("Trying alternative audio download method...")
         
@@ -161,7 +177,10 @@ def download_video_and_audio(video_url, output_dir="downloads"):
                 'outtmpl': f'{audio_filename}_fallback.%(ext)s',
                 'quiet': False,
                 'progress': True,
+                'progress_hooks': [cancel_hook],
             }
+            if section:
+                audio_opts_fallback['download_ranges'] = yt_dlp.utils.download_range_func(None, [section])
             
             with yt_dlp.YoutubeDL(audio_opts_fallback) as ydl:
                 info = ydl.extract_info(video_url, download=True)
@@ -169,6 +188,8 @@ def download_video_and_audio(video_url, output_dir="downloads"):
                 logger.info(f"Successfully downloaded audio with fallback method to {audio_path}")
         
         except Exception as fallback_error:
+            if cancel_token and cancel_token.cancelled:
+                raise JobCancelled("Job was cancelled")
             logger.error(f"Fallback audio download also failed: {fallback_error}")
     
     if not video_path or not os.path.exists(video_path):
@@ -209,6 +230,75 @@ def download_video_and_audio(video_url, output_dir="downloads"):
         'duration': metadata.get('duration', 0)
     }
 
+def download_video_and_audio_process(video_url, output_dir="downloads", timeout=None, cancel_token=None,
+                                     ffmpeg_threads=None, section=None):
+    """
+    Run download_video_and_audio in a separate, killable process.
+    
+    A stalled extract_info call or ffmpeg postprocessor cannot be interrupted
+    from a progress hook; here the whole process group, yt-dlp and its ffmpeg
+    children, is killed on timeout or cancellation.
+    
+    Args:
+        video_url (str): URL of the video to download
+        output_dir (str): Directory to save downloads
+        timeout (float, optional): Seconds before the download is killed
+        cancel_token (CancellationToken, optional): Token that kills the download when cancelled
+        ffmpeg_threads (int, optional): Thread limit for the ffmpeg merge/extract steps
+        section (tuple, optional): (start, end) in seconds, see download_video_and_audio
+        
+    Returns:
+        dict: The result of download_video_and_audio
+        
+    Raises:
+        TimeoutError: If the download did not finish in time
+        JobCancelled: If the token was cancelled during the download
+        RuntimeError: If the download process failed
+    """
+    command = [sys.executable, os.path.abspath(__file__), video_url, "--output-dir", output_dir]
+    if ffmpeg_threads:
+        command += ["--ffmpeg-threads", str(ffmpeg_threads)]
+    if section:
+        command += ["--section", str(section[0]), str(section[1])]
+    
+    logger.info(f"Downloading {video_url} in a subprocess")
+    result = run_killable(command, timeout=timeout, cancel_token=cancel_token)
+    if result.returncode != 0:
+        output = result.stderr.decode(errors='replace').strip().splitlines()
+        errors = [line for line in output if line.startswith("ERROR:")] or output[-1:]
+        raise RuntimeError(f"Download process exited with code {result.returncode}: {errors[-1] if errors else ''}")
+    # The result is the last line of the output; yt-dlp's progress comes before it
+    return json.loads(result.stdout.decode(errors='replace').strip().splitlines()[-1])
+
+def expand_playlist(playlist_url, limit=None):
+    """
+    List the videos of a YouTube playlist without downloading them
+    
+    Args:
+        playlist_url: URL of the playlist (or of a video within it)
+        limit: Maximum number of entries to return
+        
+    Returns:
+        List of watch URLs, in playlist order
+    """
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+        'noplaylist': False,
+    }
+    if limit:
+        ydl_opts['playlistend'] = limit
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(playlist_url, download=False)
+    
+    urls = []
+    for entry in info.get('entries') or []:
+        if entry and entry.get('id'):
+            urls.append(f"https://www.youtube.com/watch?v={entry['id']}")
+    logger.info(f"Expanded playlist {playlist_url} to {len(urls)} videos")
+    return urls
+
 # Keep extract_audio_from_video for compatibility, but make it simpler using the new function
 def extract_audio_from_video(video_path, audio_output_path):
     """
@@ -261,4 +351,18 @@ def download_youtube_video(video_url, output_dir):
         return result
     except Exception as e:
         logger.error(f"Error in download_youtube_video: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
+
+if __name__ == "__main__":
+    # Body of download_video_and_audio_process
+    parser = argparse.ArgumentParser(description="Download the video and audio of a URL and print the result as JSON")
+    parser.add_argument("url")
+    parser.add_argument("--output-dir", default="downloads")
+    parser.add_argument("--ffmpeg-threads", type=int, default=None)
+    parser.add_argument("--section", type=float, nargs=2, default=None, metavar=("START", "END"))
+    args = parser.parse_args()
+    result = download_video_and_audio(args.url, args.output_dir, ffmpeg_threads=args.ffmpeg_threads,
+                                      section=tuple(args.section) if args.section else None)
+    # On a line of its own, after whatever yt-dlp left on the current one
+    print()
+    print(json.dumps(result), flush=True)
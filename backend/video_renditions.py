@@ -0,0 +1,185 @@
+import os
+import json
+import shutil
+import logging
+import subprocess
+import numpy as np
+from job_control import run_killable
+
+# Child of the backend logger, so messages end up in backend.log
+logger = logging.getLogger('backend.video_renditions')
+
+# HLS ladder, smallest first. Rungs taller than the source are skipped,
+# except the smallest, which is always produced.
+HLS_LADDER = {
+    "360p": {"height": 360, "video_bitrate": "800k", "maxrate": "856k", "bufsize": "1200k", "audio_bitrate": "96k"},
+    "720p": {"height": 720, "video_bitrate": "2800k", "maxrate": "2996k", "bufsize": "4200k", "audio_bitrate": "128k"},
+}
+
+# Segment length bounds in seconds. Keyframes, and with them segment
+# boundaries, are placed on downbeats (or beats) close to the target, so a
+# seek to the start of a bar or step lands on a segment start.
+SEGMENT_MIN_SECONDS = 1.5
+SEGMENT_TARGET_SECONDS = 2.0
+SEGMENT_MAX_SECONDS = 4.0
+
+# Master playlist name inside the HLS directory
+MASTER_PLAYLIST = "master.m3u8"
+
+# Seconds before ffprobe is killed
+PROBE_TIMEOUT = 60
+
+def plan_keyframes(beats, downbeats, duration, min_seconds=SEGMENT_MIN_SECONDS,
+                   target_seconds=SEGMENT_TARGET_SECONDS, max_seconds=SEGMENT_MAX_SECONDS):
+    """
+    Choose keyframe times on beat boundaries
+
+    From each keyframe, the next one is the downbeat closest to
+    target_seconds later among those min_seconds to max_seconds away; failing
+    that the closest beat, and in passages without beats the target itself.
+
+    Args:
+        beats: Beat times in seconds
+        downbeats: Downbeat times in seconds
+        duration: Length of the video in seconds
+        min_seconds: Minimum distance between keyframes
+        target_seconds: Preferred distance between keyframes
+        max_seconds: Maximum distance between keyframes
+
+    Returns:
+        Sorted list of keyframe times, starting at 0
+    """
+    candidates = [np.sort(np.asarray(times, dtype=np.float64)) for times in (downbeats, beats)]
+    keyframes = [0.0]
+    while keyframes[-1] + max_seconds < duration:
+        last = keyframes[-1]
+        target = last + target_seconds
+        for times in candidates:
+            window = times[np.searchsorted(times, last + min_seconds):np.searchsorted(times, last + max_seconds, side="right")]
+            if len(window):
+                keyframes.append(float(window[np.argmin(np.abs(window - target))]))
+                break
+        else:
+            keyframes.append(target)
+    return keyframes
+
+def probe_video(video_path, cancel_token=None):
+    """
+    Read the video height and whether there is an audio stream with ffprobe
+
+    Args:
+        video_path: Video file to probe
+        cancel_token: Optional CancellationToken that kills ffprobe when cancelled
+
+    Returns:
+        Tuple of (height or None, has_audio)
+
+    Raises:
+        JobCancelled: If the token was cancelled during the probe
+    """
+    command = ["ffprobe", "-v", "error", "-show_entries", "stream=codec_type,height", "-of", "json", video_path]
+    result = run_killable(command, timeout=PROBE_TIMEOUT, cancel_token=cancel_token)
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+    streams = json.loads(result.stdout).get("streams", [])
+    heights = [s["height"] for s in streams if s.get("codec_type") == "video" and s.get("height")]
+    has_audio = any(s.get("codec_type") == "audio" for s in streams)
+    return (heights[0] if heights else None), has_audio
+
+def hls_command(video_path, output_dir, rungs, keyframes, has_audio, threads=None):
+    """Build the single ffmpeg command that encodes every rung of the ladder"""
+    command = ["ffmpeg", "-y", "-v", "error"]
+    if threads:
+        command += ["-threads", str(threads)]
+    command += ["-i", video_path]
+
+    # Decode once and scale to each rung
+    outputs = "".join(f"[v{i}]" for i in range(len(rungs)))
+    filters = [f"[0:v]split={len(rungs)}{outputs}"]
+    for i, name in enumerate(rungs):
+        filters.append(f"[v{i}]scale=-2:'min(ih,{HLS_LADDER[name]['height']})'[v{i}out]")
+    command += ["-filter_complex", ";".join(filters)]
+
+    stream_map = []
+    for i, name in enumerate(rungs):
+        rung = HLS_LADDER[name]
+        command += ["-map", f"[v{i}out]", f"-c:v:{i}", "libx264", f"-b:v:{i}", rung["video_bitrate"],
+                    f"-maxrate:v:{i}", rung["maxrate"], f"-bufsize:v:{i}", rung["bufsize"]]
+        if has_audio:
+            command += ["-map", "0:a:0", f"-c:a:{i}", "aac", f"-b:a:{i}", rung["audio_bitrate"], f"-ac:a:{i}", "2"]
+            stream_map.append(f"v:{i},a:{i},name:{name}")
+        else:
+            stream_map.append(f"v:{i},name:{name}")
+
+    # Keyframes only at the planned times: no scene-cut or interval keyframes
+    # that would split segments off the beat grid
+    command += ["-preset", "veryfast", "-pix_fmt", "yuv420p", "-sc_threshold", "0", "-g", "100000",
+                "-force_key_frames", ",".join(f"{t:.3f}" for t in keyframes)]
+
+    # Every keyframe is at least SEGMENT_MIN_SECONDS after the previous one,
+    # so a shorter hls_time makes each of them start a segment
+    command += ["-f", "hls", "-hls_time", f"{SEGMENT_MIN_SECONDS * 0.5:.2f}", "-hls_playlist_type", "vod",
+                "-hls_segment_type", "fmp4", "-hls_flags", "independent_segments",
+                "-hls_fmp4_init_filename", "init.mp4",
+                "-hls_segment_filename", os.path.join(output_dir, "%v", "seg_%05d.m4s"),
+                "-master_pl_name", MASTER_PLAYLIST, "-var_stream_map", " ".join(stream_map),
+                os.path.join(output_dir, "%v", "index.m3u8")]
+    return command
+
+def encode_hls(video_path, output_dir, beats, downbeats, duration, threads=None, timeout=None, cancel_token=None):
+    """
+    Encode an HLS ladder with keyframes on beat boundaries
+
+    The ladder is written next to output_dir first and moved into place once
+    complete, so players never see a partial playlist.
+
+    Args:
+        video_path: Source video file
+        output_dir: Directory that will hold MASTER_PLAYLIST and one directory per rung
+        beats: Beat times in seconds
+        downbeats: Downbeat times in seconds
+        duration: Length of the video in seconds
+        threads: Thread limit passed to ffmpeg (None lets ffmpeg decide)
+        timeout: Seconds before the encode is abandoned
+        cancel_token: Optional CancellationToken that kills ffmpeg when cancelled
+
+    Returns:
+        Path to the master playlist, or None if encoding failed
+    """
+    try:
+        height, has_audio = probe_video(video_path, cancel_token=cancel_token)
+    except (subprocess.SubprocessError, TimeoutError, OSError, ValueError) as e:
+        logger.error(f"Could not probe {video_path}: {str(e)}")
+        return None
+    if height is None:
+        logger.warning(f"No video stream in {video_path}, skipping HLS")
+        return None
+    names = list(HLS_LADDER)
+    rungs = [names[0]] + [name for name in names[1:] if HLS_LADDER[name]["height"] <= height]
+
+    keyframes = plan_keyframes(beats, downbeats, duration)
+    partial_dir = output_dir.rstrip(os.sep) + ".partial"
+    shutil.rmtree(partial_dir, ignore_errors=True)
+    for name in rungs:
+        os.makedirs(os.path.join(partial_dir, name))
+
+    command = hls_command(video_path, partial_dir, rungs, keyframes, has_audio, threads=threads)
+    logger.info(f"Encoding HLS ladder {rungs} with {len(keyframes)} keyframes for {video_path}")
+    succeeded = False
+    try:
+        result = run_killable(command, timeout=timeout, cancel_token=cancel_token)
+        if result.returncode != 0:
+            logger.error(f"ffmpeg failed to encode HLS for {video_path}: {result.stderr.decode(errors='replace').strip()}")
+            return None
+        succeeded = True
+    except (TimeoutError, OSError) as e:
+        logger.error(f"Error encoding HLS for {video_path}: {str(e)}")
+        return None
+    finally:
+        if not succeeded:
+            shutil.rmtree(partial_dir, ignore_errors=True)
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(partial_dir, output_dir)
+    logger.info(f"HLS ladder ready: {output_dir}")
+    return os.path.join(output_dir, MASTER_PLAYLIST)
@@ -0,0 +1,155 @@
+import struct
+import logging
+import numpy as np
+
+# Child of the beat detector logger, so messages end up in beat_detector.log
+logger = logging.getLogger('beat_detector.waveform_peaks')
+
+# Binary peak file layout (little endian):
+#   header:  magic "PEAK", version (u16), sample rate (u32), samples per bucket
+#            at the finest level (u32), number of levels (u16), bits per value (u8)
+#   index:   number of buckets for each level (u32 each), finest level first
+#   data:    for each level, interleaved (min, max) pairs as int8 or int16
+PEAKS_MAGIC = b"PEAK"
+PEAKS_VERSION = 1
+HEADER_FORMAT = "<4sHIIHB"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Defaults: 256 samples per bucket (~5ms at 48kHz) at the finest level, and
+# halve the resolution per level until the overview fits in ~1000 buckets
+BASE_BLOCK = 256
+MIN_BUCKETS = 1000
+
+def build_peak_pyramid(y, base_block=BASE_BLOCK, min_buckets=MIN_BUCKETS):
+    """
+    Compute a min/max peak pyramid for a signal
+
+    Args:
+        y: Mono audio signal
+        base_block: Number of samples per bucket at the finest level
+        min_buckets: Stop adding coarser levels once a level has fewer buckets than this
+
+    Returns:
+        List of (num_buckets, 2) float arrays of (min, max), finest level first
+    """
+    y = np.asarray(y, dtype=np.float32)
+    num_buckets = max(1, int(np.ceil(len(y) / base_block)))
+    padded = np.zeros(num_buckets * base_block, dtype=np.float32)
+    padded[:len(y)] = y
+    blocks = padded.reshape(num_buckets, base_block)
+
+    level = np.stack([blocks.min(axis=1), blocks.max(axis=1)], axis=1)
+    pyramid = [level]
+    while len(level) > min_buckets:
+        if len(level) % 2:
+            level = np.concatenate([level, level[-1:]])
+        pairs = level.reshape(-1, 2, 2)
+        level = np.stack([pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)], axis=1)
+        pyramid.append(level)
+    return pyramid
+
+def write_peak_file(path, y, sr, base_block=BASE_BLOCK, bits=8, min_buckets=MIN_BUCKETS):
+    """
+    Build the peak pyramid for a signal and write it in the compact binary format
+
+    Args:
+        path: Destination file path
+        y: Mono audio signal (float, nominally in [-1, 1])
+        sr: Sample rate of the signal
+        base_block: Number of samples per bucket at the finest level
+        bits: Quantization of the stored values, 8 or 16
+        min_buckets: Number of buckets at which the coarsest level stops
+
+    Returns:
+        The path that was written
+    """
+    if bits not in (8, 16):
+        raise ValueError(f"Unsupported peak resolution: {bits} bits")
+    dtype = np.int8 if bits == 8 else np.int16
+    scale = np.iinfo(dtype).max
+
+    pyramid = build_peak_pyramid(y, base_block, min_buckets)
+    with open(path, "wb") as f:
+        f.write(struct.pack(HEADER_FORMAT, PEAKS_MAGIC, PEAKS_VERSION, int(sr), base_block, len(pyramid), bits))
+        f.write(struct.pack(f"<{len(pyramid)}I", *[len(level) for level in pyramid]))
+        for level in pyramid:
+            f.write((np.clip(level, -1.0, 1.0) * scale).round().astype(f"<i{bits // 8}").tobytes())
+
+    logger.info(f"Wrote {len(pyramid)}-level peak pyramid ({bits}-bit) to {path}")
+    return path
+
+def read_peak_header(f):
+    """
+    Read the header and level index of an open peak file
+
+    Returns:
+        Dictionary with sample_rate, base_block, bits and the bucket count of each level
+    """
+    magic, version, sr, base_block, num_levels, bits = struct.unpack(HEADER_FORMAT, f.read(HEADER_SIZE))
+    if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+        raise ValueError("Not a supported peak file")
+    level_sizes = list(struct.unpack(f"<{num_levels}I", f.read(4 * num_levels)))
+    return {
+        "sample_rate": sr,
+        "base_block": base_block,
+        "bits": bits,
+        "level_sizes": level_sizes,
+    }
+
+def read_peak_range(path, zoom=0, start=0.0, end=None):
+    """
+    Read the peaks for a time range at a given zoom level without loading the whole file
+
+    Args:
+        path: Peak file path
+        zoom: Zoom level, 0 is the coarsest overview and each step doubles the resolution
+        start: Start of the range in seconds
+        end: End of the range in seconds (None reads to the end)
+
+    Returns:
+        Tuple of (metadata dict, raw interleaved min/max bytes)
+    """
+    with open(path, "rb") as f:
+        header = read_peak_header(f)
+        level_sizes = header["level_sizes"]
+        num_levels = len(level_sizes)
+        level = num_levels - 1 - min(max(int(zoom), 0), num_levels - 1)
+
+        bytes_per_bucket = 2 * header["bits"] // 8
+        samples_per_bucket = header["base_block"] * 2 ** level
+        seconds_per_bucket = samples_per_bucket / header["sample_rate"]
+
+        first = min(max(int(start / seconds_per_bucket), 0), level_sizes[level])
+        last = level_sizes[level] if end is None else int(np.ceil(end / seconds_per_bucket))
+        last = min(max(last, first), level_sizes[level])
+
+        offset = HEADER_SIZE + 4 * num_levels + sum(level_sizes[:level]) * bytes_per_bucket
+        f.seek(offset + first * bytes_per_bucket)
+        data = f.read((last - first) * bytes_per_bucket)
+
+    return {
+        "sample_rate": header["sample_rate"],
+        "bits": header["bits"],
+        "zoom": num_levels - 1 - level,
+        "max_zoom": num_levels - 1,
+        "samples_per_bucket": samples_per_bucket,
+        "start_bucket": first,
+        "num_buckets": last - first,
+        "start_time": first * seconds_per_bucket,
+    }, data
+
+def read_peak_amplitude(path):
+    """
+    Peak absolute amplitude of a signal, read from the coarsest level of its peak file
+
+    Returns:
+        Peak amplitude as a float in [0, 1] (quantized to the file resolution)
+    """
+    with open(path, "rb") as f:
+        header = read_peak_header(f)
+        level_sizes = header["level_sizes"]
+        bytes_per_bucket = 2 * header["bits"] // 8
+        f.seek(HEADER_SIZE + 4 * len(level_sizes) + sum(level_sizes[:-1]) * bytes_per_bucket)
+        data = np.frombuffer(f.read(level_sizes[-1] * bytes_per_bucket), dtype=f"<i{header['bits'] // 8}")
+    scale = np.iinfo(np.int8 if header["bits"] == 8 else np.int16).max
+    return float(np.abs(data.astype(np.int32)).max(initial=0)) / scale
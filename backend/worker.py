@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Analysis worker processes for the durable job queue.
+
+Usage: python worker.py [--processes 2] [--queue path/to/jobs.sqlite3]
+
+Starts the given number of worker processes, each claiming jobs from the
+queue the API writes to (main.JOB_QUEUE_PATH by default) and running them
+through the same pipeline as the API's in-process queue, on its own slice
+of the machine's cores. Processes that die are restarted; their jobs run
+again once their lease expires. Run it on every node that shares the
+queue file, or let the API start it (main.LOCAL_WORKER_PROCESSES).
+"""
+import os
+import sys
+import time
+import signal
+import logging
+import argparse
+import multiprocessing
+from log_setup import configure_logging
+
+# Child of the backend logger; worker processes write backend-worker-<index>.log
+logger = logging.getLogger('backend.worker')
+
+# Seconds between checks of the worker processes
+SUPERVISE_INTERVAL = 2.0
+
+def outcome(progress_info):
+    """Final queue state and error of a job from its last progress record"""
+    data = progress_info.get("data") or {}
+    if data.get("cancelled"):
+        return "cancelled", None
+    if data.get("error") or not progress_info.get("completed"):
+        return "failed", data.get("error", "Job ended without a result")
+    return "completed", None
+
+def run_worker_process(index, processes, queue_path, supervisor_pid):
+    """Body of one worker process: claim jobs and run them on this process' core slice"""
+    # Before main, whose import would open the API's log files
+    configure_logging(process_name=f"worker-{index}")
+    import main
+    from durable_queue import QueueWorker, default_worker_id
+    from job_queue import AnalysisJob, AnalysisQueue
+    from thread_budget import ThreadBudget
+
+    queue = main.open_durable_queue(queue_path)
+
+    def publish_progress(video_id, record):
+        # A job whose lease went to another worker no longer speaks for its video
+        if video_id not in worker.lost_video_ids:
+            queue.publish_progress(video_id, record)
+    main.progress_publisher = publish_progress
+    main.thread_budget = ThreadBudget(processes, pin_cpus=main.PIN_JOB_CPUS, slice_index=index)
+
+    def run_and_finish(job):
+        try:
+            main.run_queued_job(job)
+        finally:
+            job.done(*outcome(main.video_progress.get(job.video_id, {})))
+
+    # The next job downloads while the current one is analyzed, as in the API's in-process queue
+    stages = AnalysisQueue(main.prefetch_job_media, run_and_finish, download_workers=1, analysis_workers=1, prefetch=1,
+                           aging_rate=main.JOB_AGING_RATE)
+
+    def start_job(row, cancel_token, done):
+        job = AnalysisJob(row["video_id"], row["url"], cancel_token, profile=bool(row["profile"]),
+                          batch_id=row["batch_id"], source_path=row["source_path"],
+                          estimated_seconds=row["estimated_seconds"], submitted_at=row["created_at"],
+                          window=(row["window_start"], row["window_end"]) if row["window_end"] is not None else None)
+        job.done = done
+        main.job_tokens[job.video_id] = cancel_token
+        stages.submit(job)
+
+    # One job downloading and one analyzing; claiming more would hold leases idle that
+    # another worker could start on
+    worker = QueueWorker(queue, start_job, capacity=2, worker_id=f"{default_worker_id()}/{index}",
+                         heartbeat_seconds=main.WORKER_HEARTBEAT_SECONDS, parent_pid=supervisor_pid,
+                         metrics=main.metrics.snapshot)
+    # Load the models before claiming, so the first job does not pay for them; the API's
+    # /api/ready reports ready once any worker is
+    worker.set_status("warming_up")
+    main.warm_up()
+    worker.set_status("ready" if main.readiness["ready"] else "failed",
+                      warmup_seconds=main.readiness["warmup_seconds"], error=main.readiness["error"])
+    worker.run()
+
+def start_process(context, index, processes, queue_path):
+    process = context.Process(target=run_worker_process, name=f"worker-{index}",
+                              args=(index, processes, queue_path, os.getpid()))
+    process.start()
+    logger.info(f"Started worker process {index} (pid {process.pid})")
+    return process
+
+def supervise(processes, queue_path, parent_pid=None):
+    """Run the worker processes, restarting any that exit, until stopped or the parent exits"""
+    context = multiprocessing.get_context("spawn")
+    workers = [start_process(context, i, processes, queue_path) for i in range(processes)]
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    try:
+        while not stopping and (parent_pid is None or os.getppid() == parent_pid):
+            time.sleep(SUPERVISE_INTERVAL)
+            for i, process in enumerate(workers):
+                if not process.is_alive():
+                    logger.warning(f"Worker process {i} exited with code {process.exitcode}, restarting it")
+                    workers[i] = start_process(context, i, processes, queue_path)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Jobs of killed workers are retried elsewhere once their leases expire
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join(timeout=10)
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    configure_logging(process_name="supervisor")
+    import main
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=main.MAX_CONCURRENT_JOBS,
+                        help=f"Worker processes on this node (default: {main.MAX_CONCURRENT_JOBS})")
+    parser.add_argument("--queue", default=main.JOB_QUEUE_PATH, help="Queue database (default: main.JOB_QUEUE_PATH)")
+    parser.add_argument("--parent-pid", type=int, default=None, help="Exit when this process is gone")
+    args = parser.parse_args()
+    supervise(max(1, args.processes), args.queue, args.parent_pid)
@@ -9,6 +9,7 @@ import YouTube, { YouTubeEvent, YouTubePlayer } from 'react-youtube';
 import styled, { createGlobalStyle } from 'styled-components';
 import TimelineEditor from './components/TimelineEditor';
 import CustomVideoPlayer from './components/CustomVideoPlayer';
+import PeakWaveform from './components/PeakWaveform';
 import { API_URL, getApiPath } from './config';
 
 // Type definitions
@@ -67,6 +68,35 @@ const loadFromLocalStorage = (key: string, defaultValue: any = null) => {
   }
 };
 
+// Audio tracks are published as /static/<id>/<track>.wav; /api/audio/<id>/<track> serves the
+// same track as Opus, AAC or WAV, whichever the browser's Accept header prefers
+const negotiatedAudioUrl = (apiBase: string, staticUrl?: string) => {
+  if (!staticUrl) return '';
+  const match = staticUrl.match(/^\/static\/([^/]+)\/([^/]+)\.wav$/);
+  return match ? `${apiBase}/api/audio/${match[1]}/${match[2]}` : `${apiBase}${staticUrl}`;
+};
+
+// The click tracks come from /api/mix, which mixes the stored stems and the clicks on request
+// and serves them as Opus, AAC or WAV by the Accept header; results without click_mix_url
+// fall back to their pre-rendered tracks
+const clickTrackUrls = (apiBase: string, data: any) => {
+  if (!data.click_mix_url) {
+    return {
+      audioWithClicks: negotiatedAudioUrl(apiBase, data.audio_with_clicks_url),
+      harmonicWithClicks: negotiatedAudioUrl(apiBase, data.harmonic_audio_url),
+      percussiveWithClicks: negotiatedAudioUrl(apiBase, data.percussive_audio_url),
+      clicksOnly: negotiatedAudioUrl(apiBase, data.clicks_only_url),
+    };
+  }
+  const mixUrl = `${apiBase}${data.click_mix_url}`;
+  return {
+    audioWithClicks: `${mixUrl}?mix=1&clicks=1`,
+    harmonicWithClicks: `${mixUrl}?mix=0&harmonic=1&clicks=1`,
+    percussiveWithClicks: `${mixUrl}?mix=0&percussive=1&clicks=1`,
+    clicksOnly: `${mixUrl}?mix=0&clicks=1`,
+  };
+};
+
 // Get version info from environment variables
 const appVersion = import.meta.env.VITE_APP_VERSION || '0.1.0';
 const isDevelopment = import.meta.env.DEV;
@@ -710,6 +740,7 @@ function App() {
   
   // Visualization data
   const [waveformImage, setWaveformImage] = useState<string>(loadFromLocalStorage('waveformImage', ''));
+  const [waveformPeaksUrl, setWaveformPeaksUrl] = useState<string>(loadFromLocalStorage('waveformPeaksUrl', ''));
   const [isDummyData, setIsDummyData] = useState<boolean>(loadFromLocalStorage('isDummyData', false));
   
   // Beat detection data
@@ -730,6 +761,9 @@ function App() {
   const fadeInRef = useRef<HTMLDivElement>(null);
   const [currentPlaybackTime, setCurrentPlaybackTime] = useState<number>(0);
   const [videoUrl, setVideoUrl] = useState<string>(loadFromLocalStorage('videoUrl', ''));
+  const [hlsUrl, setHlsUrl] = useState<string>(loadFromLocalStorage('hlsUrl', ''));
+  const [sourceVideoId, setSourceVideoId] = useState<string>(loadFromLocalStorage('sourceVideoId', ''));
+  const [videoWindow, setVideoWindow] = useState<{start: number; end: number} | null>(loadFromLocalStorage('videoWindow', null));
   const [playbackRate, setPlaybackRate] = useState<number>(loadFromLocalStorage('playbackRate', 1));
   const [isSpeedControlExpanded, setIsSpeedControlExpanded] = useState<boolean>(false);
 
@@ -812,16 +846,18 @@ function App() {
     if (percussiveOriginalUrl) saveToLocalStorage('percussiveOriginalUrl', percussiveOriginalUrl);
     if (clicksOnlyUrl) saveToLocalStorage('clicksOnlyUrl', clicksOnlyUrl);
     if (waveformImage) saveToLocalStorage('waveformImage', waveformImage);
+    if (waveformPeaksUrl) saveToLocalStorage('waveformPeaksUrl', waveformPeaksUrl);
     saveToLocalStorage('isDummyData', isDummyData);
     if (beats.length > 0) saveToLocalStorage('beats', beats);
     if (downbeats.length > 0) saveToLocalStorage('downbeats', downbeats);
     if (videoDuration > 0) saveToLocalStorage('videoDuration', videoDuration);
     if (videoUrl) saveToLocalStorage('videoUrl', videoUrl);
+    if (hlsUrl) saveToLocalStorage('hlsUrl', hlsUrl);
     if (playbackRate !== 1) saveToLocalStorage('playbackRate', playbackRate);
   }, [
     videoId, audioWithClicksUrl, harmonicWithClicksUrl, percussiveWithClicksUrl,
-    harmonicOriginalUrl, percussiveOriginalUrl, clicksOnlyUrl, waveformImage, isDummyData, beats, downbeats, videoDuration,
-    videoUrl, playbackRate
+    harmonicOriginalUrl, percussiveOriginalUrl, clicksOnlyUrl, waveformImage, waveformPeaksUrl, isDummyData, beats, downbeats, videoDuration,
+    videoUrl, hlsUrl, playbackRate
   ]);
 
   /**
@@ -947,16 +983,32 @@ function App() {
             saveToLocalStorage('videoUrl', '');
           }
           
+          // Prefer the beat-aligned HLS ladder where the browser plays HLS natively
+          const nextHlsUrl = data.video_url && data.hls_url ? `${API_URL}${data.hls_url}` : '';
+          setHlsUrl(nextHlsUrl);
+          saveToLocalStorage('hlsUrl', nextHlsUrl);
+          
+          // Window results are stored under a synthetic ID; the YouTube player embeds the source video
+          setSourceVideoId(data.sourceVideoId || '');
+          saveToLocalStorage('sourceVideoId', data.sourceVideoId || '');
+          setVideoWindow(data.window || null);
+          saveToLocalStorage('videoWindow', data.window || null);
+          
           // Set audio file URLs
-          setAudioWithClicksUrl(data.audio_with_clicks_url ? `${API_URL}${data.audio_with_clicks_url}` : '');
-          setHarmonicWithClicksUrl(data.harmonic_audio_url ? `${API_URL}${data.harmonic_audio_url}` : '');
-          setPercussiveWithClicksUrl(data.percussive_audio_url ? `${API_URL}${data.percussive_audio_url}` : '');
-          setHarmonicOriginalUrl(data.harmonic_original_url ? `${API_URL}${data.harmonic_original_url}` : '');
-          setPercussiveOriginalUrl(data.percussive_original_url ? `${API_URL}${data.percussive_original_url}` : '');
-          setClicksOnlyUrl(data.clicks_only_url ? `${API_URL}${data.clicks_only_url}` : '');
+          const clickTracks = clickTrackUrls(API_URL, data);
+          setAudioWithClicksUrl(clickTracks.audioWithClicks);
+          setHarmonicWithClicksUrl(clickTracks.harmonicWithClicks);
+          setPercussiveWithClicksUrl(clickTracks.percussiveWithClicks);
+          setHarmonicOriginalUrl(negotiatedAudioUrl(API_URL, data.harmonic_original_url));
+          setPercussiveOriginalUrl(negotiatedAudioUrl(API_URL, data.percussive_original_url));
+          setClicksOnlyUrl(clickTracks.clicksOnly);
           
-          // Handle waveform image
-          if (data.waveform_image) {
+          // The waveform is drawn from the peak pyramid; older results only have the image
+          // (served as a cacheable file, or inline base64)
+          setWaveformPeaksUrl(data.waveform_peaks_url ? `${API_URL}${data.waveform_peaks_url}` : '');
+          if (data.waveform_image_url) {
+            setWaveformImage(`${API_URL}${data.waveform_image_url}`);
+          } else if (data.waveform_image) {
             if (data.waveform_image.startsWith('data:image')) {
               setWaveformImage(data.waveform_image);
             } else {
@@ -1090,16 +1142,32 @@ function App() {
             saveToLocalStorage('videoUrl', '');
           }
           
+          // Prefer the beat-aligned HLS ladder where the browser plays HLS natively
+          const nextHlsUrl = data.video_url && data.hls_url ? `${apiUrl}${data.hls_url}` : '';
+          setHlsUrl(nextHlsUrl);
+          saveToLocalStorage('hlsUrl', nextHlsUrl);
+          
+          // Window results are stored under a synthetic ID; the YouTube player embeds the source video
+          setSourceVideoId(data.sourceVideoId || '');
+          saveToLocalStorage('sourceVideoId', data.sourceVideoId || '');
+          setVideoWindow(data.window || null);
+          saveToLocalStorage('videoWindow', data.window || null);
+          
           // Set audio file URLs with custom API URL
-          setAudioWithClicksUrl(data.audio_with_clicks_url ? `${apiUrl}${data.audio_with_clicks_url}` : '');
-          setHarmonicWithClicksUrl(data.harmonic_audio_url ? `${apiUrl}${data.harmonic_audio_url}` : '');
-          setPercussiveWithClicksUrl(data.percussive_audio_url ? `${apiUrl}${data.percussive_audio_url}` : '');
-          setHarmonicOriginalUrl(data.harmonic_original_url ? `${apiUrl}${data.harmonic_original_url}` : '');
-          setPercussiveOriginalUrl(data.percussive_original_url ? `${apiUrl}${data.percussive_original_url}` : '');
-          setClicksOnlyUrl(data.clicks_only_url ? `${apiUrl}${data.clicks_only_url}` : '');
+          const clickTracks = clickTrackUrls(apiUrl, data);
+          setAudioWithClicksUrl(clickTracks.audioWithClicks);
+          setHarmonicWithClicksUrl(clickTracks.harmonicWithClicks);
+          setPercussiveWithClicksUrl(clickTracks.percussiveWithClicks);
+          setHarmonicOriginalUrl(negotiatedAudioUrl(apiUrl, data.harmonic_original_url));
+          setPercussiveOriginalUrl(negotiatedAudioUrl(apiUrl, data.percussive_original_url));
+          setClicksOnlyUrl(clickTracks.clicksOnly);
           
-          // Handle waveform image
-          if (data.waveform_image) {
+          // The waveform is drawn from the peak pyramid; older results only have the image
+          // (served as a cacheable file, or inline base64)
+          setWaveformPeaksUrl(data.waveform_peaks_url ? `${apiUrl}${data.waveform_peaks_url}` : '');
+          if (data.waveform_image_url) {
+            setWaveformImage(`${apiUrl}${data.waveform_image_url}`);
+          } else if (data.waveform_image) {
             if (data.waveform_image.startsWith('data:image')) {
               setWaveformImage(data.waveform_image);
             } else {
@@ -1433,8 +1501,11 @@ function App() {
     if (data.duration) setVideoDuration(data.duration);
     if (data.beats) setBeats(data.beats);
     if (data.downbeats) setDownbeats(data.downbeats);
-    if (data.audio_with_clicks_url) setAudioWithClicksUrl(`${apiUrl}${data.audio_with_clicks_url}`);
-    if (data.waveform_image) setWaveformImage(data.waveform_image);
+    const clickTracks = clickTrackUrls(apiUrl, data);
+    if (clickTracks.audioWithClicks) setAudioWithClicksUrl(clickTracks.audioWithClicks);
+    setWaveformPeaksUrl(data.waveform_peaks_url ? `${apiUrl}${data.waveform_peaks_url}` : '');
+    if (data.waveform_image_url) setWaveformImage(`${apiUrl}${data.waveform_image_url}`);
+    else if (data.waveform_image) setWaveformImage(data.waveform_image);
     
     // Set video URL if available
     if (data.video_url) {
@@ -1447,6 +1518,17 @@ function App() {
       saveToLocalStorage('videoUrl', '');
     }
     
+    // Prefer the beat-aligned HLS ladder where the browser plays HLS natively
+    const nextHlsUrl = data.video_url && data.hls_url ? `${apiUrl}${data.hls_url}` : '';
+    setHlsUrl(nextHlsUrl);
+    saveToLocalStorage('hlsUrl', nextHlsUrl);
+    
+    // Window results are stored under a synthetic ID; the YouTube player embeds the source video
+    setSourceVideoId(data.sourceVideoId || '');
+    saveToLocalStorage('sourceVideoId', data.sourceVideoId || '');
+    setVideoWindow(data.window || null);
+    saveToLocalStorage('videoWindow', data.window || null);
+    
     // No automatic navigation to steps since we're not setting steps automatically
     // Instead, user will generate and navigate to steps via the timeline editor
     
@@ -1655,7 +1737,7 @@ function App() {
     [
       'videoId', 'currentStep', 'steps', 'audioWithClicksUrl', 
       'harmonicWithClicksUrl', 'percussiveWithClicksUrl', 'harmonicOriginalUrl', 
-      'percussiveOriginalUrl', 'clicksOnlyUrl', 'waveformImage', 
+      'percussiveOriginalUrl', 'clicksOnlyUrl', 'waveformImage', 'waveformPeaksUrl',
       'isDummyData', 'beats', 'downbeats', 'videoDuration', 'videoUrl'
     ].forEach(key => localStorage.removeItem(key));
     
@@ -1670,11 +1752,15 @@ function App() {
     setPercussiveOriginalUrl('');
     setClicksOnlyUrl('');
     setWaveformImage('');
+    setWaveformPeaksUrl('');
     setIsDummyData(false);
     setBeats([]);
     setDownbeats([]);
     setVideoDuration(0);
     setVideoUrl('');
+    setHlsUrl('');
+    setSourceVideoId('');
+    setVideoWindow(null);
   };
 
   // Initialize app state by clearing any preloaded or cached steps
@@ -1792,8 +1878,11 @@ function App() {
               {/* Video player */}
               <VideoContainer>
                 <CustomVideoPlayer 
-                  videoId={videoId}
+                  videoId={sourceVideoId || videoId}
                   videoUrl={videoUrl}
+                  hlsUrl={hlsUrl}
+                  windowStart={videoWindow?.start}
+                  windowEnd={videoWindow?.end}
                   onReady={handleVideoReady}
                   onStateChange={handleCustomPlayerStateChange}
                   onTimeUpdate={handleTimeUpdate}
@@ -1936,10 +2025,32 @@ function App() {
                 </div>
               )}
               
+              {/* Waveform with beat markers, drawn from the peak pyramid (older results: the image) */}
+              {(waveformPeaksUrl || waveformImage) && videoDuration > 0 && (
+                <AudioVisualizationSection>
+                  <h3>Waveform</h3>
+                  <WaveformContainer>
+                    {waveformPeaksUrl ? (
+                      <PeakWaveform
+                        peaksUrl={waveformPeaksUrl}
+                        startTime={videoWindow ? videoWindow.start : 0}
+                        endTime={videoDuration}
+                        beats={beats}
+                        downbeats={downbeats}
+                        currentTime={currentPlaybackTime}
+                        onSeek={(time) => player && player.seekTo(time, true)}
+                      />
+                    ) : (
+                      <WaveformImage src={waveformImage} alt="Waveform with beat markers" />
+                    )}
+                  </WaveformContainer>
+                </AudioVisualizationSection>
+              )}
+              
               {/* Timeline editor for advanced editing */}
               {beats.length > 0 && videoDuration > 0 && (
                 <TimelineEditor
-                  videoId={videoId}
+                  videoId={sourceVideoId || videoId}
                   duration={videoDuration}
                   beats={beats}
                   downbeats={downbeats}
@@ -4,6 +4,9 @@ import styled from 'styled-components';
 interface CustomVideoPlayerProps {
   videoId: string;
   videoUrl?: string;
+  hlsUrl?: string;
+  windowStart?: number;  // Analyzed window of the video, played by the YouTube fallback
+  windowEnd?: number;
   onReady?: (player: HTMLVideoElement) => void;
   onStateChange?: (isPlaying: boolean) => void;
   onTimeUpdate?: (currentTime: number) => void;
@@ -328,6 +331,9 @@ const LoopFeedback = styled.div`
 const CustomVideoPlayer: React.FC<CustomVideoPlayerProps> = ({
   videoId,
   videoUrl,
+  hlsUrl,
+  windowStart,
+  windowEnd,
   onReady,
   onStateChange,
   onTimeUpdate,
@@ -438,13 +444,13 @@ const CustomVideoPlayer: React.FC<CustomVideoPlayerProps> = ({
     }
   }, [videoRef, onReady, onTimeUpdate, isLooping, currentStep, steps, playbackRate, onNextStep, onStateChange]);
   
-  // Update video source when videoUrl changes
+  // Update video source when videoUrl or hlsUrl changes
   useEffect(() => {
     if (videoRef.current && videoUrl) {
       videoRef.current.load();
       setIsLoading(true);
     }
-  }, [videoUrl]);
+  }, [videoUrl, hlsUrl]);
   
   // Handle play/pause
   const togglePlayPause = () => {
@@ -591,13 +597,17 @@ const CustomVideoPlayer: React.FC<CustomVideoPlayerProps> = ({
             if (onStateChange) onStateChange(false);
           }}
         >
+          {/* Browsers without native HLS skip this source and play the MP4 */}
+          {hlsUrl && <source src={hlsUrl} type="application/vnd.apple.mpegurl" />}
           <source src={videoUrl} type="video/mp4" />
           Your browser does not support the video tag.
         </VideoElement>
       ) : (
         <IframeContainer>
           <StyledIframe 
-            src={`https://www.youtube.com/embed/${videoId}?enablejsapi=1&origin=${window.location.origin}`}
+            src={`https://www.youtube.com/embed/${videoId}?enablejsapi=1&origin=${window.location.origin}`
+              + (windowStart ? `&start=${Math.floor(windowStart)}` : '')
+              + (windowEnd ? `&end=${Math.ceil(windowEnd)}` : '')}
             frameBorder="0"
             allow="accelerometer; autoplay; clipboard-write; encrypted-media; gyroscope; picture-in-picture"
             allowFullScreen
@@ -0,0 +1,223 @@
+import React, { useState, useRef, useEffect } from 'react';
+import styled from 'styled-components';
+
+interface PeakWaveformProps {
+  peaksUrl: string;  // /api/waveform/<id> of the analysis
+  startTime: number;  // Video time the analyzed audio starts at (the window start)
+  endTime: number;
+  beats: number[];
+  downbeats: number[];
+  currentTime?: number;
+  onSeek?: (time: number) => void;
+}
+
+// Peaks of one stem for a time range, as served by /api/waveform
+interface PeakRange {
+  values: number[];  // Interleaved (min, max) pairs, scaled to [-1, 1]
+  startTime: number;
+  bucketSeconds: number;
+}
+
+// Level of detail the pyramid is read at, relative to the zoom 0 overview
+interface PeakScale {
+  samplesPerBucket: number;
+  sampleRate: number;
+  maxZoom: number;
+}
+
+const STEMS = [
+  { name: 'mix', label: 'Mix', color: '#1DB954' },
+  { name: 'harmonic', label: 'Harmonic', color: '#2E77D0' },
+  { name: 'percussive', label: 'Percussive', color: '#E65C00' },
+];
+
+const ROW_HEIGHT = 80;
+
+const WaveformWrapper = styled.div`
+  position: relative;
+  width: 100%;
+`;
+
+const WaveformCanvas = styled.canvas`
+  width: 100%;
+  height: ${STEMS.length * ROW_HEIGHT}px;
+  display: block;
+  cursor: pointer;
+`;
+
+const ZoomControls = styled.div`
+  display: flex;
+  justify-content: flex-end;
+  gap: 8px;
+  margin-bottom: 6px;
+  color: rgba(255, 255, 255, 0.7);
+  font-size: 0.85rem;
+  align-items: center;
+`;
+
+const ZoomButton = styled.button`
+  background: rgba(29, 185, 84, 0.2);
+  color: white;
+  border: 1px solid rgba(29, 185, 84, 0.5);
+  border-radius: 4px;
+  padding: 2px 10px;
+  cursor: pointer;
+
+  &:disabled {
+    opacity: 0.4;
+    cursor: default;
+  }
+`;
+
+const parsePeaks = (buffer: ArrayBuffer, bits: number) => {
+  const view = new DataView(buffer);
+  const values: number[] = [];
+  if (bits === 16) {
+    for (let i = 0; i + 1 < buffer.byteLength; i += 2) values.push(view.getInt16(i, true) / 32767);
+  } else {
+    for (let i = 0; i < buffer.byteLength; i++) values.push(view.getInt8(i) / 127);
+  }
+  return values;
+};
+
+/**
+ * Waveform of the mix and both stems drawn from the server's peak pyramid.
+ * Each zoom step halves the visible span and reads the level of the pyramid
+ * that has about one bucket per pixel, so zooming stays instant.
+ */
+const PeakWaveform: React.FC<PeakWaveformProps> = ({
+  peaksUrl,
+  startTime,
+  endTime,
+  beats,
+  downbeats,
+  currentTime = 0,
+  onSeek
+}) => {
+  const canvasRef = useRef<HTMLCanvasElement>(null);
+  const [viewZoom, setViewZoom] = useState(0);
+  const [scale, setScale] = useState<PeakScale | null>(null);
+  const [peaks, setPeaks] = useState<Record<string, PeakRange>>({});
+
+  // The visible span follows the playhead once zoomed in
+  const span = (endTime - startTime) / Math.pow(2, viewZoom);
+  const viewStart = viewZoom === 0
+    ? startTime
+    : Math.min(Math.max(currentTime - span / 2, startTime), endTime - span);
+  const viewEnd = viewStart + span;
+  // Refetch when the view moves by a quarter of its span, not on every playhead tick
+  const viewKey = viewZoom === 0 ? 0 : Math.floor((viewStart - startTime) / (span / 4));
+
+  useEffect(() => {
+    const controller = new AbortController();
+    const width = canvasRef.current?.clientWidth || 1000;
+
+    const fetchStem = async (stem: string, zoom: number) => {
+      const response = await fetch(`${peaksUrl}?stem=${stem}&zoom=${zoom}&start=${viewStart}&end=${viewEnd}`,
+                                   { signal: controller.signal });
+      if (!response.ok) throw new Error(`Waveform peaks request failed: ${response.status}`);
+      const header = (name: string) => Number(response.headers.get(name));
+      const sampleRate = header('X-Peaks-Sample-Rate');
+      const samplesPerBucket = header('X-Peaks-Samples-Per-Bucket');
+      return {
+        scale: { samplesPerBucket: samplesPerBucket * Math.pow(2, header('X-Peaks-Zoom')), sampleRate,
+                 maxZoom: header('X-Peaks-Max-Zoom') },
+        range: {
+          values: parsePeaks(await response.arrayBuffer(), header('X-Peaks-Bits')),
+          startTime: header('X-Peaks-Start-Time'),
+          bucketSeconds: samplesPerBucket / sampleRate,
+        },
+      };
+    };
+
+    const load = async () => {
+      // About one bucket per pixel; the overview's bucket size comes from the first response
+      let zoom = 0;
+      if (scale) {
+        const wanted = (span * scale.sampleRate) / width;
+        zoom = Math.min(Math.max(Math.round(Math.log2(scale.samplesPerBucket / wanted)), 0), scale.maxZoom);
+      }
+      const results = await Promise.all(STEMS.map(stem => fetchStem(stem.name, zoom).catch(() => null)));
+      const next: Record<string, PeakRange> = {};
+      results.forEach((result, i) => {
+        if (result) next[STEMS[i].name] = result.range;
+      });
+      if (!scale && results[0]) setScale(results[0].scale);
+      setPeaks(next);
+    };
+
+    load().catch(error => {
+      if (error.name !== 'AbortError') console.error('Error loading waveform peaks:', error);
+    });
+    return () => controller.abort();
+  // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [peaksUrl, viewZoom, viewKey, scale]);
+
+  useEffect(() => {
+    const canvas = canvasRef.current;
+    if (!canvas) return;
+    const width = canvas.clientWidth;
+    const height = canvas.clientHeight;
+    canvas.width = width * window.devicePixelRatio;
+    canvas.height = height * window.devicePixelRatio;
+    const ctx = canvas.getContext('2d');
+    if (!ctx) return;
+    ctx.scale(window.devicePixelRatio, window.devicePixelRatio);
+    ctx.clearRect(0, 0, width, height);
+
+    const toX = (time: number) => ((time - viewStart) / (viewEnd - viewStart)) * width;
+
+    STEMS.forEach((stem, row) => {
+      const range = peaks[stem.name];
+      const middle = row * ROW_HEIGHT + ROW_HEIGHT / 2;
+      ctx.fillStyle = 'rgba(255, 255, 255, 0.6)';
+      ctx.font = '11px sans-serif';
+      ctx.fillText(stem.label, 4, row * ROW_HEIGHT + 12);
+      if (!range) return;
+      ctx.fillStyle = stem.color;
+      const barWidth = Math.max((range.bucketSeconds / (viewEnd - viewStart)) * width, 1);
+      for (let i = 0; i + 1 < range.values.length; i += 2) {
+        const x = toX(range.startTime + (i / 2) * range.bucketSeconds);
+        if (x < 0 || x > width) continue;
+        const top = middle - range.values[i + 1] * (ROW_HEIGHT / 2 - 2);
+        const bottom = middle - range.values[i] * (ROW_HEIGHT / 2 - 2);
+        ctx.fillRect(x, top, barWidth, Math.max(bottom - top, 1));
+      }
+    });
+
+    const drawMarkers = (times: number[], color: string, lineWidth: number) => {
+      ctx.strokeStyle = color;
+      ctx.lineWidth = lineWidth;
+      times.forEach(time => {
+        const x = toX(time);
+        if (x < 0 || x > width) return;
+        ctx.beginPath();
+        ctx.moveTo(x, 0);
+        ctx.lineTo(x, height);
+        ctx.stroke();
+      });
+    };
+    drawMarkers(beats, 'rgba(255, 0, 0, 0.4)', 1);
+    drawMarkers(downbeats, 'rgba(255, 215, 0, 0.7)', 1.5);
+    drawMarkers([currentTime], '#FFFFFF', 2);
+  }, [peaks, beats, downbeats, currentTime, viewStart, viewEnd]);
+
+  const handleClick = (event: React.MouseEvent<HTMLCanvasElement>) => {
+    if (!onSeek || !canvasRef.current) return;
+    const rect = canvasRef.current.getBoundingClientRect();
+    onSeek(viewStart + ((event.clientX - rect.left) / rect.width) * (viewEnd - viewStart));
+  };
+
+  return (
+    <WaveformWrapper>
+      <ZoomControls>
+        <span>Zoom {Math.pow(2, viewZoom)}x</span>
+        <ZoomButton onClick={() => setViewZoom(viewZoom - 1)} disabled={viewZoom === 0}>−</ZoomButton>
+        <ZoomButton onClick={() => setViewZoom(viewZoom + 1)} disabled={!scale || viewZoom >= scale.maxZoom}>+</ZoomButton>
+      </ZoomControls>
+      <WaveformCanvas ref={canvasRef} onClick={handleClick} />
+    </WaveformWrapper>
+  );
+};
+
+export default PeakWaveform;